@@ -12,6 +12,9 @@ from mcp.client.streamable_http import streamablehttp_client
 # AgentCore Identityからアクセストークンを取得する
 from bedrock_agentcore.identity.auth import requires_access_token
 
+from agents.config.mcp_client_factory import create_mcp_client, is_replay_mode
+from agents.runtime.phase_timer import phase
+
 logger = logging.getLogger("agent_graph")
 logger.setLevel(logging.INFO)
 logging.basicConfig(
@@ -191,11 +194,17 @@ class GatewayIdentityConfig:
             MCPClient: 認証済みMCPクライアントインスタンス
         """
 
+        # カセット再生時は実際のGatewayへ接続しないため認証を省略
+        if is_replay_mode():
+            logger.info("📼 カセット再生モード: アクセストークン取得を省略")
+            return create_mcp_client("gateway", lambda: None)
+
         # ステップ1: AgentCore Identityを使用してアクセストークンを取得
         logger.info("ステップ1: AgentCore Identity経由でアクセストークンを取得中...")
         logger.info(f"Runtimeが自動的にruntimeUserIdを渡します")
         
-        access_token = await self.get_access_token()
+        with phase("fetch_access_token"):
+            access_token = await self.get_access_token()
         
         # ステップ2: 認証されたMCPクライアントを作成
         logger.info("ステップ2: 認証されたMCPクライアントを作成中...")
@@ -217,7 +226,7 @@ class GatewayIdentityConfig:
             return transport
         
         # 認証されたトランスポートでMCPクライアントを作成
-        mcp_client = MCPClient(create_streamable_http_transport)
+        mcp_client = create_mcp_client("gateway", create_streamable_http_transport)
         
         return mcp_client
     
@@ -234,5 +243,13 @@ class GatewayIdentityConfig:
         Returns:
             list: 利用可能なツールの完全なリスト
         """
-        tools_list = client.list_tools_sync()
-        return list(tools_list)
\ No newline at end of file
+        tools: list = []
+        pagination_token = None
+        with phase("list_tools.gateway"):
+            while True:
+                page = client.list_tools_sync(pagination_token=pagination_token)
+                tools.extend(page)
+                pagination_token = getattr(page, "pagination_token", None)
+                if not pagination_token:
+                    break
+        return tools
\ No newline at end of file
@@ -1,10 +1,13 @@
 from mcp import stdio_client, StdioServerParameters
 from strands.tools.mcp import MCPClient
+import asyncio
 import logging
 import os
 from boto3.session import Session
 from typing import Optional
 
+from agents.config.mcp_client_factory import create_mcp_client, is_replay_mode, lazy_sessions
+
 log = logging.getLogger("mcp_config")
 
 _boto_session = Session()
@@ -26,29 +29,42 @@ class LocalMCPConfig:
         if self.aurora_db_user == "":
             raise ValueError("AURORA_DSQL_DATABASE_USER is not set")
         
+    def _server_parameters(self) -> StdioServerParameters:
+        """Aurora DSQL MCPサーバー(uvx)の起動パラメータを返す。"""
+        return StdioServerParameters(
+            command="uvx",
+            args=[
+                "awslabs.aurora-dsql-mcp-server@latest",
+                "--cluster_endpoint", self.aurora_endpoint,
+                "--database_user", self.aurora_db_user,
+                "--allow-writes",
+                "--region", self.aurora_region
+            ],
+            env={
+                "FASTMCP_LOG_LEVEL": "ERROR"
+            },
+        )
+
+    @staticmethod
+    def _validate(client: MCPClient) -> None:
+        with client:
+            client.list_tools_sync()
+
     async def build_client(self) -> MCPClient:
         if self._client:
             return self._client
+
+        # カセット再生時は uvx を起動しない
+        if is_replay_mode():
+            self._client = create_mcp_client("dsql", lambda: None)
+            return self._client
         
-        local_mcp_client = MCPClient(lambda: stdio_client(
-            StdioServerParameters(
-                command="uvx",
-                args=[
-                    "awslabs.aurora-dsql-mcp-server@latest",
-                    "--cluster_endpoint", self.aurora_endpoint,
-                    "--database_user", self.aurora_db_user,
-                    "--allow-writes",
-                    "--region", self.aurora_region
-                ],
-                env={
-                    "FASTMCP_LOG_LEVEL": "ERROR"
-                },
-            )
-        ))
+        server_parameters = self._server_parameters()
+        local_mcp_client = create_mcp_client("dsql", lambda: stdio_client(server_parameters))
         
-        # 接続確認
-        with local_mcp_client:
-            tools = local_mcp_client.list_tools_sync()
+        # 接続確認（uvx によるサーバー起動を含む）。遅延接続時は最初の利用時に確認される
+        if not lazy_sessions():
+            await asyncio.to_thread(self._validate, local_mcp_client)
 
         self._client = local_mcp_client
         return self._client
@@ -0,0 +1,77 @@
+"""
+MCPClient の生成を一元化するファクトリ。
+
+各MCP設定クラス（Gateway / Remote / Local）はここを通して MCPClient を作る。
+エンドポイント名（gateway / firecrawl / dsql）ごとに共通のミドルウェアを組み込み、
+カセット再生モードではトランスポートを使わない ReplayMCPClient を返す。
+
+環境変数:
+- MCP_LAZY_SESSIONS: true(既定) ならセッションは最初のツール利用時に開く（接続確認も省略する）
+- MCP_CONNECT_TIMEOUT_SECONDS[_GATEWAY|_FIRECRAWL|_DSQL]: 認証とセッション確立のタイムアウト（既定 30）
+"""
+from __future__ import annotations
+
+import os
+from typing import Any, Callable, List
+
+from strands.tools.mcp import MCPClient
+
+from agents.middleware.cassette import CassetteRecorder, ReplayMCPClient, cassette_mode
+from agents.middleware.compaction import ToolResultCompactor, compaction_enabled
+from agents.middleware.mcp_middleware import MCPToolMiddleware, MiddlewareMCPClient
+from agents.middleware.rate_limit import RateLimitMiddleware, rate_limit_enabled
+from agents.middleware.resilience import ResilienceMiddleware, resilience_enabled
+from agents.runtime.deadline import DeadlineMiddleware
+from agents.runtime.phase_timer import ToolTimingMiddleware, current_timer
+
+
+def is_replay_mode() -> bool:
+    """カセット再生モードか（認証や接続確認を省略してよいか）。"""
+    return cassette_mode() == "replay"
+
+
+def lazy_sessions() -> bool:
+    """MCPセッションを最初のツール利用時に開くか（True なら事前の接続確認は行わない）。"""
+    return os.environ.get("MCP_LAZY_SESSIONS", "true").lower() != "false"
+
+
+def connect_timeout(endpoint: str) -> float:
+    return float(os.environ.get(
+        f"MCP_CONNECT_TIMEOUT_SECONDS_{endpoint.upper()}", os.environ.get("MCP_CONNECT_TIMEOUT_SECONDS", "30")
+    ))
+
+
+def create_mcp_client(endpoint: str, transport_callable: Callable[[], Any]) -> MCPClient:
+    """エンドポイント名に応じたミドルウェア付き MCPClient を返す。
+
+    ミドルウェアの並び（外側 → MCPセッション側）:
+      ツール呼び出し計測 → 締め切り → レート制限 → タイムアウト・リトライ・ブレーカー → 結果コンパクション → カセット録音
+    （計測は待ち・リトライを含めた時間。締め切りはレート制限の待ちとリトライも含めて打ち切る。
+      レート制限の待ちはタイムアウトに数えない。
+      カセットには試行ごとの生の結果が残り、再生時もコンパクションが効く）
+    """
+    middlewares: List[MCPToolMiddleware] = []
+    timer = current_timer()
+    if timer is not None:
+        middlewares.append(ToolTimingMiddleware(timer))
+    # 締め切りは呼び出し時のコンテキストから読む（締め切りがなければ何もしない）
+    middlewares.append(DeadlineMiddleware())
+    if rate_limit_enabled():
+        middlewares.append(RateLimitMiddleware())
+    if resilience_enabled():
+        middlewares.append(ResilienceMiddleware(endpoint))
+    if compaction_enabled():
+        middlewares.append(ToolResultCompactor())
+
+    if is_replay_mode():
+        return ReplayMCPClient(endpoint, middlewares=middlewares)
+
+    if cassette_mode() == "record":
+        middlewares.append(CassetteRecorder(endpoint))
+    return MiddlewareMCPClient(
+        transport_callable,
+        endpoint=endpoint,
+        middlewares=middlewares,
+        lazy=lazy_sessions(),
+        startup_timeout=int(connect_timeout(endpoint)),
+    )
@@ -1,5 +1,6 @@
 from __future__ import annotations
 from typing import Optional
+import asyncio
 import logging
 
 from bedrock_agentcore.identity.auth import requires_api_key
@@ -7,6 +8,9 @@ from strands.tools.mcp import MCPClient
 from mcp.client.sse import sse_client
 from mcp.client.streamable_http import streamablehttp_client
 
+from agents.config.mcp_client_factory import create_mcp_client, is_replay_mode, lazy_sessions
+from agents.runtime.phase_timer import phase
+
 # --- sse/connection 警告を抑制（ログフィルタ）-------------------------------
 class SuppressSSEConnectionFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
@@ -53,12 +57,14 @@ class RemoteMCPConfig:
         http_path_template: Optional[str] = None,
         sse_path_template: Optional[str] = None,
         validate_on_connect: bool = True,
+        endpoint_name: str = "firecrawl",
     ):
         self.provider_name = provider_name
         self.base_url = (base_url or "").rstrip("/")
         self.http_path_template = http_path_template
         self.sse_path_template = sse_path_template
         self.validate_on_connect = validate_on_connect
+        self.endpoint_name = endpoint_name
         self._client: Optional[MCPClient] = None
 
     def _fetcher(self):
@@ -98,32 +104,42 @@ class RemoteMCPConfig:
         path = self.sse_path_template.replace("{API_KEY}", api_key or "")
         return f"{self.base_url}{path}"
 
+    @staticmethod
+    def _validate(client: MCPClient) -> None:
+        with client:
+            client.list_tools_sync()
+
     # ---- クライアント構築（HTTP/SSE を自動選択）----------------------------
     async def build_client(self) -> MCPClient:
         if self._client:
             return self._client
 
+        # カセット再生時は API キー取得・接続確認を行わない
+        if is_replay_mode():
+            self._client = create_mcp_client(self.endpoint_name, lambda: None)
+            return self._client
+
         use_sse = self.sse_path_template is not None
         # {API_KEY} を含むテンプレートがある場合のみキー取得
         needs_key = False
         template = self.sse_path_template if use_sse else (self.http_path_template or "")
         if "{API_KEY}" in (template or ""):
             needs_key = True
-        api_key = await self._get_api_key(needs_key)
+        with phase("fetch_api_key", endpoint=self.endpoint_name):
+            api_key = await self._get_api_key(needs_key)
 
         if use_sse:
             url = self._compose_sse_url(api_key)
             log.info(f"[MCP] Use SSE endpoint: {self.base_url}/... (masked)")
-            client = MCPClient(lambda: sse_client(url))
+            client = create_mcp_client(self.endpoint_name, lambda: sse_client(url))
         else:
             url = self._compose_http_url(api_key)
             log.info(f"[MCP] Use HTTP endpoint: {self.base_url}/... (masked)")
-            client = MCPClient(lambda: streamablehttp_client(url))
+            client = create_mcp_client(self.endpoint_name, lambda: streamablehttp_client(url))
 
-        if self.validate_on_connect:
-            # 早期に接続確認（tools 列挙）
-            with client:
-                _ = client.list_tools_sync()
+        if self.validate_on_connect and not lazy_sessions():
+            # 早期に接続確認（tools 列挙）。遅延接続時は最初の利用時に確認される
+            await asyncio.to_thread(self._validate, client)
 
         self._client = client
         return self._client
\ No newline at end of file
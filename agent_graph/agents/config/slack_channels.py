@@ -0,0 +1,80 @@
+"""
+収集対象のSlackチャンネル設定。
+
+環境変数:
+- SLACK_CHANNELS: カンマ区切りのチャンネルID、またはチャンネル名のパターン（glob、例 "output-*"）
+- SLACK_CHANNEL: 単一チャンネル（SLACK_CHANNELS が未設定の場合）
+
+チャンネル名のパターンは slack___conversationsList でIDに解決する（参加しているチャンネルのみ）。
+"""
+from __future__ import annotations
+
+import fnmatch
+import json
+import logging
+import os
+import re
+import uuid
+from typing import Any, Dict, List
+
+from strands.tools.mcp import MCPClient
+
+from agents.middleware.mcp_middleware import tool_result_text
+
+log = logging.getLogger("slack_channels")
+
+CONVERSATIONS_LIST_TOOL = "slack___conversationsList"
+_CHANNEL_ID = re.compile(r"^[CGD][A-Z0-9]{6,}$")
+
+
+def configured_channel_specs() -> List[str]:
+    """環境変数からチャンネル指定（IDまたはパターン）のリストを得る。"""
+    raw = os.environ.get("SLACK_CHANNELS", "").strip() or os.environ.get("SLACK_CHANNEL", "").strip()
+    return [spec.strip().lstrip("#") for spec in raw.split(",") if spec.strip()]
+
+
+def is_multi_channel(specs: List[str]) -> bool:
+    return len(specs) > 1 or any(not _CHANNEL_ID.match(spec) for spec in specs)
+
+
+async def _list_channels(mcp_client: MCPClient) -> List[Dict[str, Any]]:
+    channels: List[Dict[str, Any]] = []
+    cursor = None
+    while True:
+        arguments: Dict[str, Any] = {"limit": 200}
+        if cursor:
+            arguments["cursor"] = cursor
+        result = await mcp_client.call_tool_async(
+            tool_use_id=f"channels-{uuid.uuid4().hex[:12]}",
+            name=CONVERSATIONS_LIST_TOOL,
+            arguments=arguments,
+        )
+        text = tool_result_text(result)
+        if result.get("status") == "error":
+            raise RuntimeError(f"チャンネル一覧を取得できません: {text[:200]}")
+        payload = json.loads(text)
+        channels.extend(payload.get("channels", []))
+        cursor = (payload.get("response_metadata") or {}).get("next_cursor")
+        if not cursor:
+            return channels
+
+
+async def resolve_channels(mcp_client: MCPClient, specs: List[str]) -> List[str]:
+    """チャンネル指定をチャンネルIDのリストに解決する（順序を保ち重複を除く）。"""
+    ids = [spec for spec in specs if _CHANNEL_ID.match(spec)]
+    patterns = [spec for spec in specs if not _CHANNEL_ID.match(spec)]
+    if patterns:
+        channels = await _list_channels(mcp_client)
+        for pattern in patterns:
+            matched = [
+                c["id"] for c in channels
+                if c.get("is_member", True) and fnmatch.fnmatch(c.get("name", ""), pattern)
+            ]
+            if not matched:
+                log.warning(f"⚠️ パターンに一致するチャンネルがありません: {pattern}")
+            ids.extend(matched)
+    resolved = list(dict.fromkeys(ids))
+    if not resolved:
+        raise ValueError("環境変数にSlackチャンネルIDを設定してください（SLACK_CHANNELS または SLACK_CHANNEL）")
+    log.info(f"📡 収集対象チャンネル: {resolved}")
+    return resolved
@@ -0,0 +1,128 @@
+"""
+エージェントごとのツール許可リスト（ツールスキーマの削減）。
+
+MCPセッションが列挙したツールカタログから、各エージェントが実際に使うツールだけを選ぶ。
+モデルには毎ターン全ツールのスキーマが送られるため、不要なツールを渡さないことで
+入力トークンと初回トークンまでのレイテンシを削減する。
+
+環境変数:
+- SLACK_AGENT_TOOLS / FIRECRAWL_AGENT_TOOLS: カンマ区切りの許可リスト（glob可）で既定値を上書き
+- TOOL_DESCRIPTION_MAX_CHARS: ツール説明・引数説明の最大文字数（0 または未設定で切り詰めない）
+"""
+from __future__ import annotations
+
+import copy
+import fnmatch
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from agents.config.gateway_identity_config import _filter_tools_by_keyword, _get_tool_name
+
+log = logging.getLogger("tool_catalog")
+
+# エージェント名 → 許可するツール名（glob可）
+AGENT_TOOL_ALLOWLISTS: Dict[str, List[str]] = {
+    "SlackAgent": [
+        "slack___conversationsHistory",
+        "slack___usersList",
+    ],
+    "FirecrawlAgent": [
+        "firecrawl_scrape",
+        "transact",
+        "readonly_query",
+    ],
+}
+
+# 許可リストの上書き用環境変数
+_ALLOWLIST_ENV = {
+    "SlackAgent": "SLACK_AGENT_TOOLS",
+    "FirecrawlAgent": "FIRECRAWL_AGENT_TOOLS",
+}
+
+
+def get_allowlist(agent_name: str) -> List[str]:
+    env_name = _ALLOWLIST_ENV.get(agent_name)
+    override = os.environ.get(env_name, "") if env_name else ""
+    if override.strip():
+        return [name.strip() for name in override.split(",") if name.strip()]
+    return AGENT_TOOL_ALLOWLISTS.get(agent_name, [])
+
+
+def _trim_text(text: Optional[str], max_chars: int) -> Optional[str]:
+    if not text or len(text) <= max_chars:
+        return text
+    return text[: max_chars - 1].rstrip() + "…"
+
+
+def _trim_schema(schema: Any, max_chars: int) -> Any:
+    """JSON Schema 内の description を再帰的に切り詰める。"""
+    if isinstance(schema, dict):
+        return {
+            k: _trim_text(v, max_chars) if k == "description" and isinstance(v, str) else _trim_schema(v, max_chars)
+            for k, v in schema.items()
+        }
+    if isinstance(schema, list):
+        return [_trim_schema(v, max_chars) for v in schema]
+    return schema
+
+
+def trim_tool_descriptions(tools: List[Any], max_chars: int) -> List[Any]:
+    """説明文と引数スキーマの説明を max_chars 文字に切り詰めた MCPAgentTool の複製を返す。
+
+    ツール定義はプロセス共通のツール一覧キャッシュ（mcp_middleware.py）で他のエージェント・リクエストと共有しているため、
+    元のオブジェクトは変更しない。
+    """
+    trimmed = []
+    for tool in tools:
+        mcp_tool = getattr(tool, "mcp_tool", None)
+        if mcp_tool is None:
+            trimmed.append(tool)
+            continue
+        tool = copy.copy(tool)
+        tool.mcp_tool = mcp_tool.model_copy(update={
+            "description": _trim_text(mcp_tool.description, max_chars),
+            "inputSchema": _trim_schema(mcp_tool.inputSchema, max_chars),
+        })
+        trimmed.append(tool)
+    return trimmed
+
+
+def _schema_size(tools: List[Any]) -> int:
+    size = 0
+    for tool in tools:
+        try:
+            size += len(json.dumps(tool.tool_spec, ensure_ascii=False))
+        except Exception:
+            continue
+    return size
+
+
+def resolve_agent_tools(agent_name: str, tools: List[Any], fallback_keyword: Optional[str] = None) -> List[Any]:
+    """ツールカタログからエージェントの許可リストに一致するツールだけを返す。
+
+    許可リストに一致するツールが1つも無い場合は fallback_keyword で絞り込む
+    （全ツールを渡すことはしない）。
+    """
+    allowlist = get_allowlist(agent_name)
+    selected = [t for t in tools if any(fnmatch.fnmatchcase(_get_tool_name(t), p) for p in allowlist)]
+
+    missing = [p for p in allowlist if not any(fnmatch.fnmatchcase(_get_tool_name(t), p) for t in tools)]
+    if missing:
+        log.warning(f"{agent_name}: 許可リストのツールがカタログにありません: {missing}")
+
+    if not selected and fallback_keyword:
+        selected = _filter_tools_by_keyword(tools, fallback_keyword)
+        log.warning(f"{agent_name}: 許可リストに一致するツールが無いため '{fallback_keyword}' で絞り込みます")
+
+    catalog_size = _schema_size(tools)
+    max_chars = int(os.environ.get("TOOL_DESCRIPTION_MAX_CHARS", "0") or 0)
+    if max_chars > 0:
+        selected = trim_tool_descriptions(selected, max_chars)
+
+    log.info(
+        f"{agent_name}: ツール {len(tools)} → {len(selected)} 件 "
+        f"(スキーマ {catalog_size:,} → {_schema_size(selected):,} 文字)"
+    )
+    return selected
@@ -0,0 +1,214 @@
+"""
+MCPツール通信の録音/再生（カセット）。
+
+- 録音: CassetteRecorder をミドルウェアとして挿入し、ツール一覧・呼び出し引数・結果・所要時間を
+  gzip圧縮のJSON Linesに追記する（1クライアント=1ファイル）。
+- 再生: ReplayMCPClient は実際のMCPセッションを開かず、カセットから結果を返す。
+  time_scale=1.0 で録音時と同じ待ち時間、0 で待ち時間なし、0.1 なら10倍速。
+
+環境変数:
+- MCP_CASSETTE_MODE: off(既定) / record / replay
+- MCP_CASSETTE_DIR: カセットの保存先（既定 ./cassettes）
+- MCP_CASSETTE_NAME: カセット名（既定 default）→ <DIR>/<NAME>/<endpoint>-*.jsonl.gz
+- MCP_CASSETTE_TIME_SCALE: 再生時の待ち時間の倍率（既定 1.0）
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from mcp.types import Tool
+from strands.tools.mcp import MCPAgentTool
+from strands.tools.mcp.mcp_types import MCPToolResult
+from strands.types.collections import PaginatedList
+
+from agents.middleware.mcp_middleware import MCPToolMiddleware, MiddlewareMCPClient, ToolCall, ToolCallHandler, error_result
+
+log = logging.getLogger("mcp_cassette")
+
+CASSETTE_VERSION = 1
+
+
+def cassette_mode() -> str:
+    return os.environ.get("MCP_CASSETTE_MODE", "off").lower()
+
+
+def cassette_path() -> Path:
+    return Path(os.environ.get("MCP_CASSETTE_DIR", "cassettes")) / os.environ.get("MCP_CASSETTE_NAME", "default")
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode("ascii")}
+    raise TypeError(f"JSONにできない値: {type(value)}")
+
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if set(obj) == {"__bytes__"}:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+
+def _call_key(name: str, arguments: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+    return name, json.dumps(arguments or {}, sort_keys=True, ensure_ascii=False, default=str)
+
+
+# ==== 録音 ======================================================================
+class CassetteRecorder(MCPToolMiddleware):
+    """ツール通信をカセットファイルへ追記するミドルウェア。"""
+
+    def __init__(self, endpoint: str, directory: Optional[Path] = None):
+        directory = directory or cassette_path()
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f"{endpoint}-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.jsonl.gz"
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._write({"type": "header", "version": CASSETTE_VERSION, "endpoint": endpoint,
+                     "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z")})
+        log.info(f"📼 MCPカセット録音開始: {self.path}")
+
+    def _offset_ms(self) -> float:
+        return round((time.monotonic() - self._started) * 1000, 1)
+
+    def _write(self, event: Dict[str, Any]) -> None:
+        line = json.dumps(event, ensure_ascii=False, default=_encode) + "\n"
+        with self._lock:
+            # gzipはメンバーの連結を許すため、追記でもそのまま読み出せる
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line)
+
+    def on_tools_listed(self, endpoint: str, tools: list) -> None:
+        self._write({
+            "type": "list_tools",
+            "offset_ms": self._offset_ms(),
+            "tools": [t.mcp_tool.model_dump(mode="json", exclude_none=True) for t in tools],
+        })
+
+    async def __call__(self, call: ToolCall, call_next: ToolCallHandler) -> MCPToolResult:
+        offset = self._offset_ms()
+        started = time.perf_counter()
+        result = await call_next(call)
+        self._write({
+            "type": "call",
+            "offset_ms": offset,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "name": call.name,
+            "arguments": call.arguments,
+            "result": result,
+        })
+        return result
+
+
+# ==== 再生 ======================================================================
+class Cassette:
+    """エンドポイント単位で読み込んだカセットの内容。"""
+
+    def __init__(self, endpoint: str, tools: List[Dict[str, Any]], calls: List[Dict[str, Any]]):
+        self.endpoint = endpoint
+        self.tools = tools
+        self._by_key: Dict[Tuple[str, str], Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._by_name: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._lock = threading.Lock()
+        for event in calls:
+            self._by_key[_call_key(event["name"], event.get("arguments"))].append(event)
+            self._by_name[event["name"]].append(event)
+
+    @classmethod
+    def load(cls, endpoint: str, directory: Optional[Path] = None) -> "Cassette":
+        directory = directory or cassette_path()
+        files = sorted(directory.glob(f"{endpoint}-*.jsonl.gz"))
+        if not files:
+            raise FileNotFoundError(f"カセットが見つかりません: {directory}/{endpoint}-*.jsonl.gz")
+        tools: List[Dict[str, Any]] = []
+        calls: List[Dict[str, Any]] = []
+        for path in files:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    event = json.loads(line, object_hook=_decode)
+                    if event["type"] == "list_tools" and not tools:
+                        tools = event["tools"]
+                    elif event["type"] == "call":
+                        calls.append(event)
+        log.info(f"📼 MCPカセット読み込み: endpoint={endpoint} files={len(files)} calls={len(calls)}")
+        return cls(endpoint, tools, calls)
+
+    def take(self, name: str, arguments: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """引数まで一致する記録を優先し、なければ同名ツールの記録を順に返す。"""
+        with self._lock:
+            exact = self._by_key.get(_call_key(name, arguments))
+            event = exact.popleft() if exact else None
+            if event is not None:
+                self._by_name[name].remove(event)
+                return event
+            by_name = self._by_name.get(name)
+            if by_name:
+                event = by_name.popleft()
+                self._by_key[_call_key(name, event.get("arguments"))].remove(event)
+                return event
+            return None
+
+
+class ReplayMCPClient(MiddlewareMCPClient):
+    """カセットから応答する MCPClient。MCPセッションは開かない。"""
+
+    def __init__(self, endpoint: str, cassette: Optional[Cassette] = None,
+                 time_scale: Optional[float] = None, middlewares: Optional[List[MCPToolMiddleware]] = None):
+        super().__init__(self._no_transport, endpoint=endpoint, middlewares=middlewares)
+        self.cassette = cassette or Cassette.load(endpoint)
+        self.time_scale = time_scale if time_scale is not None else float(
+            os.environ.get("MCP_CASSETTE_TIME_SCALE", "1.0")
+        )
+
+    @staticmethod
+    def _no_transport() -> Any:
+        raise RuntimeError("ReplayMCPClient はトランスポートを使用しません")
+
+    def start(self) -> "ReplayMCPClient":
+        return self
+
+    def stop(self, *args: Any, **kwargs: Any) -> None:
+        for middleware in self.middlewares:
+            middleware.close()
+
+    def list_tools_sync(self, *args: Any, **kwargs: Any) -> PaginatedList[MCPAgentTool]:
+        tools = PaginatedList([MCPAgentTool(Tool.model_validate(t), self) for t in self.cassette.tools])
+        for middleware in self.middlewares:
+            middleware.on_tools_listed(self.endpoint, list(tools))
+        return tools
+
+    @staticmethod
+    def _cancelled(call: ToolCall) -> MCPToolResult:
+        # MCPClient の取り消し時と同じ形（cancelled=True のエラー結果）で返す
+        return {**error_result(call.tool_use_id, "Tool execution cancelled"), "cancelled": True}
+
+    async def _call_upstream(self, call: ToolCall) -> MCPToolResult:
+        if call.cancel_signal is not None and call.cancel_signal.is_set():
+            return self._cancelled(call)
+        event = self.cassette.take(call.name, call.arguments)
+        if event is None:
+            return error_result(call.tool_use_id, f"カセットに記録がありません: {call.name}")
+        delay = event.get("duration_ms", 0) / 1000.0 * self.time_scale
+        if delay > 0:
+            if call.cancel_signal is None:
+                await asyncio.sleep(delay)
+            else:
+                # 記録した所要時間を待つ間も取り消しを受け付ける
+                loop = asyncio.get_running_loop()
+                until = loop.time() + delay
+                while loop.time() < until:
+                    if call.cancel_signal.is_set():
+                        return self._cancelled(call)
+                    await asyncio.sleep(min(0.05, until - loop.time()))
+        result = dict(event["result"])
+        result["toolUseId"] = call.tool_use_id
+        return result
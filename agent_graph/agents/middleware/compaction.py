@@ -0,0 +1,234 @@
+"""
+MCPツール結果のコンパクション（LLM入力トークン削減）。
+
+MCPClient のツール結果をエージェントへ渡す前に、必要なフィールドだけに絞り込む。
+
+- slack___conversationsHistory / conversationsReplies: メッセージを user / ts / text / subtype に射影
+  （blocks・attachments・reactions 等は捨てる。ページングの cursor は残す）
+- Slack の ok:false 応答（error の理由）は射影せずそのまま返す
+- slack___usersList: id / name / real_name / display_name / email に射影
+- firecrawl_scrape: ナビゲーション・画像・フッター等のページ装飾を除去し、
+  本文Markdownをトークン予算内に切り詰める
+
+環境変数:
+- TOOL_RESULT_COMPACTION: true(既定) / false
+- FIRECRAWL_MAX_PAGE_TOKENS: スクレイプ本文のトークン予算（既定 4000）
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from strands.tools.mcp.mcp_types import MCPToolResult
+
+from agents.middleware.mcp_middleware import MCPToolMiddleware, ToolCall, ToolCallHandler, tool_result_text
+
+log = logging.getLogger("tool_result_compaction")
+
+DEFAULT_MAX_PAGE_TOKENS = 4000
+
+# ページ装飾とみなす行
+_IMAGE_LINE = re.compile(r"^\s*!\[[^\]]*\]\([^)]*\)\s*$")
+_LINK_ONLY_LINE = re.compile(r"^\s*([-*|]\s*)?(\[[^\]]*\]\([^)]*\)\s*[|·/,]?\s*)+$")
+_FOOTER_HEADINGS = ("関連記事", "おすすめ記事", "Related", "Recommended", "この記事を読んだ人")
+_COPYRIGHT_MARKERS = ("©", "Copyright")
+_BLANK_RUN = re.compile(r"\n{3,}")
+
+
+def compaction_enabled() -> bool:
+    return os.environ.get("TOOL_RESULT_COMPACTION", "true").lower() != "false"
+
+
+def estimate_tokens(text: str) -> int:
+    """おおよそのトークン数（ASCIIは4文字≒1トークン、日本語等は1文字≒1トークン）。"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+
+def _cut_to_tokens(text: str, max_tokens: int) -> str:
+    """先頭から estimate_tokens が max_tokens を超えない範囲まで切り出す。"""
+    ascii_chars = other_chars = 0
+    for i, ch in enumerate(text):
+        if ord(ch) < 128:
+            ascii_chars += 1
+        else:
+            other_chars += 1
+        if ascii_chars // 4 + other_chars > max_tokens:
+            return text[:i]
+    return text
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> tuple[str, bool]:
+    """段落単位で先頭から予算内に収まるまで残す。"""
+    if estimate_tokens(text) <= max_tokens:
+        return text, False
+    kept: List[str] = []
+    used = 0
+    for paragraph in text.split("\n\n"):
+        cost = estimate_tokens(paragraph) + 1
+        if used + cost > max_tokens:
+            if not kept:
+                # 1段落目が予算超過の場合は、推定トークン数が予算に達するところで切る
+                kept.append(_cut_to_tokens(paragraph, max_tokens))
+            break
+        kept.append(paragraph)
+        used += cost
+    return "\n\n".join(kept), True
+
+
+def strip_page_chrome(markdown: str) -> str:
+    """ナビゲーション・画像のみの行・フッターを除去する。"""
+    lines: List[str] = []
+    for line in markdown.splitlines():
+        stripped = line.strip()
+        text = stripped.lstrip("#").strip()
+        # 本文の後ろに続く関連記事・コピーライト以降はフッターとして切り捨てる
+        if lines and ((stripped.startswith("#") and text.startswith(_FOOTER_HEADINGS))
+                      or text.startswith(_COPYRIGHT_MARKERS)):
+            break
+        if _IMAGE_LINE.match(line) or _LINK_ONLY_LINE.match(line):
+            continue
+        lines.append(line.rstrip())
+    return _BLANK_RUN.sub("\n\n", "\n".join(lines)).strip()
+
+
+# ==== ツール別の射影 ==============================================================
+def compact_slack_history(payload: Dict[str, Any]) -> Dict[str, Any]:
+    if payload.get("ok") is False:
+        # 失敗した応答を空のチャンネルに見せないよう、エラーはそのまま渡す
+        return payload
+    compacted: Dict[str, Any] = {
+        "messages": [
+            # subtype は参加・退出・bot 投稿などの通常でないメッセージの判別に使う
+            {k: m[k] for k in ("user", "ts", "text", "thread_ts", "subtype") if m.get(k) is not None}
+            for m in payload.get("messages", [])
+        ],
+        "has_more": payload.get("has_more", False),
+    }
+    next_cursor = (payload.get("response_metadata") or {}).get("next_cursor")
+    if next_cursor:
+        compacted["next_cursor"] = next_cursor
+    return compacted
+
+
+def compact_slack_users(payload: Dict[str, Any]) -> Dict[str, Any]:
+    if payload.get("ok") is False:
+        return payload
+    members = []
+    for member in payload.get("members", []):
+        profile = member.get("profile") or {}
+        members.append({
+            "id": member.get("id"),
+            "name": member.get("name"),
+            "real_name": member.get("real_name") or profile.get("real_name"),
+            "display_name": profile.get("display_name"),
+            "email": profile.get("email"),
+        })
+    compacted: Dict[str, Any] = {"members": members}
+    next_cursor = (payload.get("response_metadata") or {}).get("next_cursor")
+    if next_cursor:
+        compacted["next_cursor"] = next_cursor
+    return compacted
+
+
+def compact_scraped_page(payload: Any, max_tokens: int) -> Dict[str, Any]:
+    if isinstance(payload, str):
+        payload = {"markdown": payload}
+    document = payload.get("data", payload) if isinstance(payload, dict) else {}
+    metadata = document.get("metadata") or {}
+    markdown, truncated = trim_to_tokens(strip_page_chrome(document.get("markdown") or ""), max_tokens)
+    compacted = {
+        "url": metadata.get("sourceURL") or metadata.get("url"),
+        "title": metadata.get("title") or metadata.get("ogTitle"),
+        "published_time": metadata.get("publishedTime") or metadata.get("article:published_time"),
+        "markdown": markdown,
+    }
+    if truncated:
+        compacted["truncated"] = True
+    return {k: v for k, v in compacted.items() if v is not None}
+
+
+@dataclass
+class CompactionStats:
+    calls: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+    def to_dict(self) -> Dict[str, int]:
+        return {"calls": self.calls, "bytes_before": self.bytes_before,
+                "bytes_after": self.bytes_after, "bytes_saved": self.bytes_saved}
+
+
+class ToolResultCompactor(MCPToolMiddleware):
+    """ツール結果を射影・切り詰めてからエージェントへ返すミドルウェア。"""
+
+    def __init__(self, max_page_tokens: Optional[int] = None):
+        self.max_page_tokens = max_page_tokens or int(
+            os.environ.get("FIRECRAWL_MAX_PAGE_TOKENS", DEFAULT_MAX_PAGE_TOKENS)
+        )
+        self.stats = CompactionStats()
+        self._lock = threading.Lock()
+        self._rules: Dict[str, Callable[[Any], Any]] = {
+            "conversationsHistory": compact_slack_history,
+            "conversationsReplies": compact_slack_history,
+            "usersList": compact_slack_users,
+            "firecrawl_scrape": lambda p: compact_scraped_page(p, self.max_page_tokens),
+        }
+
+    def _rule_for(self, tool_name: str) -> Optional[Callable[[Any], Any]]:
+        for suffix, rule in self._rules.items():
+            if tool_name.endswith(suffix):
+                return rule
+        return None
+
+    async def __call__(self, call: ToolCall, call_next: ToolCallHandler) -> MCPToolResult:
+        result = await call_next(call)
+        rule = self._rule_for(call.name)
+        if rule is None or result.get("status") == "error":
+            return result
+
+        raw = tool_result_text(result)
+        try:
+            payload = json.loads(raw)
+        except json.JSONDecodeError:
+            payload = raw
+        try:
+            compacted = json.dumps(rule(payload), ensure_ascii=False, separators=(",", ":"))
+        except Exception as e:
+            log.warning(f"[{call.endpoint}] {call.name} の結果をコンパクションできませんでした: {e}")
+            return result
+
+        before = len(raw.encode("utf-8"))
+        after = len(compacted.encode("utf-8"))
+        call.annotations["bytes_saved"] = before - after
+        with self._lock:
+            self.stats.calls += 1
+            self.stats.bytes_before += before
+            self.stats.bytes_after += after
+        log.info(f"🗜️ {call.name}: {before:,} → {after:,} bytes")
+
+        compacted_result: MCPToolResult = {
+            "status": result.get("status", "success"),
+            "toolUseId": result.get("toolUseId", call.tool_use_id),
+            "content": [{"text": compacted}],
+        }
+        return compacted_result
+
+
+def collect_compaction_stats(*clients: Any) -> Dict[str, Dict[str, int]]:
+    """MCPクライアント群に組み込まれたコンパクションの集計をエンドポイント別に返す。"""
+    stats: Dict[str, Dict[str, int]] = {}
+    for client in clients:
+        for middleware in getattr(client, "middlewares", []):
+            if isinstance(middleware, ToolResultCompactor) and middleware.stats.calls:
+                stats[client.endpoint] = middleware.stats.to_dict()
+    return stats
@@ -0,0 +1,224 @@
+"""
+MCPツール呼び出しのミドルウェア基盤。
+
+MCPClient.call_tool_async / call_tool_sync をフックし、登録されたミドルウェアを
+チェーンとして順番に通してから実際のMCPセッションへ送る。
+
+    client = MiddlewareMCPClient(transport, endpoint="firecrawl", middlewares=[...])
+
+ミドルウェアは `async def __call__(call, call_next)` を実装する。
+Agent からのツール呼び出し（MCPAgentTool経由）とパイプラインからの直接呼び出しの両方に効く。
+
+lazy=True のクライアントは `with client:` ではセッションを開かず、最初のツール呼び出し・ツール列挙で開く。
+ツール列挙の結果はエンドポイントごとにプロセス内でキャッシュし（MCP_TOOL_CACHE_TTL_SECONDS、既定 300）、
+キャッシュがあればセッションを開かずにツールを返す。
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from mcp.types import Tool
+from strands.tools.mcp import MCPAgentTool, MCPClient
+from strands.tools.mcp.mcp_types import MCPToolResult
+from strands.types.collections import PaginatedList
+
+log = logging.getLogger("mcp_middleware")
+
+
+@dataclass
+class ToolCall:
+    """1回のMCPツール呼び出し。ミドルウェア間で受け渡される。"""
+    endpoint: str
+    tool_use_id: str
+    name: str
+    arguments: Optional[Dict[str, Any]] = None
+    read_timeout_seconds: Optional[timedelta] = None
+    # MCPClient.call_tool_async の残りの引数（MCPAgentTool は cancel_signal を渡す）。チェーン終端でそのまま渡す
+    meta: Optional[Dict[str, Any]] = None
+    progress_callback: Optional[Callable[..., Any]] = None
+    cancel_signal: Optional[threading.Event] = None
+    # ミドルウェアが任意の情報を書き込む領域（計測値など）
+    annotations: Dict[str, Any] = field(default_factory=dict)
+
+
+ToolCallHandler = Callable[[ToolCall], Awaitable[MCPToolResult]]
+
+
+class MCPToolMiddleware:
+    """ミドルウェアの基底クラス（何もしない）。"""
+
+    async def __call__(self, call: ToolCall, call_next: ToolCallHandler) -> MCPToolResult:
+        return await call_next(call)
+
+    def on_tools_listed(self, endpoint: str, tools: list) -> None:
+        """list_tools_sync の結果を受け取るフック。"""
+
+    def close(self) -> None:
+        """MCPセッション終了時のフック。"""
+
+
+def tool_result_text(result: MCPToolResult) -> str:
+    """MCPToolResult のテキストコンテンツを連結して返す。"""
+    return "".join(
+        block.get("text", "") for block in result.get("content", []) if isinstance(block, dict)
+    )
+
+
+def error_result(tool_use_id: str, message: str) -> MCPToolResult:
+    """エラー状態の MCPToolResult を作る。"""
+    return {"status": "error", "toolUseId": tool_use_id, "content": [{"text": message}]}
+
+
+def run_sync(coro: Awaitable[Any]) -> Any:
+    """同期コンテキストからコルーチンを実行する（実行中のループがあれば別スレッドで）。"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+# (エンドポイント, ページトークン) → (取得時刻, ツール定義, 次ページのトークン)
+_tool_listing_cache: Dict[Tuple[str, Optional[str]], Tuple[float, List[Tool], Optional[str]]] = {}
+_tool_listing_lock = threading.Lock()
+
+
+def _cached_tool_listing(endpoint: str, token: Optional[str]) -> Optional[Tuple[List[Tool], Optional[str]]]:
+    ttl = float(os.environ.get("MCP_TOOL_CACHE_TTL_SECONDS", "300"))
+    with _tool_listing_lock:
+        entry = _tool_listing_cache.get((endpoint, token))
+    if entry is None or ttl <= 0 or time.monotonic() - entry[0] > ttl:
+        return None
+    return entry[1], entry[2]
+
+
+class MiddlewareMCPClient(MCPClient):
+    """ミドルウェアチェーンを通してツールを呼び出す MCPClient。"""
+
+    def __init__(
+        self,
+        transport_callable: Callable[[], Any],
+        endpoint: str,
+        middlewares: Optional[List[MCPToolMiddleware]] = None,
+        lazy: bool = False,
+        **kwargs: Any,
+    ):
+        super().__init__(transport_callable, **kwargs)
+        self.endpoint = endpoint
+        self.middlewares: List[MCPToolMiddleware] = list(middlewares or [])
+        self.lazy = lazy
+        self.session_open = False
+        self._session_lock = threading.Lock()
+
+    def __enter__(self) -> "MiddlewareMCPClient":
+        if self.lazy:
+            return self
+        return self.ensure_session()
+
+    def ensure_session(self) -> "MiddlewareMCPClient":
+        """MCPセッションが開いていなければ開く（同時に呼ばれても1回だけ）。"""
+        with self._session_lock:
+            if not self.session_open:
+                # phase_timer はこのモジュールに依存するため、ここで import する
+                from agents.runtime.phase_timer import phase
+
+                with phase(f"mcp_connect.{self.endpoint}"):
+                    self.start()
+                self.session_open = True
+                log.info(f"🔌 [MCP:{self.endpoint}] セッションを開きました")
+        return self
+
+    def add_middleware(self, middleware: MCPToolMiddleware, outermost: bool = False) -> None:
+        """チェーンの最も内側（MCPセッション寄り）、outermost なら最も外側にミドルウェアを追加する。"""
+        if outermost:
+            self.middlewares.insert(0, middleware)
+        else:
+            self.middlewares.append(middleware)
+
+    def list_tools_sync(self, pagination_token: Optional[str] = None, *args: Any, **kwargs: Any):
+        cached = _cached_tool_listing(self.endpoint, pagination_token) if not args and not kwargs else None
+        if cached is not None:
+            tools = PaginatedList([MCPAgentTool(tool, self) for tool in cached[0]], token=cached[1])
+        else:
+            self.ensure_session()
+            tools = super().list_tools_sync(pagination_token, *args, **kwargs)
+            if not args and not kwargs:
+                with _tool_listing_lock:
+                    _tool_listing_cache[(self.endpoint, pagination_token)] = (
+                        time.monotonic(), [t.mcp_tool for t in tools], getattr(tools, "pagination_token", None),
+                    )
+        for middleware in self.middlewares:
+            middleware.on_tools_listed(self.endpoint, list(tools))
+        return tools
+
+    async def _call_upstream(self, call: ToolCall) -> MCPToolResult:
+        """チェーン終端: 実際のMCPセッションへ送る（未接続ならここで接続する）。"""
+        if not self.session_open:
+            await asyncio.to_thread(self.ensure_session)
+        return await MCPClient.call_tool_async(
+            self,
+            tool_use_id=call.tool_use_id,
+            name=call.name,
+            arguments=call.arguments,
+            read_timeout_seconds=call.read_timeout_seconds,
+            meta=call.meta,
+            progress_callback=call.progress_callback,
+            cancel_signal=call.cancel_signal,
+        )
+
+    def _build_chain(self) -> ToolCallHandler:
+        handler: ToolCallHandler = self._call_upstream
+        for middleware in reversed(self.middlewares):
+            handler = (lambda mw, nxt: (lambda c: mw(c, nxt)))(middleware, handler)
+        return handler
+
+    async def call_tool_async(
+        self,
+        tool_use_id: str,
+        name: str,
+        arguments: Optional[Dict[str, Any]] = None,
+        read_timeout_seconds: Optional[timedelta] = None,
+        meta: Optional[Dict[str, Any]] = None,
+        progress_callback: Optional[Callable[..., Any]] = None,
+        *,
+        cancel_signal: Optional[threading.Event] = None,
+    ) -> MCPToolResult:
+        call = ToolCall(self.endpoint, tool_use_id, name, arguments, read_timeout_seconds,
+                        meta=meta, progress_callback=progress_callback, cancel_signal=cancel_signal)
+        return await self._build_chain()(call)
+
+    def call_tool_sync(
+        self,
+        tool_use_id: str,
+        name: str,
+        arguments: Optional[Dict[str, Any]] = None,
+        read_timeout_seconds: Optional[timedelta] = None,
+        meta: Optional[Dict[str, Any]] = None,
+        progress_callback: Optional[Callable[..., Any]] = None,
+        *,
+        cancel_signal: Optional[threading.Event] = None,
+    ) -> MCPToolResult:
+        return run_sync(self.call_tool_async(tool_use_id, name, arguments, read_timeout_seconds, meta,
+                                             progress_callback, cancel_signal=cancel_signal))
+
+    def stop(self, *args: Any, **kwargs: Any) -> None:
+        try:
+            with self._session_lock:
+                if self.session_open:
+                    super().stop(*args, **kwargs)
+                    self.session_open = False
+        finally:
+            for middleware in self.middlewares:
+                try:
+                    middleware.close()
+                except Exception as e:
+                    log.warning(f"[MCP:{self.endpoint}] ミドルウェア終了処理に失敗: {e}")
@@ -0,0 +1,208 @@
+"""
+MCPツール呼び出しのレート制限（トークンバケット）。
+
+上流（Slack の API メソッド、Firecrawl のエンドポイント）ごとにバケットを1つ持ち、
+コンテナ内のすべてのリクエスト・タスクで共有する。並行呼び出しや複数チャンネル収集でも
+上流の制限（Slack Web API の Tier、Firecrawl のプランの上限）を超えないように呼び出しを待たせる。
+
+- Slack: `slack___<method>` をメソッドごとのバケットで制限する（レートはメソッドの Tier で決まる）
+- Firecrawl: `firecrawl_<endpoint>` をエンドポイントごとのバケットで制限する
+- 429（ratelimited）が返ったら Retry-After の間バケット全体を止め、再開後はバーストせずに一定レートで流す
+  （呼び出し元ごとにバックオフしないので、スループットが上限付近で安定する）
+
+バケットはスレッドセーフで、どのイベントループから呼ばれても共有できる。
+
+環境変数:
+- RATE_LIMIT: true(既定) / false
+- SLACK_RATE_LIMIT_TIER{1..4}_PER_MIN: Tier ごとの1メソッドあたりの上限（既定 1 / 20 / 50 / 100）
+- SLACK_RATE_LIMIT_BURST: Slack バケットのバースト（既定 5）
+- FIRECRAWL_RATE_LIMIT_PER_MIN / FIRECRAWL_RATE_LIMIT_BURST: Firecrawl の1エンドポイントあたりの上限（既定 100 / 5）
+- RATE_LIMIT_MAX_RETRIES: 429 を受けたときの再試行回数（既定 3）
+- RATE_LIMIT_DEFAULT_RETRY_AFTER: Retry-After が読み取れないときの停止秒数（既定 15）
+- RATE_LIMIT_MAX_RETRY_AFTER: これより長い Retry-After は待たずにエラーを返す（既定 120）
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from strands.tools.mcp.mcp_types import MCPToolResult
+
+from agents.middleware.mcp_middleware import MCPToolMiddleware, ToolCall, ToolCallHandler, tool_result_text
+
+log = logging.getLogger("rate_limit")
+
+SLACK_TOOL_PREFIX = "slack___"
+FIRECRAWL_TOOL_PREFIX = "firecrawl_"
+
+# Slack Web API の Tier ごとの上限（1分あたり、メソッドごと）
+SLACK_TIER_PER_MIN = {1: 1, 2: 20, 3: 50, 4: 100}
+# Gateway のツール名（slack___ の後ろ）→ Tier。未登録のメソッドは Tier 3 とみなす
+SLACK_METHOD_TIERS = {
+    "conversationsHistory": 3,
+    "conversationsReplies": 3,
+    "conversationsList": 2,
+    "usersList": 2,
+    "usersInfo": 4,
+}
+
+_THROTTLED = re.compile(r"\b429\b|ratelimited|rate.?limit", re.IGNORECASE)
+_RETRY_AFTER = re.compile(r"retry.?after\D{0,5}(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+def rate_limit_enabled() -> bool:
+    return os.environ.get("RATE_LIMIT", "true").lower() != "false"
+
+
+@dataclass
+class BucketStats:
+    acquired: int = 0
+    waits: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    throttled: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "acquired": self.acquired,
+            "waits": self.waits,
+            "wait_ms": round(self.wait_seconds * 1000, 1),
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 1),
+            "throttled": self.throttled,
+        }
+
+
+class TokenBucket:
+    """rate 件/秒、最大 burst 件まで溜まるトークンバケット。"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate)))
+        self._tokens = self.capacity
+        # 補充の起点。pause() 中は未来の時刻になり、それまで補充されない
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.stats = BucketStats()
+
+    def _refill(self, now: float) -> None:
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def _reserve(self) -> float:
+        """トークンを1つ予約し、使えるようになるまでの待ち時間（秒）を返す。"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait = (self._updated - now) + (0.0 if self._tokens >= 0 else -self._tokens / self.rate)
+            self.stats.acquired += 1
+            if wait > 0:
+                self.stats.waits += 1
+                self.stats.wait_seconds += wait
+                self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, wait)
+            return wait
+
+    async def acquire(self) -> float:
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """seconds 秒間トークンを出さない（429 の Retry-After）。再開時はバーストさせない。"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = max(self._updated, now + seconds)
+            self.stats.throttled += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"per_min": round(self.rate * 60, 1), "burst": int(self.capacity), **self.stats.to_dict()}
+
+
+_registry_lock = threading.Lock()
+_buckets: Dict[str, TokenBucket] = {}
+
+
+def shared_bucket(name: str, per_min: float, burst: int) -> TokenBucket:
+    """名前ごとのバケット（プロセス共通）を返す。"""
+    with _registry_lock:
+        if name not in _buckets:
+            _buckets[name] = TokenBucket(per_min / 60.0, burst=burst)
+        return _buckets[name]
+
+
+def bucket_for(tool_name: str) -> Optional[TokenBucket]:
+    """ツール名に対応する上流のバケットを返す（制限対象外なら None）。"""
+    if tool_name.startswith(SLACK_TOOL_PREFIX):
+        method = tool_name[len(SLACK_TOOL_PREFIX):]
+        tier = SLACK_METHOD_TIERS.get(method, 3)
+        per_min = float(os.environ.get(f"SLACK_RATE_LIMIT_TIER{tier}_PER_MIN", SLACK_TIER_PER_MIN[tier]))
+        return shared_bucket(f"slack.{method}", per_min, int(os.environ.get("SLACK_RATE_LIMIT_BURST", "5")))
+    if tool_name.startswith(FIRECRAWL_TOOL_PREFIX):
+        return shared_bucket(
+            f"firecrawl.{tool_name[len(FIRECRAWL_TOOL_PREFIX):]}",
+            float(os.environ.get("FIRECRAWL_RATE_LIMIT_PER_MIN", "100")),
+            int(os.environ.get("FIRECRAWL_RATE_LIMIT_BURST", "5")),
+        )
+    return None
+
+
+def throttled_retry_after(result: MCPToolResult) -> Optional[float]:
+    """429 のエラー結果なら停止すべき秒数を、そうでなければ None を返す。"""
+    if result.get("status") != "error":
+        return None
+    text = tool_result_text(result)
+    if not _THROTTLED.search(text):
+        return None
+    match = _RETRY_AFTER.search(text)
+    return float(match.group(1)) if match else float(os.environ.get("RATE_LIMIT_DEFAULT_RETRY_AFTER", "15"))
+
+
+def rate_limit_report() -> Dict[str, Dict[str, Any]]:
+    """使われたバケットの設定と待ち時間の集計を返す（コンテナ起動からの累計）。"""
+    with _registry_lock:
+        buckets = dict(_buckets)
+    return {name: bucket.snapshot() for name, bucket in sorted(buckets.items())}
+
+
+class RateLimitMiddleware(MCPToolMiddleware):
+    """上流ごとの共有バケットでツール呼び出しを制限し、429 では Retry-After 後に再試行する。"""
+
+    def __init__(self, max_retries: Optional[int] = None, max_retry_after: Optional[float] = None):
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get("RATE_LIMIT_MAX_RETRIES", "3"))
+        self.max_retry_after = max_retry_after or float(os.environ.get("RATE_LIMIT_MAX_RETRY_AFTER", "120"))
+
+    async def __call__(self, call: ToolCall, call_next: ToolCallHandler) -> MCPToolResult:
+        bucket = bucket_for(call.name)
+        if bucket is None:
+            return await call_next(call)
+
+        waited = 0.0
+        attempt = 0
+        while True:
+            waited += await bucket.acquire()
+            result = await call_next(call)
+            retry_after = throttled_retry_after(result)
+            if retry_after is None:
+                break
+            bucket.pause(retry_after)
+            attempt += 1
+            if attempt > self.max_retries or retry_after > self.max_retry_after:
+                log.error(f"❌ [{call.endpoint}] {call.name} がレート制限され続けています（Retry-After {retry_after:.0f}s）")
+                break
+            log.warning(f"🚦 [{call.endpoint}] {call.name} が 429: {retry_after:.0f}s 停止して再試行（{attempt}/{self.max_retries}）")
+
+        if waited > 0:
+            call.annotations["rate_limit_wait_ms"] = round(waited * 1000, 1)
+            log.info(f"⏳ [{call.endpoint}] {call.name} をレート制限で {waited * 1000:.0f}ms 待機")
+        return result
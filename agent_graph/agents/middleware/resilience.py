@@ -0,0 +1,326 @@
+"""
+MCPツール呼び出しの耐障害性（タイムアウト・リトライ・サーキットブレーカー）。
+
+Firecrawl や Gateway が不調のとき、ツール呼び出しがエージェントの打ち切りまで待たされないように、
+エンドポイント（gateway / firecrawl / dsql）ごとに次を適用する。
+
+- タイムアウト: 1回の呼び出しを MCP_TIMEOUT_SECONDS で打ち切る
+- リトライ: 接続エラー・タイムアウトのみ、ジッター付き指数バックオフで再試行する
+  （1回の呼び出しにかける総時間は MCP_CALL_BUDGET_SECONDS まで）
+- リトライ予算: 全エンドポイント共通。成功した呼び出しの一定割合しかリトライできない（リトライ嵐を防ぐ）
+- サーキットブレーカー: 連続失敗でオープンし、リセット時間まで呼び出さずに即座に失敗させる
+
+失敗は MCPUnavailableError（とその派生）として送出する。エージェントのツール呼び出しでは
+Strands がエラー結果に変換し、パイプラインでは該当URLを「後回し（deferred）」として扱う。
+ツール自身が返したエラー結果（不正なURL等）はエンドポイントの障害とはみなさない。
+
+ブレーカーとリトライ予算はプロセス全体で共有し、リクエストをまたいで状態を保つ。
+
+環境変数（`_GATEWAY` / `_FIRECRAWL` / `_DSQL` を付けるとエンドポイント別に上書き）:
+- MCP_RESILIENCE: true(既定) / false
+- MCP_TIMEOUT_SECONDS: 1回の呼び出しのタイムアウト（既定 gateway 30 / firecrawl 90 / dsql 30）
+- MCP_CALL_BUDGET_SECONDS: リトライを含む1回の呼び出しの上限（既定 タイムアウトの2倍）
+- MCP_RETRY_MAX_ATTEMPTS: 最大試行回数（既定 3）
+- MCP_RETRY_BASE_DELAY_MS / MCP_RETRY_MAX_DELAY_MS: バックオフの基準・上限（既定 200 / 5000）
+- MCP_NO_RETRY_TOOLS: リトライしないツール（冪等でないもの、既定 "transact"）
+- MCP_CIRCUIT_FAILURE_THRESHOLD: オープンするまでの連続失敗数（既定 5）
+- MCP_CIRCUIT_RESET_SECONDS: オープンから試行（ハーフオープン）までの時間（既定 30）
+- MCP_RETRY_BUDGET_RATIO / MCP_RETRY_BUDGET_MIN: 成功1回あたりのリトライ枠と最低枠（既定 0.2 / 10、共通のみ）
+"""
+from __future__ import annotations
+
+import asyncio
+import fnmatch
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from strands.tools.mcp.mcp_types import MCPToolResult
+
+from agents.middleware.mcp_middleware import MCPToolMiddleware, ToolCall, ToolCallHandler, tool_result_text
+
+log = logging.getLogger("mcp_resilience")
+
+# MCPClient.call_tool_async が接続・セッションの例外をエラー結果に変換するときの接頭辞
+TRANSPORT_ERROR_PREFIX = "Tool execution failed"
+
+DEFAULT_TIMEOUT_SECONDS = {"gateway": 30.0, "firecrawl": 90.0, "dsql": 30.0}
+
+
+class MCPUnavailableError(RuntimeError):
+    """エンドポイントが一時的に使えない（後で再実行すれば成功しうる）。"""
+
+    def __init__(self, endpoint: str, tool: str, message: str):
+        super().__init__(f"[{endpoint}] {tool}: {message}")
+        self.endpoint = endpoint
+        self.tool = tool
+
+
+class MCPTimeoutError(MCPUnavailableError):
+    """ツール呼び出しがタイムアウトした。"""
+
+
+class CircuitOpenError(MCPUnavailableError):
+    """サーキットブレーカーがオープン中のため呼び出さなかった。"""
+
+    def __init__(self, endpoint: str, tool: str, retry_after: float):
+        super().__init__(endpoint, tool, f"サーキットオープン中（{retry_after:.0f}秒後に再試行）")
+        self.retry_after = retry_after
+
+
+def resilience_enabled() -> bool:
+    return os.environ.get("MCP_RESILIENCE", "true").lower() != "false"
+
+
+def _env(name: str, endpoint: str, default: Any) -> str:
+    return os.environ.get(f"{name}_{endpoint.upper()}", os.environ.get(name, str(default)))
+
+
+@dataclass(frozen=True)
+class ResiliencePolicy:
+    timeout_seconds: float
+    call_budget_seconds: float
+    max_attempts: int
+    base_delay: float
+    max_delay: float
+    no_retry_tools: Tuple[str, ...]
+    failure_threshold: int
+    reset_seconds: float
+
+    @classmethod
+    def for_endpoint(cls, endpoint: str) -> "ResiliencePolicy":
+        timeout = float(_env("MCP_TIMEOUT_SECONDS", endpoint, DEFAULT_TIMEOUT_SECONDS.get(endpoint, 30.0)))
+        return cls(
+            timeout_seconds=timeout,
+            call_budget_seconds=float(_env("MCP_CALL_BUDGET_SECONDS", endpoint, timeout * 2)),
+            max_attempts=max(1, int(_env("MCP_RETRY_MAX_ATTEMPTS", endpoint, 3))),
+            base_delay=float(_env("MCP_RETRY_BASE_DELAY_MS", endpoint, 200)) / 1000,
+            max_delay=float(_env("MCP_RETRY_MAX_DELAY_MS", endpoint, 5000)) / 1000,
+            no_retry_tools=tuple(t.strip() for t in _env("MCP_NO_RETRY_TOOLS", endpoint, "transact").split(",") if t.strip()),
+            failure_threshold=max(1, int(_env("MCP_CIRCUIT_FAILURE_THRESHOLD", endpoint, 5))),
+            reset_seconds=float(_env("MCP_CIRCUIT_RESET_SECONDS", endpoint, 30)),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """attempt 回目の失敗後の待ち時間（フルジッター）。"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def is_retryable_tool(self, name: str) -> bool:
+        return not any(fnmatch.fnmatch(name, pattern) or name.endswith(pattern) for pattern in self.no_retry_tools)
+
+
+class RetryBudget:
+    """成功した呼び出し数に比例してリトライを許可する。"""
+
+    def __init__(self, ratio: float = 0.2, minimum: float = 10.0):
+        self.ratio = ratio
+        self.capacity = max(minimum, 1.0) * 10
+        self._tokens = float(minimum)
+        self._lock = threading.Lock()
+        self.denied = 0
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            self.denied += 1
+            return False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"tokens": round(self._tokens, 1), "denied": self.denied}
+
+
+class CircuitBreaker:
+    """closed → (連続失敗) → open → (リセット時間経過) → half_open → 試行1回の結果で closed / open。"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, endpoint: str, failure_threshold: int, reset_seconds: float):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_count = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.reset_seconds - time.monotonic())
+
+    def admit(self) -> Tuple[bool, bool]:
+        """(呼び出してよいか, half_open の試行として通したか) を返す。"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True, False
+            if self.state == self.OPEN and self.retry_after() <= 0:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True, True
+            return False, False
+
+    def allow(self) -> bool:
+        return self.admit()[0]
+
+    def release_probe(self) -> None:
+        """結果を記録せずに終わった試行（取り消し等）の枠を戻し、次の呼び出しが試行できるようにする。"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                log.info(f"✅ [{self.endpoint}] サーキットをクローズ")
+            self.state, self.failures, self._probe_in_flight = self.CLOSED, 0, False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened_count += 1
+                    log.warning(f"🔌 [{self.endpoint}] サーキットをオープン（連続失敗 {self.failures} 回）")
+                self.state, self._opened_at, self._probe_in_flight = self.OPEN, time.monotonic(), False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "opened": self.opened_count}
+
+
+_registry_lock = threading.Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+_retry_budget: Optional[RetryBudget] = None
+
+
+def circuit_breaker(endpoint: str, policy: Optional[ResiliencePolicy] = None) -> CircuitBreaker:
+    """エンドポイントのブレーカー（プロセス共通）を返す。"""
+    with _registry_lock:
+        if endpoint not in _breakers:
+            policy = policy or ResiliencePolicy.for_endpoint(endpoint)
+            _breakers[endpoint] = CircuitBreaker(endpoint, policy.failure_threshold, policy.reset_seconds)
+        return _breakers[endpoint]
+
+
+def retry_budget() -> RetryBudget:
+    """全エンドポイント共通のリトライ予算を返す。"""
+    global _retry_budget
+    with _registry_lock:
+        if _retry_budget is None:
+            _retry_budget = RetryBudget(
+                ratio=float(os.environ.get("MCP_RETRY_BUDGET_RATIO", "0.2")),
+                minimum=float(os.environ.get("MCP_RETRY_BUDGET_MIN", "10")),
+            )
+        return _retry_budget
+
+
+@dataclass
+class ResilienceStats:
+    calls: int = 0
+    retries: int = 0
+    timeouts: int = 0
+    failures: int = 0
+    fast_failures: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+
+class ResilienceMiddleware(MCPToolMiddleware):
+    """タイムアウト・リトライ・サーキットブレーカーを適用するミドルウェア。"""
+
+    def __init__(self, endpoint: str, policy: Optional[ResiliencePolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None, budget: Optional[RetryBudget] = None):
+        self.endpoint = endpoint
+        self.policy = policy or ResiliencePolicy.for_endpoint(endpoint)
+        self.breaker = breaker or circuit_breaker(endpoint, self.policy)
+        self.budget = budget or retry_budget()
+        self.stats = ResilienceStats()
+        self._lock = threading.Lock()
+
+    def _count(self, **increments: int) -> None:
+        with self._lock:
+            for key, value in increments.items():
+                setattr(self.stats, key, getattr(self.stats, key) + value)
+
+    async def _attempt(self, call: ToolCall, call_next: ToolCallHandler,
+                       timeout: float) -> Tuple[Optional[MCPToolResult], Optional[MCPUnavailableError]]:
+        """1回呼び出し、(結果, 障害) のどちらかを返す。"""
+        call.read_timeout_seconds = timedelta(seconds=timeout)
+        try:
+            result = await asyncio.wait_for(call_next(call), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._count(timeouts=1)
+            return None, MCPTimeoutError(call.endpoint, call.name, f"{timeout:.0f}秒でタイムアウト")
+        except MCPUnavailableError as e:
+            return None, e
+        except Exception as e:
+            return None, MCPUnavailableError(call.endpoint, call.name, str(e) or type(e).__name__)
+        text = tool_result_text(result) if result.get("status") == "error" else ""
+        if text.startswith(TRANSPORT_ERROR_PREFIX):
+            return None, MCPUnavailableError(call.endpoint, call.name, text)
+        return result, None
+
+    async def __call__(self, call: ToolCall, call_next: ToolCallHandler) -> MCPToolResult:
+        self._count(calls=1)
+        started = time.monotonic()
+        retryable = self.policy.is_retryable_tool(call.name)
+        attempt = 0
+        while True:
+            attempt += 1
+            allowed, probe = self.breaker.admit()
+            if not allowed:
+                self._count(fast_failures=1)
+                raise CircuitOpenError(call.endpoint, call.name, self.breaker.retry_after())
+
+            remaining = self.policy.call_budget_seconds - (time.monotonic() - started)
+            try:
+                result, failure = await self._attempt(call, call_next, min(self.policy.timeout_seconds, remaining))
+            except BaseException:
+                # 締め切り・切断による取り消し（CancelledError）は成否が分からないため、
+                # half_open の試行の枠だけ戻す（戻さないとブレーカーが開いたままになる）
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            call.annotations["attempts"] = attempt
+            if failure is None:
+                self.breaker.record_success()
+                self.budget.deposit()
+                return result
+
+            self.breaker.record_failure()
+            delay = self.policy.backoff(attempt)
+            remaining = self.policy.call_budget_seconds - (time.monotonic() - started) - delay
+            if (attempt >= self.policy.max_attempts or not retryable or remaining < 1
+                    or not self.budget.try_withdraw()):
+                self._count(failures=1)
+                log.error(f"❌ {failure}（試行 {attempt} 回）")
+                raise failure
+
+            self._count(retries=1)
+            log.warning(f"🔁 {failure} → {delay * 1000:.0f}ms 後に再試行（{attempt + 1}/{self.policy.max_attempts}）")
+            await asyncio.sleep(delay)
+
+
+def collect_resilience_stats(*clients: Any) -> Dict[str, Dict[str, Any]]:
+    """MCPクライアント群のリトライ・タイムアウト集計とブレーカー状態をエンドポイント別に返す。"""
+    stats: Dict[str, Dict[str, Any]] = {}
+    for client in clients:
+        for middleware in getattr(client, "middlewares", []):
+            if isinstance(middleware, ResilienceMiddleware) and middleware.stats.calls:
+                stats[client.endpoint] = {**middleware.stats.to_dict(), "circuit": middleware.breaker.snapshot()}
+    return stats
@@ -0,0 +1,398 @@
+"""
+収集済みレコードの処理パイプライン: スクレイプ → 分析 → 保存。
+
+FirecrawlAgent のツールループ（1URLごとに複数ターンの会話）の代わりに、
+URLごとに決まった手順をコードで実行し、LLMは分析（構造化出力）だけに使う。
+Firecrawl / DSQL が一時的に使えない項目は待たずに deferred とし、後の実行に回す。
+リクエストの締め切り（agents/runtime/deadline.py）を過ぎたら、以降のステージの項目も deferred にする。
+実行の予算（agents/runtime/budget.py）を使い切ったら、まだ分析していない項目を deferred にする。
+処理台帳（agents/pipeline/ledger.py）があれば、項目ごとに到達したステージを記録し、次の実行で続きから再開する。
+同じページ（url_key）の活動が保存済みなら、スクレイプ・分析をせずにその分析結果で保存する。
+本文がほぼ同じページ（agents/pipeline/near_duplicate.py）は分析せず、元ページの分析結果を duplicate_of 付きで使う。
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+
+from agents.pipeline.analysis_cache import AnalysisCache, content_key
+from agents.middleware.resilience import MCPUnavailableError
+from agents.pipeline.analyzer import ActivityAnalyzer
+from agents.pipeline.ledger import LedgerEntry, ProcessingLedger
+from agents.pipeline.model_router import ModelRouter
+from agents.pipeline.near_duplicate import NearDuplicateIndex
+from agents.pipeline.persistence import ActivityStore
+from agents.pipeline.records import CollectedPost
+from agents.pipeline.scraper import PageScraper, ScrapedPage
+from agents.pipeline.url_canonical import url_key
+from agents.runtime.budget import BudgetExceededError, current_budget
+from agents.runtime.deadline import current_deadline
+
+log = logging.getLogger("activity_pipeline")
+
+
+@dataclass
+class ItemOutcome:
+    """1件の処理結果。"""
+    url: str
+    slack_message_id: Optional[str]
+    status: str  # stored / failed / deferred / skipped（台帳上で保存済み）
+    stage: str  # 最後に到達したステージ: scraped / analyzed / stored
+    title: Optional[str] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class PipelineReport:
+    items: List[ItemOutcome] = field(default_factory=list)
+    total_tokens: int = 0  # 分析のモデル呼び出しで実際に使ったトークン数
+    cache_hits: int = 0
+    reused_stored: int = 0  # 保存済みの活動の分析結果を使った件数
+    near_duplicates: int = 0  # 近似重複として元ページの分析結果を使ったページ数
+    duration_ms: float = 0.0
+
+    def count(self, status: str) -> int:
+        return sum(1 for item in self.items if item.status == status)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "processed": len(self.items),
+            "stored": self.count("stored"),
+            "failed": self.count("failed"),
+            "deferred": self.count("deferred"),
+            "skipped": self.count("skipped"),
+            "total_tokens": self.total_tokens,
+            "cache_hits": self.cache_hits,
+            "reused_stored": self.reused_stored,
+            "near_duplicates": self.near_duplicates,
+            "duration_ms": self.duration_ms,
+            "items": [asdict(item) for item in self.items],
+        }
+
+
+class ActivityPipeline:
+    """CollectedPost のリストを並行に処理する。
+
+    Args:
+        concurrency: 同時に処理するURL数（環境変数 PIPELINE_CONCURRENCY、既定 4）
+        cache: 分析結果キャッシュ（None ならキャッシュしない）
+        ledger: 処理台帳（None なら記録・再開しない）
+        near_duplicates: 近似重複の索引（None なら本文が完全に同じページだけを1回の分析にまとめる）
+        reuse_stored: 保存済みの活動の分析結果を url_key で再利用する（環境変数 PIPELINE_REUSE_STORED、既定 true）
+    """
+
+    def __init__(
+        self,
+        scraper: PageScraper,
+        store: ActivityStore,
+        analyzer: Optional[ActivityAnalyzer] = None,
+        concurrency: Optional[int] = None,
+        cache: Optional[AnalysisCache] = None,
+        ledger: Optional[ProcessingLedger] = None,
+        reuse_stored: Optional[bool] = None,
+        near_duplicates: Optional[NearDuplicateIndex] = None,
+    ):
+        self.scraper = scraper
+        self.cache = cache
+        self.near_duplicates = near_duplicates
+        self.ledger = ledger
+        self.store = store
+        self.router = analyzer.router if analyzer else ModelRouter()
+        self.analyzer = analyzer or ActivityAnalyzer(self.router)
+        self.concurrency = concurrency or int(os.environ.get("PIPELINE_CONCURRENCY", "4"))
+        self.reuse_stored = reuse_stored if reuse_stored is not None else (
+            os.environ.get("PIPELINE_REUSE_STORED", "true").lower() != "false"
+        )
+
+    async def _bounded(self, coros: List[Awaitable[Any]]) -> List[Any]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def _run(coro: Awaitable[Any]) -> Any:
+            async with semaphore:
+                return await coro
+
+        return list(await asyncio.gather(*[_run(c) for c in coros], return_exceptions=True))
+
+    async def _store(self, post: CollectedPost, outcome: ItemOutcome, fields: Dict[str, Any]) -> None:
+        try:
+            await self.store.save_activity(post, fields)
+            outcome.stage = outcome.status = "stored"
+        except MCPUnavailableError as e:
+            log.warning(f"⏭️ 保存を後回し: {post.url}: {e}")
+            outcome.status, outcome.error = "deferred", str(e)
+        except Exception as e:
+            log.error(f"❌ 保存失敗: {post.url}: {e}")
+            outcome.error = str(e)
+
+    async def resume_posts(self, posts: List[CollectedPost]) -> List[CollectedPost]:
+        """台帳に残っている未完了の項目のうち、posts に含まれないものを返す（台帳なしなら空）。"""
+        deadline = current_deadline()
+        if not self.ledger or (deadline is not None and deadline.expired):
+            return []
+        return await self.ledger.pending(exclude=[post.item_key for post in posts])
+
+    async def _stored_fields(self, posts: List[CollectedPost]) -> Dict[str, Dict[str, Any]]:
+        """posts と同じページ（url_key）の保存済みの分析結果を返す（読めなければ空）。"""
+        if not self.reuse_stored or not posts:
+            return {}
+        try:
+            return await self.store.stored_fields([post.url_key for post in posts])
+        except Exception as e:
+            log.warning(f"⚠️ 保存済みの活動を確認できないため、スクレイプ・分析します: {e}")
+            return {}
+
+    async def _checkpoint(self, posts: List[CollectedPost], outcomes: Dict[str, ItemOutcome],
+                          content_keys: Dict[str, str], fields_by_url: Dict[str, Dict[str, Any]]) -> None:
+        """posts の到達ステージを台帳に書く。失敗した項目は以降のステージに進まないので1回だけ数える。"""
+        if not self.ledger or not posts:
+            return
+        entries = []
+        for post in posts:
+            outcome = outcomes[post.item_key]
+            if outcome.status == "stored":
+                status = "success"
+            elif outcome.status == "deferred":
+                status = "deferred"
+            else:
+                status = "failed" if outcome.error else "in_progress"
+            entries.append(LedgerEntry(
+                post,
+                stage=outcome.stage,
+                status=status,
+                content_key=content_keys.get(post.url),
+                analysis=fields_by_url.get(post.url) if outcome.stage == "analyzed" else None,
+                error=outcome.error,
+            ))
+        await self.ledger.record(entries)
+
+    @staticmethod
+    def _defer(posts: List[CollectedPost], outcomes: Dict[str, ItemOutcome], stage: str,
+               reason: str = "締め切り") -> None:
+        for post in posts:
+            outcome = outcomes[post.item_key]
+            outcome.status, outcome.error = "deferred", f"{reason}のため {stage} を後回し"
+
+    def _out_of_time(self, stage: str, posts: List[CollectedPost], outcomes: Dict[str, ItemOutcome]) -> bool:
+        """締め切りを過ぎていれば posts を後回しにして True を返す。"""
+        deadline = current_deadline()
+        if deadline is None or not deadline.expired or not posts:
+            return False
+        deadline.note(f"pipeline_{stage}_skipped", items=len(posts))
+        self._defer(posts, outcomes, stage)
+        return True
+
+    def _over_budget(self, posts: List[CollectedPost], outcomes: Dict[str, ItemOutcome]) -> bool:
+        """予算を使い切っていれば posts の分析を後回しにして True を返す。"""
+        budget = current_budget()
+        if budget is None or not budget.exhausted or not posts:
+            return False
+        budget.note("pipeline_analysis_skipped", items=len(posts))
+        self._defer(posts, outcomes, "analysis", reason="予算切れ")
+        return True
+
+    @staticmethod
+    def _alternate_fields(fields: Dict[str, Any], original_url: Optional[str], page_url: str) -> Dict[str, Any]:
+        """元ページの分析結果に、元ページのURL（duplicate_of）を付ける（同じページの更新なら付けない）。"""
+        if not original_url or url_key(original_url) == url_key(page_url):
+            return fields
+        return {**fields, "duplicate_of": original_url}
+
+    def _link_near_duplicates(self, to_analyze: Dict[str, ScrapedPage], pages_by_key: Dict[str, List[ScrapedPage]],
+                              fields_by_url: Dict[str, Dict[str, Any]],
+                              report: PipelineReport) -> Tuple[Dict[str, int], Dict[str, str]]:
+        """to_analyze から近似重複のページを外す。
+
+        索引にある（分析結果がキャッシュ済みの）ページの近似重複はその分析結果をすぐに使い、
+        この実行で分析するページ同士の近似重複は、最初のページの分析後に同じ結果を使う。
+        戻り値は (content_key → 指紋, 近似重複の content_key → この実行で分析する元ページの content_key)。
+        """
+        fingerprints: Dict[str, int] = {}
+        alternates: Dict[str, str] = {}
+        if self.near_duplicates is None or self.cache is None:
+            return fingerprints, alternates
+        for key, page in list(to_analyze.items()):
+            fingerprint = self.near_duplicates.fingerprint(page.markdown)
+            if fingerprint is None:
+                continue
+            match = self.near_duplicates.find(fingerprint)
+            cached = self.cache.get(match[0]) if match else None
+            if cached is not None:
+                original_url = self.cache.source_url(match[0])
+                log.info(f"🧬 近似重複（距離 {match[1]}）: {page.url} → {original_url}")
+                del to_analyze[key]
+                report.near_duplicates += len(pages_by_key[key])
+                for same in pages_by_key[key]:
+                    fields_by_url[same.url] = self._alternate_fields(cached, original_url, same.url)
+                continue
+            primary = next((k for k, fp in fingerprints.items() if self.near_duplicates.similar(fp, fingerprint)), None)
+            if primary is not None:
+                log.info(f"🧬 近似重複: {page.url} → {to_analyze[primary].url}")
+                alternates[key] = primary
+                del to_analyze[key]
+                continue
+            fingerprints[key] = fingerprint
+        return fingerprints, alternates
+
+    async def _analyze_within_deadline(self, pages: List[ScrapedPage]) -> Optional[List[Any]]:
+        """分析を締め切りまでに終える（終わらなければ None）。"""
+        deadline = current_deadline()
+        if deadline is None:
+            return await self.analyzer.analyze_many(pages)
+        try:
+            return await asyncio.wait_for(self.analyzer.analyze_many(pages), timeout=max(deadline.remaining(), 0.001))
+        except asyncio.TimeoutError:
+            deadline.note("pipeline_analysis_cut_short", pages=len(pages))
+            return None
+
+    async def run(self, posts: List[CollectedPost]) -> PipelineReport:
+        """スクレイプ → 分析 → 保存 をステージごとに実行する。
+
+        同じURLが複数メッセージに投稿されていても、スクレイプと分析は1回だけ行う。
+        分析はページ単位でまとめて ActivityAnalyzer.analyze_many に渡す（バッチ分類のため）。
+        台帳があれば、保存済みの項目は skipped とし、分析済みの項目は台帳の分析結果から保存する。
+        """
+        started = time.perf_counter()
+        report = PipelineReport()
+        outcomes = {
+            post.item_key: ItemOutcome(post.url, post.slack_message_id, status="failed", stage="collected")
+            for post in posts
+        }
+        fields_by_url: Dict[str, Dict[str, Any]] = {}
+        content_keys: Dict[str, str] = {}
+
+        # 0. 台帳の確認（前回までに到達したステージから再開する）
+        entries = await self.ledger.load(posts) if self.ledger else {}
+        active: List[CollectedPost] = []
+        for post in posts:
+            entry = entries.get(post.item_key)
+            if entry and entry.stage == "stored" and entry.status == "success":
+                outcomes[post.item_key].stage, outcomes[post.item_key].status = "stored", "skipped"
+                continue
+            if entry and entry.stage == "analyzed" and entry.analysis:
+                fields_by_url.setdefault(post.url, entry.analysis)
+            active.append(post)
+        stored = await self._stored_fields([post for post in active if post.url not in fields_by_url])
+        for post in active:
+            if post.url not in fields_by_url and post.url_key in stored:
+                fields_by_url[post.url] = stored[post.url_key]
+                report.reused_stored += 1
+        if report.reused_stored:
+            log.info(f"♻️ 保存済みの活動の分析結果を再利用: {report.reused_stored} 件")
+        fresh = [post for post in active if post.url not in fields_by_url]
+        await self._checkpoint(fresh, outcomes, content_keys, fields_by_url)
+
+        # 1. スクレイプ（同じ url_key のURLは、最初に投稿されたままの形で1回だけ取得する）
+        targets: Dict[str, str] = {}
+        if not self._out_of_time("scrape", fresh, outcomes):
+            for post in fresh:
+                targets.setdefault(post.url_key, post.url)
+        scraped = await self._bounded([self.scraper.scrape(url) for url in targets.values()])
+        scraped_by_key: Dict[str, ScrapedPage] = {}
+        page_content_keys: Dict[str, str] = {}
+        for (key, url), page in zip(targets.items(), scraped):
+            if isinstance(page, BaseException):
+                page = ScrapedPage(url=url, error=str(page))
+            scraped_by_key[key] = page
+            if page.ok:
+                page_content_keys[key] = content_key(page.markdown, self.analyzer.with_summary)
+        pages: Dict[str, ScrapedPage] = {}
+        for post in fresh:
+            page = scraped_by_key.get(post.url_key)
+            if page is None:
+                continue
+            outcome = outcomes[post.item_key]
+            if page.ok:
+                if post.url not in pages:
+                    # 別の形のURLも本文は同じなので、分析（content_key）は1回にまとまる
+                    pages[post.url] = page if page.url == post.url else replace(page, url=post.url)
+                    content_keys[post.url] = page_content_keys[post.url_key]
+                outcome.stage = "scraped"
+            else:
+                outcome.error = page.error or "empty page"
+                if page.deferred:
+                    outcome.status = "deferred"
+        await self._checkpoint(fresh, outcomes, content_keys, fields_by_url)
+
+        # 2. 分析（本文が同じ・ほぼ同じページは1回だけ分析し、キャッシュ済みなら分析しない）
+        pages_by_key: Dict[str, List[ScrapedPage]] = {}
+        for page in pages.values():
+            pages_by_key.setdefault(content_keys[page.url], []).append(page)
+
+        to_analyze: Dict[str, ScrapedPage] = {}
+        for key, same_pages in pages_by_key.items():
+            cached = self.cache.get(key) if self.cache else None
+            if cached is not None:
+                report.cache_hits += len(same_pages)
+                for page in same_pages:
+                    fields_by_url[page.url] = cached
+            else:
+                to_analyze[key] = same_pages[0]
+        fingerprints, alternates = self._link_near_duplicates(to_analyze, pages_by_key, fields_by_url, report)
+
+        waiting = [post for post in fresh if post.url in pages and post.url not in fields_by_url]
+        analyses = None
+        if not self._out_of_time("analysis", waiting, outcomes) and not self._over_budget(waiting, outcomes):
+            analyses = await self._analyze_within_deadline(list(to_analyze.values()))
+            if analyses is None:
+                self._defer(waiting, outcomes, "analysis")
+        for (key, page), analysis in zip(to_analyze.items(), analyses or []):
+            same_urls = {p.url for p in pages_by_key[key]}
+            if isinstance(analysis, BudgetExceededError):
+                self._defer([post for post in fresh if post.url in same_urls], outcomes, "analysis", reason="予算切れ")
+                continue
+            if isinstance(analysis, BaseException):
+                log.error(f"❌ 分析失敗: {page.url}: {analysis}")
+                for post in fresh:
+                    if post.url in same_urls:
+                        outcomes[post.item_key].error = str(analysis)
+                continue
+            report.total_tokens += analysis.total_tokens
+            fields = analysis.to_fields()
+            if self.cache:
+                self.cache.put(key, fields, url=page.url)
+                if key in fingerprints:
+                    self.near_duplicates.add(fingerprints[key], key)
+            for url in same_urls:
+                fields_by_url[url] = fields
+
+        # この実行で分析した元ページの結果を、近似重複のページにも使う（元ページが失敗・後回しなら同じ扱い）
+        for key, primary in alternates.items():
+            primary_url = to_analyze[primary].url
+            same_urls = {p.url for p in pages_by_key[key]}
+            report.near_duplicates += len(same_urls)
+            primary_outcome = next(outcomes[post.item_key] for post in fresh if post.url == primary_url)
+            for post in fresh:
+                if post.url not in same_urls:
+                    continue
+                if primary_url in fields_by_url:
+                    fields_by_url[post.url] = self._alternate_fields(fields_by_url[primary_url], primary_url, post.url)
+                else:
+                    outcome = outcomes[post.item_key]
+                    outcome.status = primary_outcome.status
+                    outcome.error = primary_outcome.error or f"近似重複の元ページ {primary_url} を分析できませんでした"
+
+        to_store = [post for post in active if post.url in fields_by_url]
+        for post in to_store:
+            outcome = outcomes[post.item_key]
+            outcome.stage = "analyzed"
+            outcome.title = fields_by_url[post.url].get("title")
+        await self._checkpoint([post for post in fresh if post.url in pages], outcomes, content_keys, fields_by_url)
+
+        # 3. 保存
+        await self._bounded([
+            self._store(post, outcomes[post.item_key], fields_by_url[post.url]) for post in to_store
+        ])
+        await self._checkpoint(to_store, outcomes, content_keys, fields_by_url)
+
+        report.items = list(outcomes.values())
+        report.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        skipped = f" / 保存済みのためスキップ {report.count('skipped')}" if report.count("skipped") else ""
+        log.info(
+            f"✅ パイプライン完了: 保存 {report.count('stored')} / 失敗 {report.count('failed')} "
+            f"/ 後回し {report.count('deferred')}{skipped}"
+        )
+        return report
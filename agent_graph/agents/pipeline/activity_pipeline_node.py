@@ -0,0 +1,72 @@
+"""
+ActivityPipeline を Agent Graph のノードとして実行するためのラッパー。
+
+firecrawl_agent ノードと差し替えて使う（ANALYSIS_MODE=pipeline）。
+前段の slack_agent が出力したJSONLをタスク文字列から取り出し、パイプラインで処理する。
+処理台帳に未完了の項目が残っていれば、それも合わせて処理する。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import time
+from typing import Any, Optional
+
+from strands.agent.agent_result import AgentResult
+from strands.multiagent.base import MultiAgentBase, MultiAgentResult, NodeResult, Status
+from strands.telemetry.metrics import EventLoopMetrics
+
+from agents.middleware.mcp_middleware import run_sync
+from agents.pipeline.activity_pipeline import ActivityPipeline, PipelineReport
+from agents.pipeline.records import parse_collected_posts
+
+log = logging.getLogger("activity_pipeline_node")
+
+NODE_NAME = "activity_pipeline"
+
+
+def task_text(task: Any) -> str:
+    """Graph から渡されるタスク（文字列 or ContentBlock のリスト）をテキストにする。"""
+    if isinstance(task, str):
+        return task
+    return "\n".join(block.get("text", "") for block in task if isinstance(block, dict))
+
+
+class ActivityPipelineNode(MultiAgentBase):
+    """Slack収集結果 → スクレイプ → 分析 → 保存 を実行するグラフノード。"""
+
+    def __init__(self, pipeline: ActivityPipeline):
+        super().__init__()
+        self.pipeline = pipeline
+        self.last_report: Optional[PipelineReport] = None
+
+    async def invoke_async(self, task: Any, invocation_state: Optional[dict] = None, **kwargs: Any) -> MultiAgentResult:
+        started = time.perf_counter()
+        posts = parse_collected_posts(task_text(task))
+        # 前回までのリクエストで完了しなかった項目も一緒に処理する
+        posts += await self.pipeline.resume_posts(posts)
+        report = await self.pipeline.run(posts)
+        self.last_report = report
+
+        summary = report.to_dict()
+        text = (
+            f"処理件数: {summary['processed']} 件（保存 {summary['stored']} / 失敗 {summary['failed']} / 後回し {summary['deferred']} / スキップ {summary['skipped']}）\n"
+            + json.dumps(summary["items"], ensure_ascii=False)
+        )
+        agent_result = AgentResult(
+            stop_reason="end_turn",
+            message={"role": "assistant", "content": [{"text": text}]},
+            metrics=EventLoopMetrics(),
+            state={},
+        )
+        execution_time = int((time.perf_counter() - started) * 1000)
+        # 失敗があってもノード自体は完了扱い（件ごとの結果はテキストに含める）
+        node_result = NodeResult(result=agent_result, execution_time=execution_time, status=Status.COMPLETED)
+        return MultiAgentResult(
+            status=Status.COMPLETED,
+            results={NODE_NAME: node_result},
+            execution_time=execution_time,
+        )
+
+    def __call__(self, task: Any, invocation_state: Optional[dict] = None, **kwargs: Any) -> MultiAgentResult:
+        return run_sync(self.invoke_async(task, invocation_state, **kwargs))
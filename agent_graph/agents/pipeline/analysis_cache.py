@@ -0,0 +1,125 @@
+"""
+分析結果のローカルキャッシュ（SQLite）。
+
+同じ記事が複数チャンネルに投稿されたり、数週間後に再投稿されたりしても、
+本文が同じなら分析（summary_by_ai / aws_services / aws_level / tags 等）を再計算しない。
+
+- キー: sha256(プロンプトバージョン + 要約有無 + スクレイプ済み本文)
+- 値: ActivityAnalysis.to_fields() のJSON（投稿ごとの項目は含まない）
+- 合計サイズが上限を超えたら、最後に参照された時刻が古いものから削除する（LRU）
+
+環境変数:
+- ANALYSIS_CACHE_ENABLED: キャッシュの有効/無効（既定 true）
+- ANALYSIS_CACHE_PATH: SQLiteファイルのパス（既定 .cache/analysis_cache.sqlite3）
+- ANALYSIS_CACHE_MAX_BYTES: 保存する値の合計サイズ上限（既定 50MB）
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from agents.pipeline.analyzer import ANALYSIS_PROMPT_VERSION
+
+log = logging.getLogger("analysis_cache")
+
+DEFAULT_CACHE_PATH = ".cache/analysis_cache.sqlite3"
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+
+def analysis_cache_enabled() -> bool:
+    return os.environ.get("ANALYSIS_CACHE_ENABLED", "true").lower() != "false"
+
+
+def content_key(markdown: str, with_summary: bool = True) -> str:
+    """本文とプロンプトバージョンからキャッシュキーを作る。"""
+    digest = hashlib.sha256()
+    digest.update(f"{ANALYSIS_PROMPT_VERSION}\0{int(with_summary)}\0".encode())
+    digest.update(markdown.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """content_key → 分析フィールドの永続キャッシュ。"""
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.path = Path(path or os.environ.get("ANALYSIS_CACHE_PATH", DEFAULT_CACHE_PATH))
+        self.max_bytes = max_bytes or int(os.environ.get("ANALYSIS_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_cache ("
+            " key TEXT PRIMARY KEY,"
+            " url TEXT,"
+            " fields TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS analysis_cache_accessed ON analysis_cache (accessed_at)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT fields FROM analysis_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE analysis_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def source_url(self, key: str) -> Optional[str]:
+        """key の分析結果を作ったページのURL（近似重複の元ページとして記録する）。"""
+        with self._lock:
+            row = self._conn.execute("SELECT url FROM analysis_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, fields: Dict[str, Any], url: Optional[str] = None) -> None:
+        value = json.dumps(fields, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, url, fields, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, url, value, len(value.encode("utf-8")), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM analysis_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        removed = 0
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM analysis_cache ORDER BY accessed_at ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+            total -= size
+            removed += 1
+        log.info(f"🧹 分析キャッシュから {removed} 件を削除（合計 {total:,} bytes）")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analysis_cache"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,189 @@
+"""
+取得済みページの活動分析（構造化出力）。
+
+ModelRouter の判断に従い、分類は小型モデル、summary_by_ai は大型モデルで生成する。
+エージェントのツールループを使わず、1タスク=1回の invoke_async(structured_output_model=...) で完結させる。
+使用トークンは呼び出し結果の使用量（accumulated_usage）を RoutingDecision に記録し、
+実行の予算（agents/runtime/budget.py）があれば、呼び出し前に残りを確認し、使用量を積算する。
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Literal, Optional, Union
+
+from pydantic import BaseModel, Field
+from strands import Agent
+
+from agents.pipeline.model_router import ModelRouter, RoutingDecision
+from agents.pipeline.scraper import ScrapedPage
+from agents.runtime.budget import check_budget, current_budget
+
+log = logging.getLogger("activity_analyzer")
+
+# プロンプトや出力スキーマを変えたら更新する（分析結果キャッシュのキーに含まれる）
+ANALYSIS_PROMPT_VERSION = "2025-10-1"
+
+CLASSIFICATION_SYSTEM_PROMPT = """
+あなたは技術アウトプットの分類アシスタントです。与えられたページ本文から、Aurora DSQL `output_history.activities`
+に保存する項目を判定してください。本文に無い情報は推測せず省略します。
+
+- activity_type: presentation(登壇・勉強会・講演・ハンズオン) / article(ブログ記事・技術解説・資料公開) / other
+- title: ページのタイトル
+- activity_date: 公開日や実施日を YYYY-MM-DD で（不明なら省略）
+- description: 100-200文字の日本語の要約
+- event_name: connpass 等のイベント名（該当時のみ）
+- like_count / participant_count: 本文から読み取れる場合のみ整数で
+- aws_services: 言及されているAWSサービス名のリスト（例: "Amazon S3", "AWS Lambda"）
+- aws_level: AWS関連の場合のみ "100"(概要) / "200"(ベストプラクティス・基本実装) / "300"(詳細設計・高度な最適化) / "400"(大規模・複合アーキテクチャ)
+- tags: 技術タグのリスト
+- confidence: 上記判定の確信度（0.0〜1.0）
+"""
+
+SUMMARY_SYSTEM_PROMPT = """
+あなたは技術記事・登壇資料の要約アシスタントです。ページ本文から、内容・使われている技術・得られる知見が分かる
+詳細な日本語の要約（summary_by_ai）を作成してください。本文に無い内容は書かないでください。
+"""
+
+
+class ActivityClassification(BaseModel):
+    """小型モデルで判定する分類・短い抽出項目。"""
+    title: str = Field(description="ページのタイトル")
+    activity_type: Literal["presentation", "article", "other"]
+    activity_date: Optional[str] = Field(default=None, description="YYYY-MM-DD")
+    description: str = Field(description="100-200文字の要約")
+    event_name: Optional[str] = None
+    like_count: Optional[int] = None
+    participant_count: Optional[int] = None
+    aws_services: List[str] = Field(default_factory=list)
+    aws_level: Optional[Literal["100", "200", "300", "400"]] = None
+    tags: List[str] = Field(default_factory=list)
+    confidence: float = Field(ge=0.0, le=1.0, description="判定の確信度")
+
+
+class ActivitySummary(BaseModel):
+    """大型モデルで生成する詳細要約。"""
+    summary_by_ai: str = Field(description="詳細な要約")
+
+
+@dataclass
+class ActivityAnalysis:
+    """1ページ分の分析結果。"""
+    url: str
+    classification: ActivityClassification
+    summary: Optional[ActivitySummary] = None
+    decisions: List[RoutingDecision] = field(default_factory=list)
+    total_tokens: int = 0
+
+    def to_fields(self) -> Dict[str, Any]:
+        """activities テーブルに保存する分析由来の項目。"""
+        fields = self.classification.model_dump(exclude={"confidence"}, exclude_none=True)
+        if self.summary:
+            fields["summary_by_ai"] = self.summary.summary_by_ai
+        return fields
+
+
+def page_prompt(page: ScrapedPage) -> str:
+    header = [f"URL: {page.url}"]
+    if page.title:
+        header.append(f"タイトル: {page.title}")
+    if page.published_time:
+        header.append(f"公開日時: {page.published_time}")
+    return "\n".join(header) + "\n\n<本文>\n" + page.markdown + "\n</本文>"
+
+
+class ActivityAnalyzer:
+    """ModelRouter に従って分類・要約を行う。"""
+
+    def __init__(self, router: Optional[ModelRouter] = None, with_summary: bool = True):
+        self.router = router or ModelRouter()
+        self.with_summary = with_summary
+        # 同時に実行するモデル呼び出し数（ANALYSIS_CONCURRENCY、既定 4）
+        self._model_slots = asyncio.Semaphore(int(os.environ.get("ANALYSIS_CONCURRENCY", "4")))
+
+    async def _structured(self, model_id: str, system_prompt: str, output_model: type, prompt: str,
+                          decisions: List[RoutingDecision]) -> Any:
+        """構造化出力で1回呼び出し、使用量を decisions（この呼び出しの判断）に記録して予算に積算する。"""
+        # 履歴を持ち越さないよう、呼び出しごとに使い捨ての Agent を作る
+        agent = Agent(model=model_id, system_prompt=system_prompt, callback_handler=None)
+        async with self._model_slots:
+            # 枠を待つ間に予算を使い切っていることがあるため、枠を取ってから確認する
+            check_budget("activity_pipeline")
+            try:
+                result = await agent.invoke_async(prompt, structured_output_model=output_model)
+            finally:
+                # 検証に失敗した呼び出しの分も数えるため、result.metrics と同じ Agent の累計から取る
+                record_usage(model_id, agent.event_loop_metrics.accumulated_usage, decisions)
+        if result.structured_output is None:
+            raise ValueError(f"構造化出力が得られませんでした（stop_reason={result.stop_reason}）")
+        return result.structured_output
+
+    async def classify(self, page: ScrapedPage, decisions: List[RoutingDecision]) -> ActivityClassification:
+        prompt = page_prompt(page)
+        decision = self.router.for_classification(page.url, page.markdown)
+        decisions.append(decision)
+        classification = await self._structured(
+            decision.model_id, CLASSIFICATION_SYSTEM_PROMPT, ActivityClassification, prompt, [decision]
+        )
+        return await self.escalate_if_uncertain(page, classification, decision.model_id, decisions)
+
+    async def escalate_if_uncertain(self, page: ScrapedPage, classification: ActivityClassification,
+                                    model_id: str, decisions: List[RoutingDecision]) -> ActivityClassification:
+        """確信度が閾値未満なら大型モデルで再判定する。"""
+        escalation = self.router.for_reclassification(page.url, page.markdown, classification.confidence, model_id)
+        if not escalation:
+            return classification
+        decisions.append(escalation)
+        return await self._structured(
+            escalation.model_id, CLASSIFICATION_SYSTEM_PROMPT, ActivityClassification, page_prompt(page), [escalation]
+        )
+
+    async def summarize(self, page: ScrapedPage, decisions: List[RoutingDecision]) -> ActivitySummary:
+        decision = self.router.for_summary(page.url, page.markdown)
+        decisions.append(decision)
+        return await self._structured(
+            decision.model_id, SUMMARY_SYSTEM_PROMPT, ActivitySummary, page_prompt(page), [decision]
+        )
+
+    async def analyze(self, page: ScrapedPage) -> ActivityAnalysis:
+        decisions: List[RoutingDecision] = []
+        # 分類と要約は互いに依存しないため並行に実行する
+        if self.with_summary:
+            classification, summary = await asyncio.gather(
+                self.classify(page, decisions), self.summarize(page, decisions)
+            )
+        else:
+            classification, summary = await self.classify(page, decisions), None
+        return build_analysis(page, classification, summary, decisions)
+
+    async def analyze_many(self, pages: List[ScrapedPage]) -> List[Union[ActivityAnalysis, BaseException]]:
+        """複数ページを分析する（失敗したページは例外を結果として返す）。"""
+        return list(await asyncio.gather(*[self.analyze(page) for page in pages], return_exceptions=True))
+
+
+def record_usage(model_id: str, usage: Dict[str, int], decisions: List[RoutingDecision]) -> None:
+    """1回の呼び出しの使用量を予算に積算し、decisions に記録する（複数件なら等分し、端数は先頭に寄せる）。"""
+    input_tokens, output_tokens = usage.get("inputTokens", 0), usage.get("outputTokens", 0)
+    budget = current_budget()
+    if budget is not None:
+        budget.charge("activity_pipeline", model_id, input_tokens, output_tokens)
+    if not decisions:
+        return
+    (share_in, rest_in), (share_out, rest_out) = divmod(input_tokens, len(decisions)), divmod(output_tokens, len(decisions))
+    for n, decision in enumerate(decisions):
+        decision.input_tokens = (decision.input_tokens or 0) + share_in + (rest_in if n == 0 else 0)
+        decision.output_tokens = (decision.output_tokens or 0) + share_out + (rest_out if n == 0 else 0)
+
+
+def build_analysis(page: ScrapedPage, classification: ActivityClassification, summary: Optional[ActivitySummary],
+                   decisions: List[RoutingDecision]) -> ActivityAnalysis:
+    """ActivityAnalysis を組み立てる（使用トークンは decisions に記録した実際の使用量の合計）。"""
+    return ActivityAnalysis(
+        url=page.url,
+        classification=classification,
+        summary=summary,
+        decisions=decisions,
+        total_tokens=sum((d.input_tokens or 0) + (d.output_tokens or 0) for d in decisions),
+    )
@@ -0,0 +1,166 @@
+"""
+チャンネル履歴のバックフィル（過去分の一括取り込み）。
+
+SlackAgent は最新ページのみを扱うため、過去の履歴は取り込めない。バックフィルは LLM を使わずに
+slack___conversationsHistory のカーソルを1ページずつたどり、各ページを ActivityPipeline で処理する。
+
+- ページごとに processing_history へチェックポイントを書く（status=in_progress、details.mode=backfill）
+- 再開時は最後のチェックポイントの境界 ts（処理済みの最も古いメッセージ）を latest に指定して続きから取得する
+  （Slackのカーソルは期限切れになるため、再開には使わない）
+- メモリに保持するのは1ページ分の投稿とユーザー一覧のみ
+- 中断されたページは再処理されるが、activities は slack_message_id で重複しない
+- MCPエンドポイントの障害で後回し（deferred）になった投稿があるページでは境界を進めずに中断し、次回に再処理する
+
+環境変数:
+- BACKFILL_PAGE_SIZE: 1ページのメッセージ数（既定 SLACK_HISTORY_PAGE_SIZE → 200）
+- BACKFILL_MAX_PAGES: 1回の実行で処理する最大ページ数（既定 0 = 無制限）
+- BACKFILL_OLDEST: これより古いメッセージは取り込まない（Slackの ts または YYYY-MM-DD）
+- SLACK_EXCLUDE_DOMAINS: 収集対象外のドメイン（slack_history.py）
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from agents.pipeline.activity_pipeline import ActivityPipeline
+from agents.pipeline.persistence import SCHEMA, ActivityStore, sql_literal
+from agents.pipeline.slack_history import SlackHistoryReader, to_slack_ts
+
+log = logging.getLogger("slack_backfill")
+
+PROCESS_TYPE = "slack_fetch"
+
+
+@dataclass
+class BackfillCheckpoint:
+    channel: str
+    latest: Optional[str] = None  # 処理済みの最も古いメッセージの ts（次はこれより古いものを取得）
+    pages: int = 0
+    messages: int = 0
+    records: int = 0
+    stored: int = 0
+    failed: int = 0
+    done: bool = False
+
+    def to_details(self) -> Dict[str, Any]:
+        return {"mode": "backfill", **asdict(self)}
+
+
+@dataclass
+class BackfillReport:
+    checkpoint: BackfillCheckpoint
+    pages_this_run: int = 0
+    resumed_from: Optional[str] = None
+    duration_ms: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **asdict(self.checkpoint),
+            "pages_this_run": self.pages_this_run,
+            "resumed_from": self.resumed_from,
+            "duration_ms": self.duration_ms,
+            "errors": self.errors,
+        }
+
+
+class CheckpointStore:
+    """バックフィルのチェックポイントを processing_history に保存する。"""
+
+    def __init__(self, store: ActivityStore):
+        self.store = store
+
+    async def load(self, channel: str) -> Optional[BackfillCheckpoint]:
+        rows = await self.store.query(
+            f"SELECT details FROM {SCHEMA}.processing_history "
+            f"WHERE process_type = {sql_literal(PROCESS_TYPE)} AND slack_channel = {sql_literal(channel)} "
+            f"AND details LIKE '%\"mode\": \"backfill\"%' "
+            f"ORDER BY created_at DESC LIMIT 1"
+        )
+        if not rows:
+            return None
+        details = json.loads(rows[0]["details"])
+        fields = BackfillCheckpoint.__dataclass_fields__
+        return BackfillCheckpoint(**{k: v for k, v in details.items() if k in fields})
+
+    async def save(self, checkpoint: BackfillCheckpoint, error: Optional[str] = None) -> None:
+        status = "failed" if error else ("success" if checkpoint.done else "in_progress")
+        # last_slack_timestamp は増分収集のウォーターマーク用なので、バックフィルでは設定しない
+        await self.store.transact([
+            f"INSERT INTO {SCHEMA}.processing_history "
+            f"(process_type, slack_channel, status, details, error_message) "
+            f"VALUES ({sql_literal(PROCESS_TYPE)}, {sql_literal(checkpoint.channel)}, {sql_literal(status)}, "
+            f"{sql_literal(json.dumps(checkpoint.to_details(), ensure_ascii=False))}, {sql_literal(error)})"
+        ])
+
+
+class SlackHistoryBackfill:
+    """1チャンネルの履歴を古い方へたどり、ページごとにパイプラインで処理する。"""
+
+    def __init__(
+        self,
+        reader: SlackHistoryReader,
+        pipeline: ActivityPipeline,
+        checkpoints: CheckpointStore,
+        max_pages: Optional[int] = None,
+        oldest: Optional[str] = None,
+    ):
+        self.reader = reader
+        self.pipeline = pipeline
+        self.checkpoints = checkpoints
+        self.max_pages = max_pages if max_pages is not None else int(os.environ.get("BACKFILL_MAX_PAGES", "0"))
+        self.oldest = to_slack_ts(oldest or os.environ.get("BACKFILL_OLDEST"))
+
+    async def run(self, channel: str, restart: bool = False) -> BackfillReport:
+        started = time.perf_counter()
+        checkpoint = None if restart else await self.checkpoints.load(channel)
+        if checkpoint is None:
+            checkpoint = BackfillCheckpoint(channel=channel)
+        report = BackfillReport(checkpoint=checkpoint, resumed_from=checkpoint.latest)
+        if checkpoint.done:
+            log.info(f"✅ {channel} のバックフィルは完了済み")
+            return report
+
+        await self.reader.load_users()
+        # 再開時はカーソルではなく境界 ts から取得し直す
+        cursor: Optional[str] = None
+        latest = checkpoint.latest
+        log.info(f"📚 バックフィル開始: {channel}（latest={latest or '最新'}）")
+        while not self.max_pages or report.pages_this_run < self.max_pages:
+            try:
+                messages, cursor = await self.reader.fetch_page(channel, cursor, latest, self.oldest)
+                posts = self.reader.posts_from_messages(channel, messages)
+                outcome = await self.pipeline.run(posts) if posts else None
+                if outcome and outcome.count("deferred"):
+                    raise RuntimeError(f"{outcome.count('deferred')} 件を後回しにしたため、このページから再開します")
+            except Exception as e:
+                log.error(f"❌ バックフィル中断: {channel}: {e}")
+                report.errors.append(str(e))
+                await self.checkpoints.save(checkpoint, error=str(e))
+                break
+
+            checkpoint.pages += 1
+            checkpoint.messages += len(messages)
+            checkpoint.records += len(posts)
+            if outcome:
+                checkpoint.stored += outcome.count("stored")
+                checkpoint.failed += outcome.count("failed")
+            if messages:
+                checkpoint.latest = min((m["ts"] for m in messages if m.get("ts")), key=float, default=checkpoint.latest)
+            checkpoint.done = not cursor
+            report.pages_this_run += 1
+            await self.checkpoints.save(checkpoint)
+            log.info(
+                f"📄 {channel} ページ {checkpoint.pages}: メッセージ {len(messages)} / 投稿 {len(posts)} "
+                f"（境界 ts={checkpoint.latest}）"
+            )
+            if checkpoint.done:
+                log.info(f"🏁 {channel} のバックフィル完了: 保存 {checkpoint.stored} 件")
+                break
+
+        report.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        return report
@@ -0,0 +1,208 @@
+"""
+複数ページをまとめて1回の構造化出力で分類するバッチ分析。
+
+短いページが多数ある場合、URLごとに分類リクエストを送るとシステムプロンプトと呼び出しの
+オーバーヘッドが件数分かかる。コンパクション済みの本文をトークン予算内でまとめて送り、
+URLごとに1件の分類結果を受け取る。
+
+- バッチサイズはトークン予算（本文 + 出力見込み）と最大件数で決まる
+- 長いページ（ModelRouter.is_long_page）はバッチに入れず、従来どおり大型モデルで個別に分類する
+- バッチ全体が失敗したら半分に分けて再試行し、1件になったら個別分類に切り替える
+- 応答に含まれない・URLが一致しない・重複したレコードはその件だけ個別に再分類する
+- 確信度が低い件は個別に大型モデルで再判定する
+
+環境変数:
+- ANALYSIS_BATCH_TOKEN_BUDGET: 1バッチの入力+出力トークン予算（既定 12000、0 でバッチ無効）
+- ANALYSIS_BATCH_MAX_ITEMS: 1バッチの最大件数（既定 8）
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Union
+
+from pydantic import BaseModel, Field
+
+from agents.middleware.compaction import estimate_tokens
+from agents.pipeline.analyzer import (
+    CLASSIFICATION_SYSTEM_PROMPT,
+    ActivityAnalysis,
+    ActivityAnalyzer,
+    ActivityClassification,
+    ActivitySummary,
+    build_analysis,
+    page_prompt,
+)
+from agents.pipeline.model_router import ModelRouter, RoutingDecision
+from agents.pipeline.scraper import ScrapedPage
+from agents.runtime.budget import BudgetExceededError
+
+log = logging.getLogger("batch_analyzer")
+
+# 1件あたりの出力トークン見込み（分類結果のJSON）
+OUTPUT_TOKENS_PER_ITEM = 400
+
+BATCH_SYSTEM_PROMPT = CLASSIFICATION_SYSTEM_PROMPT + """
+<バッチ入力>
+複数のページが <page index="n" url="..."> ... </page> の形式で与えられます。
+ページごとに1件ずつ items に出力し、url には入力の url 属性をそのまま入れてください。
+ページ同士の内容を混ぜないでください。
+"""
+
+
+class BatchClassificationItem(ActivityClassification):
+    url: str = Field(description="入力ページの url 属性（そのまま返す）")
+
+
+class ActivityClassificationBatch(BaseModel):
+    items: List[BatchClassificationItem]
+
+
+def _batch_prompt(pages: List[ScrapedPage]) -> str:
+    blocks = [
+        f'<page index="{i}" url="{page.url}">\n{page_prompt(page)}\n</page>'
+        for i, page in enumerate(pages, start=1)
+    ]
+    return "\n\n".join(blocks)
+
+
+def plan_batches(pages: List[ScrapedPage], token_budget: int, max_items: int) -> List[List[ScrapedPage]]:
+    """ページを入力順にトークン予算・最大件数の範囲で詰めていく。
+
+    予算を1件で超えるページは単独のバッチになる。
+    """
+    batches: List[List[ScrapedPage]] = []
+    current: List[ScrapedPage] = []
+    used = 0
+    for page in pages:
+        cost = estimate_tokens(page_prompt(page)) + OUTPUT_TOKENS_PER_ITEM
+        if current and (used + cost > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(page)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+class BatchActivityAnalyzer(ActivityAnalyzer):
+    """短いページをバッチで分類する ActivityAnalyzer。"""
+
+    def __init__(
+        self,
+        router: Optional[ModelRouter] = None,
+        with_summary: bool = True,
+        token_budget: Optional[int] = None,
+        max_items: Optional[int] = None,
+    ):
+        super().__init__(router, with_summary)
+        self.token_budget = token_budget if token_budget is not None else int(
+            os.environ.get("ANALYSIS_BATCH_TOKEN_BUDGET", "12000")
+        )
+        self.max_items = max_items or int(os.environ.get("ANALYSIS_BATCH_MAX_ITEMS", "8"))
+
+    async def _classify_batch(
+        self, pages: List[ScrapedPage], decisions: Dict[str, List[RoutingDecision]]
+    ) -> Dict[str, ActivityClassification]:
+        """1バッチを分類する。失敗した件は個別分類にフォールバックする。"""
+        if len(pages) == 1:
+            page = pages[0]
+            return {page.url: await self.classify(page, decisions[page.url])}
+
+        for page, decision in zip(pages, self.router.for_batch_classification([(p.url, p.markdown) for p in pages])):
+            decisions[page.url].append(decision)
+        try:
+            batch = await self._structured(
+                self.router.small_model_id, BATCH_SYSTEM_PROMPT, ActivityClassificationBatch, _batch_prompt(pages),
+                [decisions[page.url][-1] for page in pages],
+            )
+        except BudgetExceededError:
+            raise
+        except Exception as e:
+            # 1件の不正な値でバッチ全体の検証が失敗するため、分割して問題の件を切り分ける
+            middle = len(pages) // 2
+            log.warning(f"⚠️ バッチ分類に失敗（{len(pages)}件）、{middle}件/{len(pages) - middle}件に分割して再試行: {e}")
+            halves = await asyncio.gather(
+                self._classify_batch(pages[:middle], decisions), self._classify_batch(pages[middle:], decisions)
+            )
+            return {url: c for half in halves for url, c in half.items()}
+
+        by_url = {page.url: page for page in pages}
+        results: Dict[str, ActivityClassification] = {}
+        for item in batch.items:
+            if item.url not in by_url or item.url in results:
+                log.warning(f"⚠️ バッチ応答に想定外のURL: {item.url}")
+                continue
+            results[item.url] = ActivityClassification(**item.model_dump(exclude={"url"}))
+
+        # 応答から欠けた件は個別に、確信度の低い件は大型モデルで再分類する
+        async def _settle(page: ScrapedPage) -> ActivityClassification:
+            classification = results.get(page.url)
+            if classification is None:
+                log.warning(f"⚠️ バッチ応答に欠落、個別に再分類: {page.url}")
+                return await self.classify(page, decisions[page.url])
+            return await self.escalate_if_uncertain(
+                page, classification, self.router.small_model_id, decisions[page.url]
+            )
+
+        settled = await asyncio.gather(*[_settle(page) for page in pages])
+        return {page.url: c for page, c in zip(pages, settled)}
+
+    async def _classify_all(
+        self, pages: List[ScrapedPage], decisions: Dict[str, List[RoutingDecision]]
+    ) -> Dict[str, Union[ActivityClassification, BaseException]]:
+        long_pages = [p for p in pages if self.router.is_long_page(p.markdown)]
+        short_pages = [p for p in pages if not self.router.is_long_page(p.markdown)]
+        batches = plan_batches(short_pages, self.token_budget, self.max_items)
+        log.info(f"📦 バッチ分類: {len(short_pages)} 件を {len(batches)} バッチ、長いページ {len(long_pages)} 件は個別")
+
+        results: Dict[str, Union[ActivityClassification, BaseException]] = {}
+
+        async def _batch(batch: List[ScrapedPage]) -> None:
+            try:
+                results.update(await self._classify_batch(batch, decisions))
+            except Exception as e:
+                for page in batch:
+                    results.setdefault(page.url, e)
+
+        async def _single(page: ScrapedPage) -> None:
+            try:
+                results[page.url] = await self.classify(page, decisions[page.url])
+            except Exception as e:
+                results[page.url] = e
+
+        await asyncio.gather(*[_batch(b) for b in batches], *[_single(p) for p in long_pages])
+        return results
+
+    async def _summarize_all(
+        self, pages: List[ScrapedPage], decisions: Dict[str, List[RoutingDecision]]
+    ) -> Dict[str, Union[ActivitySummary, BaseException, None]]:
+        if not self.with_summary:
+            return {page.url: None for page in pages}
+        summaries = await asyncio.gather(
+            *[self.summarize(page, decisions[page.url]) for page in pages], return_exceptions=True
+        )
+        return {page.url: s for page, s in zip(pages, summaries)}
+
+    async def analyze_many(self, pages: List[ScrapedPage]) -> List[Union[ActivityAnalysis, BaseException]]:
+        if self.token_budget <= 0 or len(pages) < 2:
+            return await super().analyze_many(pages)
+
+        decisions: Dict[str, List[RoutingDecision]] = {page.url: [] for page in pages}
+        # 要約（大型モデル・URLごと）はバッチ分類と並行に実行する
+        classifications, summaries = await asyncio.gather(
+            self._classify_all(pages, decisions), self._summarize_all(pages, decisions)
+        )
+
+        analyses: List[Union[ActivityAnalysis, BaseException]] = []
+        for page in pages:
+            classification, summary = classifications[page.url], summaries[page.url]
+            if isinstance(classification, BaseException):
+                analyses.append(classification)
+            elif isinstance(summary, BaseException):
+                analyses.append(summary)
+            else:
+                analyses.append(build_analysis(page, classification, summary, decisions[page.url]))
+        return analyses
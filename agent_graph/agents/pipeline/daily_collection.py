@@ -0,0 +1,237 @@
+"""
+期間指定の定期収集（process_type = daily_collection）。
+
+チャットのプロンプトを使わず、指定期間の Slack 履歴を SlackHistoryReader で読み、
+ActivityPipeline で分析・保存する。実行ごとに processing_history に1行を作り、
+in_progress → success / failed と件数・所要時間を記録する。
+MCPエンドポイントの障害で後回し（deferred）になった投稿は details.deferred_items に残し、
+同じ期間を再実行すれば取り込まれる（activities は slack_message_id で重複しない）。
+
+作業キュー（agents/pipeline/work_queue.py）を渡すと、履歴の読み込みは投稿をキューに積むだけになり、
+ワーカープールが並行して分析・保存する。前回の実行でキューに残った項目もこの実行で処理する。
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from agents.pipeline.activity_pipeline import ActivityPipeline, ItemOutcome
+from agents.pipeline.persistence import SCHEMA, ActivityStore, sql_literal
+from agents.pipeline.records import CollectedPost
+from agents.pipeline.slack_history import SlackHistoryReader
+from agents.pipeline.work_queue import WorkerPool, WorkQueue
+
+log = logging.getLogger("daily_collection")
+
+PROCESS_TYPE = "daily_collection"
+
+
+@dataclass
+class ChannelCounts:
+    channel: str
+    pages: int = 0
+    messages: int = 0
+    records: int = 0
+    duplicates: int = 0
+    stored: int = 0
+    failed: int = 0
+    deferred: int = 0
+    duration_ms: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class CollectionSummary:
+    run_id: str
+    since: Optional[str]
+    until: Optional[str]
+    channels: List[ChannelCounts] = field(default_factory=list)
+    deferred_items: List[Dict[str, Any]] = field(default_factory=list)
+    queue: Dict[str, int] = field(default_factory=dict)  # キュー経由のときの実行後の状態別件数
+    status: str = "in_progress"
+    duration_ms: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def stored(self) -> int:
+        return sum(c.stored for c in self.channels)
+
+    @property
+    def failed(self) -> int:
+        return sum(c.failed for c in self.channels)
+
+    @property
+    def deferred(self) -> int:
+        return sum(c.deferred for c in self.channels)
+
+    @property
+    def partial(self) -> bool:
+        return self.failed > 0 or self.deferred > 0 or any(c.error for c in self.channels)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **asdict(self),
+            "totals": {
+                "messages": sum(c.messages for c in self.channels),
+                "records": sum(c.records for c in self.channels),
+                "stored": self.stored,
+                "failed": self.failed,
+                "deferred": self.deferred,
+            },
+        }
+
+
+class RunRecorder:
+    """processing_history に実行行を作り、終了時に更新する。"""
+
+    def __init__(self, store: ActivityStore):
+        self.store = store
+
+    async def start(self, summary: CollectionSummary) -> None:
+        details = {"since": summary.since, "until": summary.until, "channels": [c.channel for c in summary.channels]}
+        await self.store.transact([
+            f"INSERT INTO {SCHEMA}.processing_history (history_id, process_type, status, details) "
+            f"VALUES ({sql_literal(summary.run_id)}, {sql_literal(PROCESS_TYPE)}, 'in_progress', "
+            f"{sql_literal(json.dumps(details, ensure_ascii=False))})"
+        ])
+
+    async def finish(self, summary: CollectionSummary) -> None:
+        latest = f"to_timestamp({float(summary.until)})" if summary.until and summary.status == "success" and not summary.deferred else "NULL"
+        await self.store.transact([
+            f"UPDATE {SCHEMA}.processing_history SET "
+            f"status = {sql_literal(summary.status)}, "
+            f"details = {sql_literal(json.dumps(summary.to_dict(), ensure_ascii=False))}, "
+            f"error_message = {sql_literal(summary.error)}, "
+            f"last_slack_timestamp = {latest}, "
+            f"last_processed_at = CURRENT_TIMESTAMP "
+            f"WHERE history_id = {sql_literal(summary.run_id)}"
+        ])
+
+
+class DailyCollection:
+    """指定期間・指定チャンネルの収集を1回実行する。"""
+
+    def __init__(self, reader: SlackHistoryReader, pipeline: ActivityPipeline, recorder: Optional[RunRecorder] = None,
+                 queue: Optional[WorkQueue] = None, workers: Optional[int] = None):
+        self.reader = reader
+        self.pipeline = pipeline
+        self.recorder = recorder
+        self.queue = queue
+        self.workers = workers
+
+    @staticmethod
+    def _tally(summary: CollectionSummary, counts: ChannelCounts, items: Iterable[ItemOutcome]) -> None:
+        for item in items:
+            if item.status in ("stored", "failed", "deferred"):
+                setattr(counts, item.status, getattr(counts, item.status) + 1)
+            if item.status == "deferred":
+                summary.deferred_items.append(
+                    {"channel": counts.channel, "slack_message_id": item.slack_message_id, "url": item.url}
+                )
+
+    async def _collect_channel(self, summary: CollectionSummary, counts: ChannelCounts, since: Optional[str],
+                               until: Optional[str], seen: Set[Tuple[str, str]]) -> None:
+        started = time.perf_counter()
+        try:
+            async for messages, posts in self.reader.iter_pages(counts.channel, oldest=since, latest=until):
+                counts.pages += 1
+                counts.messages += len(messages)
+                # 同じ投稿者・同じURLはチャンネルをまたいで1件に絞る
+                fresh = []
+                for post in posts:
+                    key = (post.slack_user_id, post.url_key)
+                    if key in seen:
+                        counts.duplicates += 1
+                        continue
+                    seen.add(key)
+                    fresh.append(post)
+                if self.queue:
+                    # 以前の実行で積んだ項目は積み直さない（未完了ならワーカーが処理する）
+                    queued = self.queue.enqueue(fresh)
+                    counts.duplicates += len(fresh) - queued
+                    counts.records += queued
+                    continue
+                counts.records += len(fresh)
+                if fresh:
+                    report = await self.pipeline.run(fresh)
+                    self._tally(summary, counts, report.items)
+        except Exception as e:
+            log.error(f"❌ チャンネル {counts.channel} の収集に失敗: {e}")
+            counts.error = str(e)
+        counts.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    async def _collect_queued(self, summary: CollectionSummary, since: Optional[str], until: Optional[str],
+                              seen: Set[Tuple[str, str]]) -> None:
+        """履歴を読んでキューに積みながら、ワーカープールで並行に処理する。"""
+        producer_done = asyncio.Event()
+        # item_key → (投稿, 最後の処理結果)。同じ実行内で再試行した項目は最後の結果で上書きする
+        outcomes: Dict[str, Tuple[CollectedPost, ItemOutcome]] = {}
+
+        def keep(key: str, post: CollectedPost, outcome: ItemOutcome) -> None:
+            outcomes[key] = (post, outcome)
+
+        pool = WorkerPool(self.queue, self.pipeline, workers=self.workers, on_outcome=keep)
+        workers = asyncio.ensure_future(pool.run(producer_done))
+        try:
+            for counts in summary.channels:
+                await self._collect_channel(summary, counts, since, until, seen)
+        except BaseException:
+            # 処理中の項目はリースが切れたあと次の実行で取り出される
+            workers.cancel()
+            raise
+        finally:
+            producer_done.set()
+        await workers
+
+        by_channel = {c.channel: c for c in summary.channels}
+        for post, item in outcomes.values():
+            channel = post.slack_channel or ""
+            if channel not in by_channel:
+                # 前回の実行でキューに残っていた別チャンネルの項目
+                by_channel[channel] = ChannelCounts(channel=channel)
+                summary.channels.append(by_channel[channel])
+            self._tally(summary, by_channel[channel], [item])
+        summary.queue = self.queue.stats()
+
+    async def run(self, channels: List[str], since: Optional[str], until: Optional[str]) -> CollectionSummary:
+        started = time.perf_counter()
+        summary = CollectionSummary(
+            run_id=str(uuid.uuid4()), since=since, until=until,
+            channels=[ChannelCounts(channel=c) for c in channels],
+        )
+        if self.recorder:
+            await self.recorder.start(summary)
+
+        log.info(f"🗓️ 定期収集を開始: {channels}（{since} 〜 {until or '現在'}）")
+        seen: Set[Tuple[str, str]] = set()
+        try:
+            if self.queue:
+                await self._collect_queued(summary, since, until, seen)
+            else:
+                # チャンネルは順に処理する（メモリは1ページ分に収まる）
+                for counts in summary.channels:
+                    await self._collect_channel(summary, counts, since, until, seen)
+            if all(c.error for c in summary.channels):
+                summary.status, summary.error = "failed", "全チャンネルの収集に失敗しました"
+            else:
+                summary.status = "success"
+        except BaseException as e:
+            summary.status, summary.error = "failed", str(e) or type(e).__name__
+            raise
+        finally:
+            summary.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            if self.recorder:
+                try:
+                    await self.recorder.finish(summary)
+                except Exception as e:
+                    log.error(f"❌ 実行結果を processing_history に記録できません: {e}")
+            log.info(
+                f"🏁 定期収集 {summary.status}: 保存 {summary.stored} / 失敗 {summary.failed} / 後回し {summary.deferred} "
+                f"（{summary.duration_ms:.0f}ms）"
+            )
+        return summary
@@ -0,0 +1,151 @@
+"""
+URL単位の処理台帳（output_history.processing_items）。
+
+パイプラインは1件（チャンネル・メッセージ・URL）ごとに到達したステージと成果物を記録する。
+
+- collected → scraped（本文のハッシュ）→ analyzed（分析結果のJSON）→ stored
+- 失敗は status=failed（attempts を加算）、エンドポイント障害による後回しは status=deferred
+- 再実行時は stored の項目を飛ばし、analyzed の項目は分析結果からそのまま保存する
+- グラフが途中で失敗しても、未完了の項目は次回の実行で台帳から取り出して再開できる（pending）
+
+台帳への書き込みに失敗してもパイプラインは止めない（警告のみ）。
+
+環境変数:
+- PROCESSING_LEDGER: true(既定) / false
+- LEDGER_MAX_ATTEMPTS: これ以上失敗した項目は再開しない（既定 3）
+- LEDGER_RESUME_LIMIT: 1回の実行で台帳から再開する最大件数（既定 50）
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+from agents.pipeline.persistence import SCHEMA, ActivityStore, sql_literal
+from agents.pipeline.records import CollectedPost
+
+log = logging.getLogger("processing_ledger")
+
+TABLE = f"{SCHEMA}.processing_items"
+STAGES = ("collected", "scraped", "analyzed", "stored")
+_COLUMNS = ("slack_channel", "slack_message_id", "url", "stage", "status", "post",
+            "content_key", "analysis", "attempts", "error_message")
+
+
+def processing_ledger_enabled() -> bool:
+    return os.environ.get("PROCESSING_LEDGER", "true").lower() != "false"
+
+
+@dataclass
+class LedgerEntry:
+    post: CollectedPost
+    stage: str = "collected"
+    status: str = "in_progress"  # in_progress / success / failed / deferred
+    content_key: Optional[str] = None
+    analysis: Optional[Dict[str, Any]] = None
+    attempts: int = 0
+    error: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        return self.post.item_key
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "LedgerEntry":
+        return cls(
+            post=CollectedPost.from_dict(json.loads(row["post"])),
+            stage=row["stage"],
+            status=row["status"],
+            content_key=row.get("content_key"),
+            analysis=json.loads(row["analysis"]) if row.get("analysis") else None,
+            attempts=int(row.get("attempts") or 0),
+            error=row.get("error_message"),
+        )
+
+    def values_sql(self) -> str:
+        values = (
+            self.post.slack_channel or "",
+            self.post.slack_message_id or "",
+            self.post.url,
+            self.stage,
+            self.status,
+            json.dumps(self.post.to_dict(), ensure_ascii=False),
+            self.content_key,
+            json.dumps(self.analysis, ensure_ascii=False) if self.analysis is not None else None,
+            1 if self.status == "failed" else 0,
+            self.error[:1000] if self.error else None,
+        )
+        return "(" + ", ".join(sql_literal(v) for v in values) + ")"
+
+
+class ProcessingLedger:
+    """processing_items への読み書き。"""
+
+    def __init__(self, store: ActivityStore, batch_size: int = 50):
+        self.store = store
+        self.batch_size = batch_size
+        self.max_attempts = int(os.environ.get("LEDGER_MAX_ATTEMPTS", "3"))
+        self.resume_limit = int(os.environ.get("LEDGER_RESUME_LIMIT", "50"))
+
+    async def load(self, posts: List[CollectedPost]) -> Dict[str, LedgerEntry]:
+        """posts に対応する台帳の行を item_key ごとに返す（読めなければ空）。"""
+        wanted = {post.item_key for post in posts}
+        message_ids = sorted({post.slack_message_id or "" for post in posts})
+        entries: Dict[str, LedgerEntry] = {}
+        try:
+            for start in range(0, len(message_ids), self.batch_size):
+                chunk = message_ids[start:start + self.batch_size]
+                rows = await self.store.query(
+                    f"SELECT {', '.join(_COLUMNS)} FROM {TABLE} "
+                    f"WHERE slack_message_id IN ({', '.join(sql_literal(m) for m in chunk)})"
+                )
+                for row in rows:
+                    entry = LedgerEntry.from_row(row)
+                    if entry.key in wanted:
+                        entries[entry.key] = entry
+        except Exception as e:
+            log.warning(f"⚠️ 処理台帳を読み込めません（台帳なしで続行）: {e}")
+            return {}
+        return entries
+
+    async def pending(self, exclude: Iterable[str] = ()) -> List[CollectedPost]:
+        """前回までに完了しなかった項目の収集レコードを古い順に返す。"""
+        excluded = set(exclude)
+        try:
+            rows = await self.store.query(
+                f"SELECT post FROM {TABLE} "
+                f"WHERE status IN ('in_progress', 'failed', 'deferred') AND attempts < {int(self.max_attempts)} "
+                f"ORDER BY updated_at LIMIT {int(self.resume_limit)}"
+            )
+        except Exception as e:
+            log.warning(f"⚠️ 処理台帳から未完了の項目を取得できません: {e}")
+            return []
+        posts = [CollectedPost.from_dict(json.loads(row["post"])) for row in rows]
+        posts = [post for post in posts if post.item_key not in excluded]
+        if posts:
+            log.info(f"♻️ 処理台帳から未完了の {len(posts)} 件を再開します")
+        return posts
+
+    async def record(self, entries: List[LedgerEntry]) -> None:
+        """到達したステージを UPSERT する（成果物は新しい値があるときだけ上書きする）。"""
+        # 1つの INSERT で同じキーを2回更新できないため、キーごとに最後の状態だけを書く
+        entries = list({entry.key: entry for entry in entries}.values())
+        for start in range(0, len(entries), self.batch_size):
+            chunk = entries[start:start + self.batch_size]
+            sql = (
+                f"INSERT INTO {TABLE} ({', '.join(_COLUMNS)}) "
+                f"VALUES {', '.join(entry.values_sql() for entry in chunk)} "
+                f"ON CONFLICT (slack_channel, slack_message_id, url) DO UPDATE SET "
+                f"stage = EXCLUDED.stage, status = EXCLUDED.status, "
+                f"content_key = COALESCE(EXCLUDED.content_key, {TABLE}.content_key), "
+                f"analysis = COALESCE(EXCLUDED.analysis, {TABLE}.analysis), "
+                f"attempts = {TABLE}.attempts + EXCLUDED.attempts, "
+                f"error_message = EXCLUDED.error_message, "
+                f"updated_at = CURRENT_TIMESTAMP"
+            )
+            try:
+                await self.store.transact([sql])
+            except Exception as e:
+                log.warning(f"⚠️ 処理台帳に記録できません（{len(chunk)} 件）: {e}")
@@ -0,0 +1,111 @@
+"""
+活動分析ステージのモデルルーティング。
+
+- 分類（activity_type / aws_level / tags 等）と短い description の抽出は小型・高速モデル
+- summary_by_ai の生成、確信度が低い分類の再判定、長いページの分類は大型モデル
+
+すべての判断を RoutingDecision として記録し、レスポンスの metadata.routing に含める。
+判断を読み出さない常駐プロセス（イベント取り込みなど）では keep_decisions=False にして記録せず、ログだけ残す。
+
+環境変数:
+- ANALYSIS_SMALL_MODEL_ID: 小型モデル（既定 Claude Haiku 4.5）
+- ANALYSIS_LARGE_MODEL_ID: 大型モデル（既定 FIRECRAWL_AGENT_MODEL_ID → Claude Sonnet 4.5）
+- ROUTING_CONFIDENCE_THRESHOLD: これ未満の確信度は大型モデルで再判定（既定 0.7）
+- ROUTING_LONG_PAGE_TOKENS: これを超えるページは最初から大型モデルで分類（既定 3000）
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from agents.middleware.compaction import estimate_tokens
+
+log = logging.getLogger("model_router")
+
+DEFAULT_SMALL_MODEL_ID = "us.anthropic.claude-haiku-4-5-20251001-v1:0"
+DEFAULT_LARGE_MODEL_ID = "us.anthropic.claude-sonnet-4-5-20250929-v1:0"
+
+
+@dataclass
+class RoutingDecision:
+    url: str
+    task: str  # classification / summary / reclassification
+    model_id: str
+    reason: str
+    page_tokens: int = 0
+    confidence: Optional[float] = None
+    # モデル呼び出しの実際の使用量（バッチ分類は件数で等分する。呼び出し前は None）
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: v for k, v in asdict(self).items() if v is not None}
+
+
+class ModelRouter:
+    """タスク・ページ長・確信度からモデルを選び、判断を記録する。"""
+
+    def __init__(
+        self,
+        small_model_id: Optional[str] = None,
+        large_model_id: Optional[str] = None,
+        confidence_threshold: Optional[float] = None,
+        long_page_tokens: Optional[int] = None,
+        keep_decisions: bool = True,
+    ):
+        self.small_model_id = small_model_id or os.environ.get("ANALYSIS_SMALL_MODEL_ID", DEFAULT_SMALL_MODEL_ID)
+        self.large_model_id = large_model_id or os.environ.get(
+            "ANALYSIS_LARGE_MODEL_ID", os.environ.get("FIRECRAWL_AGENT_MODEL_ID", DEFAULT_LARGE_MODEL_ID)
+        )
+        self.confidence_threshold = confidence_threshold if confidence_threshold is not None else float(
+            os.environ.get("ROUTING_CONFIDENCE_THRESHOLD", "0.7")
+        )
+        self.long_page_tokens = long_page_tokens or int(os.environ.get("ROUTING_LONG_PAGE_TOKENS", "3000"))
+        self.keep_decisions = keep_decisions
+        self._lock = threading.Lock()
+        self.decisions: List[RoutingDecision] = []
+
+    def _record(self, decision: RoutingDecision) -> RoutingDecision:
+        if self.keep_decisions:
+            with self._lock:
+                self.decisions.append(decision)
+        log.info(f"🧭 {decision.task}: {decision.url} → {decision.model_id} ({decision.reason})")
+        return decision
+
+    def is_long_page(self, markdown: str) -> bool:
+        return estimate_tokens(markdown) > self.long_page_tokens
+
+    def for_classification(self, url: str, markdown: str) -> RoutingDecision:
+        tokens = estimate_tokens(markdown)
+        if tokens > self.long_page_tokens:
+            return self._record(RoutingDecision(url, "classification", self.large_model_id, "long_page", tokens))
+        return self._record(RoutingDecision(url, "classification", self.small_model_id, "default_small", tokens))
+
+    def for_reclassification(self, url: str, markdown: str, confidence: float,
+                             previous_model_id: str) -> Optional[RoutingDecision]:
+        """確信度が閾値未満なら大型モデルでの再判定を返す（既に大型モデルなら None）。"""
+        if confidence >= self.confidence_threshold or previous_model_id == self.large_model_id:
+            return None
+        return self._record(RoutingDecision(
+            url, "reclassification", self.large_model_id, "low_confidence",
+            estimate_tokens(markdown), confidence,
+        ))
+
+    def for_batch_classification(self, pages: List[Tuple[str, str]]) -> List[RoutingDecision]:
+        """短いページをまとめて小型モデルで分類する判断を、URLごとに記録する。"""
+        return [
+            self._record(RoutingDecision(url, "classification", self.small_model_id,
+                                         f"batch_of_{len(pages)}", estimate_tokens(markdown)))
+            for url, markdown in pages
+        ]
+
+    def for_summary(self, url: str, markdown: str) -> RoutingDecision:
+        return self._record(RoutingDecision(url, "summary", self.large_model_id, "summary_by_ai",
+                                            estimate_tokens(markdown)))
+
+    def report(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [d.to_dict() for d in self.decisions]
@@ -0,0 +1,214 @@
+"""
+複数チャンネルの並行収集ノード。
+
+チャンネルごとに SlackAgent を作り、共有のレート制限の下で並行に実行する。
+各エージェントの JSONL を統合・重複除去し、後段ノードには単一チャンネル時と同じ形式で渡す。
+
+- チャンネルごとのウォーターマーク（WatermarkStore）から oldest を決める
+- ウォーターマークは後段（分析・保存）が終わってから commit_watermarks() で進める。
+  保存まで終わっていない項目があれば、その項目より前のメッセージまでにとどめる
+- oldest を指定した収集は、HistoryCoverageTap で履歴を最後のページまで読んだことを確かめ、
+  読み切れていなければウォーターマークを進めない（Slack は新しい順に返すため、残りは古い側にある）
+- 収集に失敗したチャンネルは failed 行として記録し、ウォーターマークは進めない
+- 同時に実行するエージェント数は SLACK_CHANNEL_CONCURRENCY（既定 4）
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from strands import Agent
+from strands.agent.agent_result import AgentResult
+from strands.multiagent.base import MultiAgentBase, MultiAgentResult, NodeResult, Status
+from strands.telemetry.metrics import EventLoopMetrics
+
+from strands.tools.mcp.mcp_types import MCPToolResult
+
+from agents.middleware.mcp_middleware import MCPToolMiddleware, ToolCall, ToolCallHandler, run_sync, tool_result_text
+from agents.pipeline.activity_pipeline_node import task_text
+from agents.pipeline.records import CollectedPost, merge_collected_posts, parse_collected_posts, to_jsonl
+from agents.pipeline.slack_history import HISTORY_TOOL_NAME, SlackHistoryReader
+from agents.pipeline.watermarks import WatermarkStore
+
+log = logging.getLogger("multi_channel_collector")
+
+NODE_NAME = "slack_agent"
+
+# (channel, oldest) → SlackAgent
+AgentBuilder = Callable[[str, Optional[str]], Agent]
+
+
+@dataclass
+class ChannelOutcome:
+    channel: str
+    oldest: Optional[str] = None
+    records: int = 0
+    latest_ts: Optional[str] = None
+    tokens: int = 0
+    duration_ms: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class CollectionReport:
+    channels: List[ChannelOutcome] = field(default_factory=list)
+    merged_records: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"merged_records": self.merged_records, "channels": [asdict(c) for c in self.channels]}
+
+
+def _message_ts(post: CollectedPost) -> Optional[str]:
+    return post.slack_message_id.split("#")[0] if post.slack_message_id else None
+
+
+def _latest_ts(posts: List[CollectedPost]) -> Optional[str]:
+    stamps = [ts for ts in map(_message_ts, posts) if ts]
+    return max(stamps, key=float, default=None) if stamps else None
+
+
+def _safe_ts(posts: List[CollectedPost], unfinished_urls: Set[str]) -> Optional[str]:
+    """未完了の項目より前のメッセージのうち最新の ts（未完了がなければ最新の ts）。"""
+    blocked = [ts for ts in (_message_ts(p) for p in posts if p.url in unfinished_urls) if ts]
+    if not blocked:
+        return _latest_ts(posts)
+    first_blocked = min(blocked, key=float)
+    return _latest_ts([p for p in posts if _message_ts(p) and float(_message_ts(p)) < float(first_blocked)])
+
+
+class HistoryCoverageTap(MCPToolMiddleware):
+    """oldest を指定した conversationsHistory を、チャンネルごとに最後のページまで読んだかを記録する。"""
+
+    def __init__(self) -> None:
+        self.read_to_end: Set[str] = set()
+
+    async def __call__(self, call: ToolCall, call_next: ToolCallHandler) -> MCPToolResult:
+        result = await call_next(call)
+        arguments = call.arguments or {}
+        if call.name != HISTORY_TOOL_NAME or not arguments.get("oldest") or result.get("status") == "error":
+            return result
+        try:
+            payload = json.loads(tool_result_text(result))
+        except json.JSONDecodeError:
+            return result
+        # ok:false（not_in_channel・ratelimited 等）はカーソルがなくても読み切ったことにはならない
+        if isinstance(payload, dict) and payload.get("ok") is not False and not SlackHistoryReader._next_cursor(payload):
+            self.read_to_end.add(arguments.get("channel"))
+        return result
+
+
+class MultiChannelCollector(MultiAgentBase):
+    """チャンネルごとの SlackAgent を並行実行し、結果を統合するグラフノード。"""
+
+    def __init__(
+        self,
+        build_agent: AgentBuilder,
+        channels: List[str],
+        watermarks: Optional[WatermarkStore] = None,
+        concurrency: Optional[int] = None,
+        coverage: Optional[HistoryCoverageTap] = None,
+    ):
+        super().__init__()
+        self.build_agent = build_agent
+        self.channels = channels
+        self.watermarks = watermarks
+        self.concurrency = concurrency or int(os.environ.get("SLACK_CHANNEL_CONCURRENCY", "4"))
+        self.coverage = coverage
+        self.last_report: Optional[CollectionReport] = None
+        # 後段が終わるまで進めないウォーターマーク（チャンネル → (結果, 収集した投稿)）
+        self._pending: Dict[str, Tuple[ChannelOutcome, List[CollectedPost]]] = {}
+
+    async def _collect(self, channel: str, oldest: Optional[str], task: str,
+                       semaphore: asyncio.Semaphore) -> tuple:
+        outcome = ChannelOutcome(channel=channel, oldest=oldest)
+        posts: List[CollectedPost] = []
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                result = await self.build_agent(channel, oldest).invoke_async(task)
+                posts = parse_collected_posts(str(result))
+                for post in posts:
+                    post.slack_channel = post.slack_channel or channel
+                outcome.records = len(posts)
+                outcome.latest_ts = _latest_ts(posts)
+                outcome.tokens = result.metrics.accumulated_usage.get("totalTokens", 0)
+            except Exception as e:
+                log.error(f"❌ チャンネル {channel} の収集に失敗: {e}")
+                outcome.error = str(e)
+            outcome.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        if self.watermarks:
+            if outcome.error:
+                await self.watermarks.save(channel, None, 0, error=outcome.error)
+            else:
+                self._pending[channel] = (outcome, posts)
+        return outcome, posts
+
+    async def commit_watermarks(self, unfinished_urls: Optional[Set[str]] = None,
+                                error: Optional[str] = None) -> None:
+        """後段の結果を受けて、収集に成功したチャンネルのウォーターマークを進める。
+
+        Args:
+            unfinished_urls: 保存まで終わらなかった項目のURL（これより前のメッセージまでにとどめる）
+            error: 後段が完了しなかった理由（指定時はどのチャンネルも進めない）
+        """
+        pending, self._pending = self._pending, {}
+        for channel, (outcome, posts) in pending.items():
+            reason = error
+            if reason is None and outcome.oldest and self.coverage is not None \
+                    and channel not in self.coverage.read_to_end:
+                reason = "oldest 以降の履歴を最後のページまで読めていません"
+            if reason is not None:
+                await self.watermarks.save(channel, None, outcome.records, error=reason)
+                continue
+            latest = _safe_ts(posts, unfinished_urls or set())
+            if latest != outcome.latest_ts:
+                log.info(f"🔖 {channel}: 保存まで終わっていない項目があるため、ウォーターマークを {latest} までにとどめます")
+            await self.watermarks.save(channel, latest, outcome.records,
+                                       details={"collected_latest_ts": outcome.latest_ts})
+
+    async def invoke_async(self, task: Any, invocation_state: Optional[dict] = None, **kwargs: Any) -> MultiAgentResult:
+        started = time.perf_counter()
+        text = task_text(task)
+        marks = await self.watermarks.load(self.channels) if self.watermarks else {}
+        self._pending = {}
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        collected = await asyncio.gather(*[
+            self._collect(channel, marks.get(channel), text, semaphore) for channel in self.channels
+        ])
+        report = CollectionReport(channels=[outcome for outcome, _ in collected])
+        merged = merge_collected_posts([posts for _, posts in collected])
+        report.merged_records = len(merged)
+        self.last_report = report
+
+        failed = [c.channel for c in report.channels if c.error]
+        if failed and len(failed) == len(self.channels):
+            raise RuntimeError(f"全チャンネルの収集に失敗しました: {failed}")
+
+        total_tokens = sum(c.tokens for c in report.channels)
+        usage = {"inputTokens": 0, "outputTokens": 0, "totalTokens": total_tokens}
+        agent_result = AgentResult(
+            stop_reason="end_turn",
+            message={"role": "assistant", "content": [{"text": to_jsonl(merged)}]},
+            metrics=EventLoopMetrics(),
+            state={},
+        )
+        execution_time = int((time.perf_counter() - started) * 1000)
+        node_result = NodeResult(
+            result=agent_result, execution_time=execution_time, status=Status.COMPLETED, accumulated_usage=usage,
+        )
+        return MultiAgentResult(
+            status=Status.COMPLETED,
+            results={NODE_NAME: node_result},
+            accumulated_usage=usage,
+            execution_time=execution_time,
+        )
+
+    def __call__(self, task: Any, invocation_state: Optional[dict] = None, **kwargs: Any) -> MultiAgentResult:
+        return run_sync(self.invoke_async(task, invocation_state, **kwargs))
@@ -0,0 +1,201 @@
+"""
+本文の近似重複の検出（SimHash の指紋と、ローカルファイルの索引）。
+
+同じ記事を Qiita・Zenn・個人ブログに投稿すると、正規化したURL（url_canonical.py）も本文のハッシュ
+（analysis_cache.content_key）も異なるため、それぞれスクレイプ・分析・保存される。
+分析の前に本文の SimHash（64bit）を索引と照合し、ほぼ同じ本文の分析結果を再利用する。
+
+- 指紋: 記号・空白・URLを除いた本文の文字 NEAR_DUP_SHINGLE_CHARS 個ずつの連なり（shingle）を
+  blake2b（64bit）でハッシュし、ビットごとの多数決で 64bit にする（日本語も分かち書きなしで扱える）
+- 照合: 指紋を 16bit ずつ 4 つの帯に分け、帯ごとに「ハミング距離 NEAR_DUP_MAX_DISTANCE // 4 以内の値」の
+  バケットを引いた候補だけハミング距離を計算する（距離 NEAR_DUP_MAX_DISTANCE 以下なら近似重複）。
+  距離 d の2つの指紋は、いずれかの帯の距離が d // 4 以下になるため取りこぼさない。
+  数%の編集・前後の定型文の違いがある転載は、距離の中央値が 7 前後でほとんどが 12 以下になる
+  （benchmarks/near_duplicate_check.py）。無関係な記事はおおむね 15 以上離れる
+- 索引ファイル: ヘッダーの後に（指紋 8 バイト + content_key 32 バイト）を追記していく固定長の
+  レコード列。起動時に1回の読み込みでメモリに載せる。上限を超えたら新しい半分で書き直す
+
+近似重複と判定したページは、索引にある元ページの content_key で分析結果キャッシュを引き、
+元ページのURLを duplicate_of として保存する（activities.duplicate_of）。
+
+環境変数:
+- NEAR_DUP_ENABLED: false で近似重複を検出しない（既定 true。分析結果キャッシュが無効なら使わない）
+- NEAR_DUP_INDEX_PATH: 索引ファイルのパス（既定 .cache/near_duplicate.idx）
+- NEAR_DUP_MAX_DISTANCE: 近似重複とみなすハミング距離（既定 12、0〜15。下げると誤判定は減るが見逃しが増える）
+- NEAR_DUP_SHINGLE_CHARS: shingle の文字数（既定 5）
+- NEAR_DUP_MIN_CHARS: 照合する本文の最小文字数（正規化後、既定 400。短い本文は誤判定しやすい）
+- NEAR_DUP_MAX_ENTRIES: 索引に残す指紋の上限（既定 100000）
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import struct
+import threading
+from itertools import combinations
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger("near_duplicate")
+
+DEFAULT_INDEX_PATH = ".cache/near_duplicate.idx"
+_MAGIC = b"SHNDUP01"
+_RECORD = struct.Struct("<Q32s")  # 指紋, content_key（sha256）
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+# 帯ごとに引く近傍の半径の上限（半径 3 で帯あたり 697 バケット）
+_MAX_PROBE_RADIUS = 3
+
+_URL = re.compile(r"https?://\S+")
+_NON_WORD = re.compile(r"[\W_]+")
+# バイト値 → そのビットが立っていれば 1（ビットごとの多数決を bytes.translate で数えるため）
+_BIT_TABLES = [bytes((value >> bit) & 1 for value in range(256)) for bit in range(8)]
+
+
+def near_duplicate_enabled() -> bool:
+    return os.environ.get("NEAR_DUP_ENABLED", "true").lower() != "false"
+
+
+def normalize_text(markdown: str) -> str:
+    """サイトごとに変わるURL・記号・空白を除き、小文字にする。"""
+    return _NON_WORD.sub("", _URL.sub(" ", markdown or "")).lower()
+
+
+def simhash(text: str, shingle_chars: int = 5) -> int:
+    """正規化済みの text の 64bit SimHash（shingle の重複は1回と数える）。"""
+    shingles = {text[i:i + shingle_chars] for i in range(max(len(text) - shingle_chars + 1, 1))}
+    digests = b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles)
+    half = len(shingles) / 2
+    fingerprint = 0
+    for byte_index in range(8):
+        column = digests[byte_index::8]
+        for bit, table in enumerate(_BIT_TABLES):
+            if column.translate(table).count(1) > half:
+                fingerprint |= 1 << (byte_index * 8 + bit)
+    return fingerprint
+
+
+def _bands(fingerprint: int) -> List[Tuple[int, int]]:
+    mask = (1 << _BAND_BITS) - 1
+    return [(band, (fingerprint >> (band * _BAND_BITS)) & mask) for band in range(_BANDS)]
+
+
+def _probe_masks(radius: int) -> List[int]:
+    """帯の値に XOR して、ハミング距離 radius 以内の値をすべて作るマスク。"""
+    return [
+        sum(1 << bit for bit in bits)
+        for r in range(radius + 1) for bits in combinations(range(_BAND_BITS), r)
+    ]
+
+
+class NearDuplicateIndex:
+    """SimHash の指紋 → content_key の索引（ファイルに追記して永続化する）。"""
+
+    def __init__(self, path: Optional[str] = None, max_distance: Optional[int] = None,
+                 shingle_chars: Optional[int] = None, min_chars: Optional[int] = None,
+                 max_entries: Optional[int] = None):
+        self.path = Path(path or os.environ.get("NEAR_DUP_INDEX_PATH", DEFAULT_INDEX_PATH))
+        distance = max_distance if max_distance is not None else int(os.environ.get("NEAR_DUP_MAX_DISTANCE", "12"))
+        # 帯の近傍を引く半径（max_distance // 帯数）が大きいほど候補が増えるため、半径 3 までにする
+        self.max_distance = min(max(distance, 0), _BANDS * (_MAX_PROBE_RADIUS + 1) - 1)
+        self._probe = _probe_masks(self.max_distance // _BANDS)
+        self.shingle_chars = shingle_chars or int(os.environ.get("NEAR_DUP_SHINGLE_CHARS", "5"))
+        self.min_chars = min_chars if min_chars is not None else int(os.environ.get("NEAR_DUP_MIN_CHARS", "400"))
+        self.max_entries = max_entries or int(os.environ.get("NEAR_DUP_MAX_ENTRIES", "100000"))
+        self._lock = threading.Lock()
+        self._fingerprints: List[int] = []
+        self._keys: List[bytes] = []
+        self._buckets: Dict[Tuple[int, int], List[int]] = {}
+        self.hits = 0
+        self.lookups = 0
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            data = self.path.read_bytes()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            log.warning(f"⚠️ 近似重複の索引を読めないため空で始めます: {e}")
+            return
+        if not data.startswith(_MAGIC):
+            log.warning(f"⚠️ 近似重複の索引の形式が異なるため空で始めます: {self.path}")
+            return
+        body = data[len(_MAGIC):]
+        # 書き込み途中で止まった末尾の不完全なレコードは捨てる
+        body = body[:len(body) - len(body) % _RECORD.size]
+        for fingerprint, key in _RECORD.iter_unpack(body):
+            self._insert(fingerprint, key)
+        log.info(f"🧬 近似重複の索引を読み込み: {len(self._fingerprints)} 件（{self.path}）")
+
+    def _insert(self, fingerprint: int, key: bytes) -> None:
+        position = len(self._fingerprints)
+        self._fingerprints.append(fingerprint)
+        self._keys.append(key)
+        for band in _bands(fingerprint):
+            self._buckets.setdefault(band, []).append(position)
+
+    def fingerprint(self, markdown: str) -> Optional[int]:
+        """本文の指紋（正規化後の本文が NEAR_DUP_MIN_CHARS 未満なら None）。"""
+        text = normalize_text(markdown)
+        if len(text) < max(self.min_chars, self.shingle_chars):
+            return None
+        return simhash(text, self.shingle_chars)
+
+    def similar(self, a: int, b: int) -> bool:
+        return (a ^ b).bit_count() <= self.max_distance
+
+    def find(self, fingerprint: int) -> Optional[Tuple[str, int]]:
+        """最も近い登録済みの (content_key, ハミング距離)。max_distance を超えるものしかなければ None。"""
+        with self._lock:
+            self.lookups += 1
+            best: Optional[Tuple[int, int]] = None
+            candidates = {
+                p for band, value in _bands(fingerprint) for mask in self._probe
+                for p in self._buckets.get((band, value ^ mask), ())
+            }
+            for position in candidates:
+                distance = (self._fingerprints[position] ^ fingerprint).bit_count()
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (position, distance)
+            if best is None:
+                return None
+            self.hits += 1
+            return self._keys[best[0]].hex(), best[1]
+
+    def add(self, fingerprint: int, content_key: str) -> None:
+        """指紋を登録し、索引ファイルに追記する。"""
+        key = bytes.fromhex(content_key)
+        with self._lock:
+            self._insert(fingerprint, key)
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                if len(self._fingerprints) > self.max_entries:
+                    self._compact()
+                    return
+                is_new = not self.path.exists()
+                with open(self.path, "ab") as f:
+                    if is_new:
+                        f.write(_MAGIC)
+                    f.write(_RECORD.pack(fingerprint, key))
+            except OSError as e:
+                log.warning(f"⚠️ 近似重複の索引に書き込めません: {e}")
+
+    def _compact(self) -> None:
+        """新しい半分だけを残して索引ファイルを書き直す。"""
+        keep = self.max_entries // 2
+        pairs = list(zip(self._fingerprints[-keep:], self._keys[-keep:]))
+        self._fingerprints, self._keys, self._buckets = [], [], {}
+        for fingerprint, key in pairs:
+            self._insert(fingerprint, key)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(_MAGIC + b"".join(_RECORD.pack(fp, key) for fp, key in pairs))
+        os.replace(tmp, self.path)
+        log.info(f"🧹 近似重複の索引を {len(pairs)} 件に縮小")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._fingerprints), "lookups": self.lookups, "hits": self.hits}
@@ -0,0 +1,161 @@
+"""
+Aurora DSQL への保存（awslabs.aurora-dsql-mcp-server の transact ツール経由）。
+
+DSQL MCP はパラメータ化クエリを受け付けないため、値は sql_literal() でエスケープして埋め込む。
+members は UPSERT、activities は slack_message_id の重複時に何もしない。
+activities には正規化したURLのキー（url_key）も保存し、同じページの再投稿では保存済みの分析結果を使う。
+近似重複（本文がほぼ同じ別URL）の活動には、元ページのURLを duplicate_of として保存する。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import uuid
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+from strands.tools.mcp import MCPClient
+
+from agents.middleware.mcp_middleware import tool_result_text
+from agents.pipeline.records import CollectedPost
+
+log = logging.getLogger("activity_store")
+
+TRANSACT_TOOL_NAME = "transact"
+READONLY_QUERY_TOOL_NAME = "readonly_query"
+SCHEMA = "output_history"
+
+# 保存済みの活動から再利用する分析結果の列（JSON文字列で保存している列は読み込み時に戻す）
+ANALYSIS_COLUMNS = ("activity_type", "title", "description", "summary_by_ai", "activity_date", "event_name",
+                    "participant_count", "like_count", "aws_services", "aws_level", "tags")
+_JSON_COLUMNS = ("aws_services", "tags")
+URL_KEY_QUERY_CHUNK = 100
+
+
+class PersistenceError(RuntimeError):
+    """DSQLへの書き込みに失敗した。"""
+
+
+def sql_literal(value: Any) -> str:
+    """Python値をSQLリテラルに変換する（文字列はシングルクォートをエスケープ）。"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value, ensure_ascii=False)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def to_activity_date(*candidates: Optional[str]) -> str:
+    """YYYY-MM-DD / YYYYMMDD / ISO8601 のいずれかから YYYY-MM-DD を作る（無ければ今日）。"""
+    for value in candidates:
+        if not value:
+            continue
+        text = str(value).strip()
+        for fmt, length in (("%Y-%m-%d", 10), ("%Y%m%d", 8)):
+            try:
+                return datetime.strptime(text[:length], fmt).date().isoformat()
+            except ValueError:
+                continue
+    return date.today().isoformat()
+
+
+class ActivityStore:
+    """Aurora DSQL MCP セッション経由で members / activities を書き込む。"""
+
+    def __init__(self, dsql_client: MCPClient):
+        self.client = dsql_client
+
+    async def transact(self, sql_list: List[str]) -> str:
+        result = await self.client.call_tool_async(
+            tool_use_id=f"transact-{uuid.uuid4().hex[:12]}",
+            name=TRANSACT_TOOL_NAME,
+            arguments={"sql_list": sql_list},
+        )
+        text = tool_result_text(result)
+        if result.get("status") == "error":
+            raise PersistenceError(text or "transact failed")
+        return text
+
+    async def query(self, sql: str) -> List[Dict[str, Any]]:
+        result = await self.client.call_tool_async(
+            tool_use_id=f"query-{uuid.uuid4().hex[:12]}",
+            name=READONLY_QUERY_TOOL_NAME,
+            arguments={"sql": sql},
+        )
+        text = tool_result_text(result)
+        if result.get("status") == "error":
+            raise PersistenceError(text or "readonly_query failed")
+        try:
+            rows = json.loads(text) if text else []
+        except json.JSONDecodeError:
+            raise PersistenceError(f"readonly_query の結果を解析できません: {text[:200]}")
+        return rows if isinstance(rows, list) else []
+
+    def member_sql(self, post: CollectedPost) -> str:
+        return (
+            f"INSERT INTO {SCHEMA}.members (slack_user_id, slack_user_name, slack_user_email) "
+            f"VALUES ({sql_literal(post.slack_user_id)}, {sql_literal(post.slack_user_name)}, "
+            f"{sql_literal(post.slack_user_email)}) "
+            f"ON CONFLICT (slack_user_id) DO UPDATE SET "
+            f"slack_user_name = COALESCE(EXCLUDED.slack_user_name, {SCHEMA}.members.slack_user_name), "
+            f"slack_user_email = COALESCE(EXCLUDED.slack_user_email, {SCHEMA}.members.slack_user_email), "
+            f"updated_at = CURRENT_TIMESTAMP"
+        )
+
+    def activity_sql(self, post: CollectedPost, fields: Dict[str, Any]) -> str:
+        row = {
+            "slack_user_id": post.slack_user_id,
+            "activity_type": fields.get("activity_type", "other"),
+            "title": (fields.get("title") or post.url)[:255],
+            "description": fields.get("description"),
+            "summary_by_ai": fields.get("summary_by_ai"),
+            "activity_date": to_activity_date(fields.get("activity_date"), post.slack_upload_time),
+            "event_name": fields.get("event_name"),
+            "participant_count": fields.get("participant_count"),
+            "like_count": fields.get("like_count"),
+            "url": post.url,
+            "url_key": post.url_key,
+            "duplicate_of": fields.get("duplicate_of"),
+            "aws_services": fields.get("aws_services") or [],
+            "aws_level": fields.get("aws_level"),
+            "tags": fields.get("tags") or [],
+            "slack_message_id": post.slack_message_id,
+            "slack_channel": post.slack_channel,
+            "slack_upload_time": post.slack_upload_time,
+        }
+        columns = ", ".join(row)
+        values = ", ".join(sql_literal(v) for v in row.values())
+        return (
+            f"INSERT INTO {SCHEMA}.activities ({columns}) VALUES ({values}) "
+            f"ON CONFLICT (slack_message_id) DO NOTHING"
+        )
+
+    async def stored_fields(self, url_keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """url_key ごとに、保存済みの活動の分析結果を返す（同じキーが複数あれば最初の行）。"""
+        found: Dict[str, Dict[str, Any]] = {}
+        keys = list(dict.fromkeys(url_keys))
+        for i in range(0, len(keys), URL_KEY_QUERY_CHUNK):
+            chunk = keys[i:i + URL_KEY_QUERY_CHUNK]
+            rows = await self.query(
+                f"SELECT url_key, {', '.join(ANALYSIS_COLUMNS)} FROM {SCHEMA}.activities "
+                f"WHERE url_key IN ({', '.join(sql_literal(k) for k in chunk)}) ORDER BY created_at"
+            )
+            for row in rows:
+                fields = {column: row.get(column) for column in ANALYSIS_COLUMNS}
+                for column in _JSON_COLUMNS:
+                    if isinstance(fields[column], str):
+                        try:
+                            fields[column] = json.loads(fields[column])
+                        except json.JSONDecodeError:
+                            fields[column] = []
+                found.setdefault(row.get("url_key"), fields)
+        return found
+
+    async def save_activity(self, post: CollectedPost, fields: Dict[str, Any]) -> None:
+        """メンバーと活動を1トランザクションで保存する。"""
+        await self.transact([self.member_sql(post), self.activity_sql(post, fields)])
+        log.info(f"💾 保存完了: {post.url}")
@@ -0,0 +1,54 @@
+"""
+ActivityPipeline の組み立て（エントリーポイントとヘッドレス実行で共有）。
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from strands.tools.mcp import MCPClient
+
+from agents.pipeline.activity_pipeline import ActivityPipeline
+from agents.pipeline.analysis_cache import AnalysisCache, analysis_cache_enabled
+from agents.pipeline.batch_analyzer import BatchActivityAnalyzer
+from agents.pipeline.ledger import ProcessingLedger, processing_ledger_enabled
+from agents.pipeline.model_router import ModelRouter
+from agents.pipeline.near_duplicate import NearDuplicateIndex, near_duplicate_enabled
+from agents.pipeline.persistence import ActivityStore
+from agents.pipeline.scraper import PageScraper
+
+# 分析結果キャッシュと近似重複の索引はリクエストをまたいで共有する
+_analysis_cache: Optional[AnalysisCache] = None
+_near_duplicate_index: Optional[NearDuplicateIndex] = None
+
+
+def get_analysis_cache() -> Optional[AnalysisCache]:
+    global _analysis_cache
+    if _analysis_cache is None and analysis_cache_enabled():
+        _analysis_cache = AnalysisCache()
+    return _analysis_cache
+
+
+def get_near_duplicate_index() -> Optional[NearDuplicateIndex]:
+    """近似重複の索引（元ページの分析結果は分析結果キャッシュから引くため、キャッシュ無効時は None）。"""
+    global _near_duplicate_index
+    if _near_duplicate_index is None and near_duplicate_enabled() and get_analysis_cache() is not None:
+        _near_duplicate_index = NearDuplicateIndex()
+    return _near_duplicate_index
+
+
+def build_activity_pipeline(firecrawl_client: MCPClient, dsql_client: MCPClient,
+                            router: Optional[ModelRouter] = None) -> ActivityPipeline:
+    """活動パイプラインを作る。
+
+    router を省略すると、判断を記録しない ModelRouter を使う（常駐のワーカーで記録が増え続けないように）。
+    判断を metadata.routing に返す呼び出し元は、自分の router を渡して report() で読み出す。
+    """
+    store = ActivityStore(dsql_client)
+    return ActivityPipeline(
+        scraper=PageScraper(firecrawl_client),
+        store=store,
+        analyzer=BatchActivityAnalyzer(router or ModelRouter(keep_decisions=False)),
+        cache=get_analysis_cache(),
+        near_duplicates=get_near_duplicate_index(),
+        ledger=ProcessingLedger(store) if processing_ledger_enabled() else None,
+    )
@@ -0,0 +1,100 @@
+"""
+パイプラインで受け渡すレコード定義。
+
+SlackAgent が出力するJSONL（slack_agent_factory.py の出力仕様）を CollectedPost に変換する。
+CollectedPost のURLは投稿されたまま（Slack の <url|label> 表記だけ除く）で、重複判定には url_key を使う（url_canonical.py）。
+"""
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+from agents.pipeline.url_canonical import strip_slack_markup, url_key
+
+log = logging.getLogger("pipeline_records")
+
+
+@dataclass
+class CollectedPost:
+    """Slackから収集した1件のアウトプット（1メッセージ内の1URL）。"""
+    slack_user_id: str
+    url: str
+    slack_user_name: Optional[str] = None
+    slack_user_email: Optional[str] = None
+    slack_upload_time: Optional[str] = None  # YYYYMMDD
+    slack_channel: Optional[str] = None
+    slack_message_id: Optional[str] = None  # Slackの ts
+
+    def __post_init__(self) -> None:
+        self.url = strip_slack_markup(self.url)
+
+    @property
+    def url_key(self) -> str:
+        """同じページの別形を同じにした重複判定用のキー（activities.url_key）。"""
+        return url_key(self.url)
+
+    @property
+    def item_key(self) -> str:
+        """重複判定用のキー（チャンネル・メッセージ・URL）。"""
+        return f"{self.slack_channel or ''}:{self.slack_message_id or ''}:{self.url}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CollectedPost":
+        fields = cls.__dataclass_fields__
+        return cls(**{k: v for k, v in data.items() if k in fields})
+
+
+def parse_collected_posts(text: str) -> List[CollectedPost]:
+    """テキスト中のJSONL行から CollectedPost を取り出す（前後の説明文は無視する）。
+
+    同一メッセージに複数URLがある場合、slack_message_id は2件目以降に "#n" を付けて一意にする
+    （activities.slack_message_id が UNIQUE のため）。
+    """
+    posts: List[CollectedPost] = []
+    seen_items: set = set()
+    urls_per_message: Dict[str, int] = {}
+    for line in text.splitlines():
+        line = line.strip().rstrip(",")
+        if not line.startswith("{"):
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(data, dict) or not data.get("url") or not data.get("slack_user_id"):
+            continue
+        post = CollectedPost.from_dict(data)
+        if post.item_key in seen_items:
+            continue
+        seen_items.add(post.item_key)
+        if post.slack_message_id:
+            count = urls_per_message.get(post.slack_message_id, 0)
+            urls_per_message[post.slack_message_id] = count + 1
+            if count:
+                post.slack_message_id = f"{post.slack_message_id}#{count}"
+        posts.append(post)
+    log.info(f"📥 収集レコード {len(posts)} 件を解析")
+    return posts
+
+
+def merge_collected_posts(groups: List[List[CollectedPost]]) -> List[CollectedPost]:
+    """チャンネルごとの収集結果をまとめ、同じ投稿者・同じURL（url_key）は最も古い投稿1件に絞る。
+
+    同じ記事が複数チャンネルに投稿されても、活動としては1件として扱う。
+    """
+    merged: Dict[tuple, CollectedPost] = {}
+    for post in sorted((p for group in groups for p in group), key=lambda p: p.slack_message_id or ""):
+        merged.setdefault((post.slack_user_id, post.url_key), post)
+    posts = list(merged.values())
+    log.info(f"🔀 {len(groups)} チャンネル分を統合: {sum(len(g) for g in groups)} 件 → {len(posts)} 件")
+    return posts
+
+
+def to_jsonl(posts: List[CollectedPost]) -> str:
+    """SlackAgent の出力仕様と同じJSONLに戻す（後段ノードへの受け渡し用）。"""
+    return "\n".join(json.dumps(post.to_dict(), ensure_ascii=False) for post in posts)
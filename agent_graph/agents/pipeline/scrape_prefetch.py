@@ -0,0 +1,187 @@
+"""
+Slack 収集中のスクレイプ先読み（SCRAPE_PREFETCH）。
+
+通常は slack_agent ノードが出力を返し終えるまで Firecrawl のスクレイプが始まらない。
+先読みモードでは Gateway の conversationsHistory の結果に現れたURLをその場でバックグラウンドの
+スクレイプに回し、分析ノード（activity_pipeline / firecrawl_agent）の firecrawl_scrape 呼び出しには
+取得済み、または取得中の結果を返す。スクレイプの待ち時間が Slack 収集・メンバー解決と重なる。
+
+- SlackUrlTap: Gateway 側のミドルウェア。履歴の結果からURLを取り出して先読みを登録する
+- PrefetchedScrapeMiddleware: Firecrawl 側のミドルウェア。同じURLの firecrawl_scrape に先読み結果を返す
+- 先読み自体の呼び出しは Firecrawl クライアントの通常のチェーン（レート制限・タイムアウト・コンパクション）を通る
+- 先読みは投稿されたままのURLで取得し、照合は url_key（url_canonical.py）で行う
+- 先読みに失敗したURLは、分析ノードの呼び出し時に改めてスクレイプする
+
+収集エージェントが対象外と判断したURLも先読みされるため、件数は PREFETCH_MAX_URLS で抑える。
+先読みのタスクはグラフを実行しているイベントループに属し、グラフの終了時（エラー時も含む）に
+close() で残りを取り消す。MCPセッションを閉じる前に呼ぶこと。
+
+環境変数:
+- SCRAPE_PREFETCH: true で有効（既定 false、ペイロードの "prefetch" でも指定可）
+- PREFETCH_CONCURRENCY: 同時に先読みするURL数（既定 PIPELINE_CONCURRENCY → 4）
+- PREFETCH_MAX_URLS: 1リクエストで先読みするURLの上限（既定 50）
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+from strands.tools.mcp import MCPClient
+from strands.tools.mcp.mcp_types import MCPToolResult
+
+from agents.middleware.mcp_middleware import MCPToolMiddleware, ToolCall, ToolCallHandler, tool_result_text
+from agents.pipeline.scraper import SCRAPE_TOOL_NAME, scrape_arguments
+from agents.pipeline.slack_history import HISTORY_TOOL_NAME, collectable_urls, exclude_domains
+from agents.pipeline.url_canonical import url_key
+
+log = logging.getLogger("scrape_prefetch")
+
+PREFETCH_TOOL_USE_PREFIX = "prefetch-"
+
+
+@dataclass
+class PrefetchStats:
+    submitted: int = 0
+    ready_hits: int = 0  # 呼び出し時に取得済みだった
+    joined_hits: int = 0  # 取得中のスクレイプに合流した
+    misses: int = 0
+    failed: int = 0
+    wasted: int = 0  # 先読みしたが使われなかった
+    dropped: int = 0  # 上限を超えたため先読みしなかった
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class ScrapePrefetcher:
+    """URLごとのスクレイプを1回だけバックグラウンドで開始し、結果を受け渡す。"""
+
+    def __init__(self, firecrawl_client: MCPClient, concurrency: Optional[int] = None,
+                 max_urls: Optional[int] = None):
+        self.client = firecrawl_client
+        self.concurrency = concurrency or int(
+            os.environ.get("PREFETCH_CONCURRENCY", os.environ.get("PIPELINE_CONCURRENCY", "4"))
+        )
+        self.max_urls = max_urls or int(os.environ.get("PREFETCH_MAX_URLS", "50"))
+        self.stats = PrefetchStats()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._seen: set = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def _scrape(self, url: str) -> MCPToolResult:
+        async with self._semaphore:
+            return await self.client.call_tool_async(
+                tool_use_id=f"{PREFETCH_TOOL_USE_PREFIX}{uuid.uuid4().hex[:12]}",
+                name=SCRAPE_TOOL_NAME,
+                arguments=scrape_arguments(url),
+            )
+
+    def submit(self, url: str) -> None:
+        """url の先読みを開始する（実行中のイベントループから呼ぶ）。同じ url_key のURLは1回だけ取得する。"""
+        key = url_key(url)
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        if len(self._seen) > self.max_urls:
+            self.stats.dropped += 1
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._tasks[key] = asyncio.ensure_future(self._scrape(url))
+        self.stats.submitted += 1
+        log.info(f"🔮 先読み開始: {url}")
+
+    async def take(self, url: str) -> Optional[MCPToolResult]:
+        """url と同じ url_key の先読み結果を返す（先読みしていない・別のループ・失敗なら None）。"""
+        task = self._tasks.pop(url_key(url), None)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            self.stats.misses += 1
+            return None
+        if task.done():
+            self.stats.ready_hits += 1
+        else:
+            self.stats.joined_hits += 1
+        try:
+            result = await task
+        except Exception as e:
+            log.warning(f"⚠️ 先読み失敗のため再取得: {url}: {e}")
+            self.stats.failed += 1
+            return None
+        if result.get("status") == "error":
+            self.stats.failed += 1
+            return None
+        return result
+
+    def report(self) -> Dict[str, int]:
+        """集計を返す（まだ取り出されていない先読みも wasted に数える）。"""
+        stats = self.stats.to_dict()
+        stats["wasted"] += len(self._tasks)
+        return stats
+
+    async def close(self) -> None:
+        """取り出されなかった先読みを取り消し、終わるまで待つ（wasted に数える）。"""
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        self.stats.wasted += len(tasks)
+        loop = asyncio.get_running_loop()
+        pending = []
+        for task in tasks:
+            if task.get_loop() is loop:
+                task.cancel()
+                pending.append(task)
+            elif not task.get_loop().is_closed():
+                # 同期呼び出しなど別のループで始まった先読みは、そのループで取り消す
+                task.get_loop().call_soon_threadsafe(task.cancel)
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            log.info(f"🔮 使われなかった先読みを取り消し: {len(pending)} 件")
+
+
+class SlackUrlTap(MCPToolMiddleware):
+    """conversationsHistory の結果に含まれるURLを先読みに回す（結果はそのまま返す）。"""
+
+    def __init__(self, prefetcher: ScrapePrefetcher):
+        self.prefetcher = prefetcher
+        self.excluded = exclude_domains()
+
+    async def __call__(self, call: ToolCall, call_next: ToolCallHandler) -> MCPToolResult:
+        result = await call_next(call)
+        if call.name != HISTORY_TOOL_NAME or result.get("status") == "error":
+            return result
+        try:
+            messages = json.loads(tool_result_text(result)).get("messages", [])
+        except (json.JSONDecodeError, AttributeError):
+            return result
+        for message in messages:
+            if message.get("user") and not message.get("subtype"):
+                for url in collectable_urls(message.get("text", ""), self.excluded):
+                    self.prefetcher.submit(url)
+        return result
+
+
+class PrefetchedScrapeMiddleware(MCPToolMiddleware):
+    """firecrawl_scrape の呼び出しに先読み結果を返す（先読み自身の呼び出しは通す）。"""
+
+    def __init__(self, prefetcher: ScrapePrefetcher):
+        self.prefetcher = prefetcher
+
+    @staticmethod
+    def _servable(arguments: Dict[str, Any]) -> bool:
+        # 先読みは Markdown のみ取得しているので、それ以外の形式を求める呼び出しには使わない
+        return set(arguments.get("formats") or ["markdown"]) <= {"markdown"}
+
+    async def __call__(self, call: ToolCall, call_next: ToolCallHandler) -> MCPToolResult:
+        arguments = call.arguments or {}
+        if (call.name != SCRAPE_TOOL_NAME or call.tool_use_id.startswith(PREFETCH_TOOL_USE_PREFIX)
+                or not self._servable(arguments)):
+            return await call_next(call)
+        # 先読みは url_key で照合するため、エージェントが別の形のURLで呼んでも一致する
+        result = await self.prefetcher.take(arguments.get("url", ""))
+        if result is None:
+            return await call_next(call)
+        return {**result, "toolUseId": call.tool_use_id}
@@ -0,0 +1,85 @@
+"""
+Firecrawl MCP を直接呼び出してページ本文を取得するスクレイパー。
+
+エージェントを介さずに firecrawl_scrape を1回呼ぶだけなので、LLMのターンを消費しない。
+結果はコンパクション済み（agents/middleware/compaction.py）の形式と生の形式の両方を受け付ける。
+Firecrawl が一時的に使えない（タイムアウト・サーキットオープン）ページは deferred として返す。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from strands.tools.mcp import MCPClient
+
+from agents.middleware.compaction import DEFAULT_MAX_PAGE_TOKENS, compact_scraped_page
+from agents.middleware.mcp_middleware import tool_result_text
+from agents.middleware.resilience import MCPUnavailableError
+
+log = logging.getLogger("page_scraper")
+
+SCRAPE_TOOL_NAME = "firecrawl_scrape"
+
+
+@dataclass
+class ScrapedPage:
+    url: str
+    markdown: str = ""
+    title: Optional[str] = None
+    published_time: Optional[str] = None
+    error: Optional[str] = None
+    deferred: bool = False  # エンドポイント障害のため後回しにした
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and bool(self.markdown)
+
+
+def parse_scrape_result(url: str, text: str) -> ScrapedPage:
+    """firecrawl_scrape の結果テキストを ScrapedPage に変換する。"""
+    try:
+        payload: Any = json.loads(text)
+    except json.JSONDecodeError:
+        payload = text
+    # コンパクション済みでなければここで本文抽出・切り詰めを行う
+    if not (isinstance(payload, dict) and "markdown" in payload and "metadata" not in payload):
+        max_tokens = int(os.environ.get("FIRECRAWL_MAX_PAGE_TOKENS", DEFAULT_MAX_PAGE_TOKENS))
+        payload = compact_scraped_page(payload, max_tokens)
+    return ScrapedPage(
+        url=url,
+        markdown=payload.get("markdown", ""),
+        title=payload.get("title"),
+        published_time=payload.get("published_time"),
+    )
+
+
+def scrape_arguments(url: str) -> Dict[str, Any]:
+    """firecrawl_scrape の引数（本文のMarkdownのみ）。"""
+    return {"url": url, "formats": ["markdown"], "onlyMainContent": True}
+
+
+class PageScraper:
+    """Firecrawl MCP セッション上でページを取得する。"""
+
+    def __init__(self, firecrawl_client: MCPClient):
+        self.client = firecrawl_client
+
+    async def scrape(self, url: str) -> ScrapedPage:
+        try:
+            result = await self.client.call_tool_async(
+                tool_use_id=f"scrape-{uuid.uuid4().hex[:12]}",
+                name=SCRAPE_TOOL_NAME,
+                arguments=scrape_arguments(url),
+            )
+        except MCPUnavailableError as e:
+            log.warning(f"⏭️ スクレイプを後回し: {url}: {e}")
+            return ScrapedPage(url=url, error=str(e), deferred=True)
+        text = tool_result_text(result)
+        if result.get("status") == "error":
+            log.warning(f"⚠️ スクレイプ失敗: {url}: {text[:200]}")
+            return ScrapedPage(url=url, error=text or "scrape failed")
+        return parse_scrape_result(url, text)
@@ -0,0 +1,190 @@
+"""
+Slack Events API の message イベントからの取り込み。
+
+投稿のたびに Slack から届く message イベントを署名検証し、URLを含む投稿を CollectedPost にして
+作業キュー（work_queue.py）に積む。近い時刻に届いたイベントはまとめて1回で積む。
+conversationsHistory はイベントを取りこぼした区間（サーバー停止中・配信失敗）を埋めるためだけに読む。
+
+- SlackEventIngestor: イベント → CollectedPost → バッチでキューへ
+- GapReconciler: チャンネルごとのウォーターマーク（slack_fetch）から現在までの履歴を読み、キューに積む。
+  起動時と SLACK_EVENTS_RECONCILE_INTERVAL_SECONDS ごとに実行し、読んだところまでウォーターマークを進める
+- イベントと履歴の両方から同じ投稿が来ても、キューは item_key で1回しか積まない
+
+投稿の変換は SlackHistoryReader.posts_from_messages を使うので、item_key（ts と URL の番号）は
+履歴から読んだ場合と一致する。
+
+環境変数:
+- SLACK_SIGNING_SECRET: Slack アプリの Signing Secret（必須）
+- SLACK_EVENTS_BATCH_WINDOW_MS: 最初のイベントからキューに積むまで待つ時間（既定 2000）
+- SLACK_EVENTS_BATCH_MAX: この件数に達したら待たずに積む（既定 50）
+- SLACK_EVENTS_RECONCILE_INTERVAL_SECONDS: 取りこぼし確認の間隔（既定 3600、0 なら起動時のみ）
+- SLACK_EVENTS_INITIAL_LOOKBACK_HOURS: ウォーターマークがないチャンネルを遡る時間（既定 24）
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+from agents.pipeline.records import CollectedPost
+from agents.pipeline.slack_history import SlackHistoryReader
+from agents.pipeline.watermarks import WatermarkStore
+from agents.pipeline.work_queue import WorkQueue
+
+log = logging.getLogger("slack_events")
+
+# Slack の推奨どおり、5分より古いタイムスタンプの署名はリプレイとして拒否する
+SIGNATURE_TOLERANCE_SECONDS = 300
+
+
+def signature_for(secret: str, timestamp: str, body: bytes) -> str:
+    """Slack の署名（v0=HMAC-SHA256("v0:{timestamp}:{body}")）を作る。"""
+    base = b"v0:" + timestamp.encode() + b":" + body
+    return "v0=" + hmac.new(secret.encode(), base, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret: str, timestamp: Optional[str], body: bytes, signature: Optional[str],
+                     now: Optional[float] = None) -> bool:
+    """X-Slack-Request-Timestamp / X-Slack-Signature ヘッダーを検証する。"""
+    if not secret or not timestamp or not signature:
+        return False
+    try:
+        sent_at = int(timestamp)
+    except ValueError:
+        return False
+    if abs((now or time.time()) - sent_at) > SIGNATURE_TOLERANCE_SECONDS:
+        return False
+    return hmac.compare_digest(signature_for(secret, timestamp, body), signature)
+
+
+@dataclass
+class IngestStats:
+    events: int = 0
+    ignored: int = 0  # 対象外のチャンネル・イベント種別、URLなし
+    posts: int = 0
+    enqueued: int = 0
+    duplicates: int = 0  # キューに積み済み（Slack の再送・履歴と重複）
+    batches: int = 0
+    max_lag_ms: float = 0.0  # 投稿時刻からキューに積むまで
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class SlackEventIngestor:
+    """message イベントを CollectedPost にし、近い時刻のものをまとめてキューに積む。"""
+
+    def __init__(self, reader: SlackHistoryReader, queue: WorkQueue, channels: List[str],
+                 batch_window: Optional[float] = None, batch_max: Optional[int] = None):
+        self.reader = reader
+        self.queue = queue
+        self.channels = set(channels)
+        self.batch_window = batch_window if batch_window is not None else (
+            float(os.environ.get("SLACK_EVENTS_BATCH_WINDOW_MS", "2000")) / 1000
+        )
+        self.batch_max = batch_max or int(os.environ.get("SLACK_EVENTS_BATCH_MAX", "50"))
+        self.stats = IngestStats()
+        self._buffer: List[CollectedPost] = []
+        self._oldest_ts: Optional[float] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+    def accept(self, payload: Dict[str, Any]) -> int:
+        """event_callback を1件受け取り、バッファに加えた投稿数を返す（イベントループ上で呼ぶ）。"""
+        self.stats.events += 1
+        event = payload.get("event") or {}
+        channel = event.get("channel")
+        if payload.get("type") != "event_callback" or event.get("type") != "message" or channel not in self.channels:
+            self.stats.ignored += 1
+            return 0
+        posts = self.reader.posts_from_messages(channel, [event])
+        if not posts:
+            self.stats.ignored += 1
+            return 0
+
+        self.stats.posts += len(posts)
+        self._buffer.extend(posts)
+        posted_at = float(event["ts"])
+        self._oldest_ts = posted_at if self._oldest_ts is None else min(self._oldest_ts, posted_at)
+        if len(self._buffer) >= self.batch_max:
+            self.flush()
+        elif self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush_later())
+        return len(posts)
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.batch_window)
+        self.flush()
+
+    def flush(self) -> None:
+        """バッファの投稿をキューに積む。"""
+        if not self._buffer:
+            return
+        posts, self._buffer = self._buffer, []
+        queued = self.queue.enqueue(posts)
+        lag_ms = (time.time() - self._oldest_ts) * 1000 if self._oldest_ts else 0.0
+        self._oldest_ts = None
+        self.stats.batches += 1
+        self.stats.enqueued += queued
+        self.stats.duplicates += len(posts) - queued
+        self.stats.max_lag_ms = round(max(self.stats.max_lag_ms, lag_ms), 1)
+        log.info(f"📥 イベントから {queued} 件をキューに追加（重複 {len(posts) - queued}、投稿から {lag_ms:.0f}ms）")
+
+
+class GapReconciler:
+    """ウォーターマークから現在までの履歴を読み、イベントで取りこぼした投稿をキューに積む。"""
+
+    def __init__(self, reader: SlackHistoryReader, queue: WorkQueue, watermarks: WatermarkStore,
+                 channels: List[str], interval: Optional[float] = None):
+        self.reader = reader
+        self.queue = queue
+        self.watermarks = watermarks
+        self.channels = channels
+        self.interval = interval if interval is not None else float(
+            os.environ.get("SLACK_EVENTS_RECONCILE_INTERVAL_SECONDS", "3600")
+        )
+        self.lookback = float(os.environ.get("SLACK_EVENTS_INITIAL_LOOKBACK_HOURS", "24")) * 3600
+        self.recovered = 0
+
+    async def _reconcile_channel(self, channel: str, oldest: Optional[str], until: str) -> None:
+        messages = queued = 0
+        try:
+            async for page, posts in self.reader.iter_pages(channel, oldest=oldest, latest=until):
+                messages += len(page)
+                queued += self.queue.enqueue(posts)
+        except Exception as e:
+            log.error(f"❌ {channel} の取りこぼし確認に失敗: {e}")
+            await self.watermarks.save(channel, None, queued, error=str(e), details={"mode": "events_reconcile"})
+            return
+        self.recovered += queued
+        if queued:
+            log.warning(f"🩹 {channel}: イベントで届かなかった {queued} 件を履歴から追加（{messages} メッセージを確認）")
+        await self.watermarks.save(channel, until, queued, details={"mode": "events_reconcile", "messages": messages})
+
+    async def reconcile_once(self) -> None:
+        now = time.time()
+        until = f"{now:.6f}"
+        marks = await self.watermarks.load(self.channels)
+        # 取りこぼし確認のたびにメンバー一覧も更新する（新しく参加したメンバーの表示名のため）
+        await self.reader.load_users(refresh=True)
+        for channel in self.channels:
+            oldest = marks.get(channel) or f"{now - self.lookback:.6f}"
+            await self._reconcile_channel(channel, oldest, until)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """起動時に1回、その後は interval ごとに stop が立つまで確認する。"""
+        while not stop.is_set():
+            try:
+                await self.reconcile_once()
+            except Exception as e:
+                log.error(f"❌ 取りこぼし確認に失敗: {e}")
+            if self.interval <= 0:
+                return
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
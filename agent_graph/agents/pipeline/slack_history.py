@@ -0,0 +1,172 @@
+"""
+Slack の履歴を LLM を使わずに読み取り、CollectedPost に変換する。
+
+バックフィル（backfill.py）、ヘッドレス収集（run_collection.py）、イベント取り込み（slack_events.py）で共有する。
+conversationsHistory / usersList の応答はコンパクション済み・生のどちらの形式でも受け付ける。
+
+環境変数:
+- SLACK_HISTORY_PAGE_SIZE: 1ページのメッセージ数（既定 200）
+- SLACK_EXCLUDE_DOMAINS: 収集対象外のドメイン（既定 twitter.com,x.com,slack.com）
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from strands.tools.mcp import MCPClient
+
+from agents.middleware.mcp_middleware import tool_result_text
+from agents.pipeline.records import CollectedPost
+from agents.pipeline.url_canonical import canonical_url, url_key
+
+log = logging.getLogger("slack_history")
+
+HISTORY_TOOL_NAME = "slack___conversationsHistory"
+USERS_TOOL_NAME = "slack___usersList"
+
+JST = timezone(timedelta(hours=9))
+_SLACK_LINK = re.compile(r"<(https?://[^>|\s]+)(?:\|[^>]*)?>")
+_BARE_URL = re.compile(r"\bhttps?://[^\s<>|]+")
+DEFAULT_EXCLUDE_DOMAINS = "twitter.com,x.com,slack.com"
+
+
+def extract_urls(text: str) -> List[str]:
+    """Slackのメッセージ本文からURLを取り出す（<url|label> 形式と素のURL）。"""
+    urls = _SLACK_LINK.findall(text or "") + _BARE_URL.findall(_SLACK_LINK.sub(" ", text or ""))
+    return list(dict.fromkeys(url.rstrip(").,") for url in urls))
+
+
+def _domain(url: str) -> str:
+    host = url.split("/")[2].lower() if url.count("/") >= 2 else ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def exclude_domains() -> Set[str]:
+    return {
+        d.strip().lower()
+        for d in os.environ.get("SLACK_EXCLUDE_DOMAINS", DEFAULT_EXCLUDE_DOMAINS).split(",")
+        if d.strip()
+    }
+
+
+def collectable_urls(text: str, excluded: Set[str]) -> List[str]:
+    """本文のURLのうち、除外ドメイン以外のものを投稿されたままの形で返す（同じ url_key のURLは最初の1件にする）。"""
+    urls: Dict[str, str] = {}
+    for url in extract_urls(text):
+        if _domain(canonical_url(url)) not in excluded:
+            urls.setdefault(url_key(url), url)
+    return list(urls.values())
+
+
+def ts_to_jst_date(ts: str) -> str:
+    return datetime.fromtimestamp(float(ts), JST).strftime("%Y%m%d")
+
+
+def to_slack_ts(value: Optional[str]) -> Optional[str]:
+    """YYYY-MM-DD（JSTの0時）または Slack の ts を Slack の ts に変換する。"""
+    if not value:
+        return None
+    try:
+        return f"{datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=JST).timestamp():.6f}"
+    except ValueError:
+        return value
+
+
+class SlackHistoryReader:
+    """conversationsHistory をページ単位で読み、URLを含むメッセージを CollectedPost にする。"""
+
+    def __init__(self, gateway_client: MCPClient, page_size: Optional[int] = None):
+        self.client = gateway_client
+        self.page_size = page_size or int(os.environ.get("SLACK_HISTORY_PAGE_SIZE", "200"))
+        self.exclude_domains = exclude_domains()
+        self._users: Optional[Dict[str, Dict[str, Any]]] = None
+
+    async def _call(self, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        result = await self.client.call_tool_async(
+            tool_use_id=f"history-{uuid.uuid4().hex[:12]}", name=name, arguments=arguments,
+        )
+        text = tool_result_text(result)
+        if result.get("status") == "error":
+            raise RuntimeError(f"{name} に失敗: {text[:200]}")
+        payload = json.loads(text)
+        # Slack API のエラー（not_in_channel・ratelimited 等）はツール呼び出しとしては成功で返る
+        if isinstance(payload, dict) and payload.get("ok") is False:
+            raise RuntimeError(f"{name} に失敗: {payload.get('error', 'unknown_error')}")
+        return payload
+
+    @staticmethod
+    def _next_cursor(payload: Dict[str, Any]) -> Optional[str]:
+        # コンパクション済み（next_cursor）と生の応答（response_metadata.next_cursor）の両方に対応
+        return payload.get("next_cursor") or (payload.get("response_metadata") or {}).get("next_cursor") or None
+
+    async def load_users(self, refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+        """ユーザーID → 表示名・メール（1回だけ取得してキャッシュする。refresh なら取り直す）。"""
+        if self._users is None or refresh:
+            users: Dict[str, Dict[str, Any]] = {}
+            cursor = None
+            while True:
+                arguments: Dict[str, Any] = {"limit": 200}
+                if cursor:
+                    arguments["cursor"] = cursor
+                payload = await self._call(USERS_TOOL_NAME, arguments)
+                for member in payload.get("members", []):
+                    profile = member.get("profile") or {}
+                    users[member.get("id")] = {
+                        "name": member.get("display_name") or profile.get("display_name") or member.get("name"),
+                        "email": member.get("email") or profile.get("email"),
+                    }
+                cursor = self._next_cursor(payload)
+                if not cursor:
+                    break
+            self._users = users
+        return self._users
+
+    def posts_from_messages(self, channel: str, messages: List[Dict[str, Any]]) -> List[CollectedPost]:
+        users = self._users or {}
+        posts: List[CollectedPost] = []
+        for message in messages:
+            user_id, ts = message.get("user"), message.get("ts")
+            if not user_id or not ts or message.get("subtype"):
+                continue
+            urls = collectable_urls(message.get("text", ""), self.exclude_domains)
+            user = users.get(user_id, {})
+            for n, url in enumerate(urls):
+                posts.append(CollectedPost(
+                    slack_user_id=user_id,
+                    url=url,
+                    slack_user_name=user.get("name"),
+                    slack_user_email=user.get("email"),
+                    slack_upload_time=ts_to_jst_date(ts),
+                    slack_channel=channel,
+                    slack_message_id=ts if n == 0 else f"{ts}#{n}",
+                ))
+        return posts
+
+    async def fetch_page(self, channel: str, cursor: Optional[str] = None, latest: Optional[str] = None,
+                         oldest: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """1ページ分のメッセージ（新しい順）と次のカーソルを返す。"""
+        arguments: Dict[str, Any] = {"channel": channel, "limit": self.page_size}
+        if cursor:
+            arguments["cursor"] = cursor
+        if latest:
+            arguments["latest"] = latest
+        if oldest:
+            arguments["oldest"] = oldest
+        payload = await self._call(HISTORY_TOOL_NAME, arguments)
+        return payload.get("messages", []), self._next_cursor(payload)
+
+    async def iter_pages(self, channel: str, oldest: Optional[str] = None,
+                         latest: Optional[str] = None) -> AsyncIterator[Tuple[List[Dict[str, Any]], List[CollectedPost]]]:
+        """oldest〜latest の範囲をカーソルでたどり、ページごとに (メッセージ, 投稿) を返す。"""
+        await self.load_users()
+        cursor: Optional[str] = None
+        while True:
+            messages, cursor = await self.fetch_page(channel, cursor, latest, oldest)
+            yield messages, self.posts_from_messages(channel, messages)
+            if not cursor:
+                return
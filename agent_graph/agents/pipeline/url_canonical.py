@@ -0,0 +1,168 @@
+"""
+URLの正規化（重複判定のキー用）。
+
+同じ記事でも、Slack に貼られるURLは utm_* 等の計測パラメータ、末尾のスラッシュ、http / https、
+モバイル用ホスト、YouTube の短縮リンク、Qiita の短縮形（/items/<id>）、Zenn の付属パス、SpeakerDeck の埋め込みリンクなどで文字列が変わり、
+「処理済みか」の判定（台帳・作業キュー・チャンネル統合・保存済みの活動）をすり抜ける。
+
+- strip_slack_markup: Slack の <url|label> 表記の山括弧とラベルを除く（取得にはこの形のURLを使う）
+- canonical_url: 照合用の正規形（https、小文字のホスト、www. とモバイル用ホストを除く、
+  フラグメントと計測パラメータを除く、クエリを並べ替える、末尾のスラッシュを除く、ドメインごとの書き換え）
+- url_key: 重複判定のキー。canonical_url からスキームを除き、オフラインでは同じURLに書き換えられない
+  別形（Qiita の /items/<id> と /<user>/items/<id>）を同じキーにする。activities.url_key に保存する
+
+正規形は照合にだけ使い、スクレイプ・保存には投稿されたままのURLを使う（https への書き換えや
+www. ・末尾のスラッシュの除去で取得できなくなるサイトがあるため）。
+CollectedPost は作成時に strip_slack_markup を適用し、重複判定には url_key プロパティを使う。
+
+環境変数:
+- URL_CANONICALIZATION: false で正規化しない（既定 true）
+- URL_STRIP_QUERY_DOMAINS: クエリをすべて除くドメインの追加（カンマ区切り、サブドメインにも効く）
+"""
+from __future__ import annotations
+
+import os
+import re
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# どのサイトでも内容に影響しない計測用パラメータ
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid", "igshid",
+    "mc_cid", "mc_eid", "_hsenc", "_hsmi", "spm", "si",
+}
+TRACKING_PREFIXES = ("utm_",)
+
+# 記事のURLにクエリが意味を持たないドメイン（サブドメインを含む）
+STRIP_QUERY_DOMAINS = {
+    "zenn.dev", "qiita.com", "note.com", "speakerdeck.com", "docswell.com", "medium.com",
+    "dev.to", "connpass.com", "hatenablog.com", "hatenablog.jp", "developers.io",
+}
+
+# モバイル用ホスト → 通常のホスト
+MOBILE_HOSTS = {
+    "m.youtube.com": "youtube.com",
+    "m.facebook.com": "facebook.com",
+    "mobile.twitter.com": "twitter.com",
+    "m.qiita.com": "qiita.com",
+    "m.connpass.com": "connpass.com",
+    "sp.nicovideo.jp": "nicovideo.jp",
+}
+_WIKIPEDIA_MOBILE = re.compile(r"^([a-z-]+)\.m\.wikipedia\.org$")
+_QIITA_ITEM = re.compile(r"^/(?:[^/]+/)?items/([0-9a-f]{20})$")
+
+_Parts = Tuple[str, str, List[Tuple[str, str]]]  # host, path, query
+
+
+def _enabled() -> bool:
+    return os.environ.get("URL_CANONICALIZATION", "true").lower() != "false"
+
+
+def _strip_query_domains() -> set:
+    extra = {d.strip().lower() for d in os.environ.get("URL_STRIP_QUERY_DOMAINS", "").split(",") if d.strip()}
+    return STRIP_QUERY_DOMAINS | extra
+
+
+def _in_domain(host: str, domains: set) -> bool:
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+
+def _normalize_host(host: str) -> str:
+    host = host.lower().rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    host = MOBILE_HOSTS.get(host, host)
+    match = _WIKIPEDIA_MOBILE.match(host)
+    return f"{match.group(1)}.wikipedia.org" if match else host
+
+
+def _youtube(host: str, path: str, query: List[Tuple[str, str]]) -> _Parts:
+    """youtu.be/<id> と埋め込み（/embed/<id>）を watch?v=<id> にし、v 以外のパラメータを除く。"""
+    if host == "youtu.be" and path.strip("/"):
+        return "youtube.com", "/watch", [("v", path.strip("/").split("/")[0])]
+    if path.startswith("/embed/"):
+        video = path.split("/")[2]
+        # ID のない /embed/（プレイリストの埋め込み等）は書き換えない
+        return ("youtube.com", "/watch", [("v", video)]) if video else (host, path, query)
+    if path == "/watch":
+        return host, path, [(k, v) for k, v in query if k == "v"]
+    return host, path, query
+
+
+def _speakerdeck(host: str, path: str, query: List[Tuple[str, str]]) -> _Parts:
+    """oEmbed のURL（/oembed.json?url=<デッキ>）はデッキのURLに戻す。
+
+    /player/<id>（iframe の埋め込み）はデッキのURLをオフラインで求められないため、そのまま残す。
+    """
+    if path.startswith("/oembed"):
+        target = dict(query).get("url")
+        if target and "speakerdeck.com/" in target:
+            parts = urlsplit(target if "://" in target else "https://" + target)
+            return _normalize_host(parts.hostname or host), parts.path, []
+    return host, re.sub(r"/embed$", "", path), []
+
+
+def _zenn(host: str, path: str, query: List[Tuple[str, str]]) -> _Parts:
+    """/<user>/articles/<slug>/embed 等の付属パスを記事のパスに戻す。"""
+    match = re.match(r"^(/[^/]+/(?:articles|books|scraps)/[^/]+)(?:/(?:embed|comments))?$", path)
+    return host, match.group(1) if match else path, []
+
+
+DOMAIN_RULES: Dict[str, Callable[[str, str, List[Tuple[str, str]]], _Parts]] = {
+    "youtube.com": _youtube,
+    "youtu.be": _youtube,
+    "speakerdeck.com": _speakerdeck,
+    "zenn.dev": _zenn,
+}
+
+
+def strip_slack_markup(url: str) -> str:
+    """Slack の <url|label> 表記から url だけを取り出す（素のURLは前後の空白だけ除く）。"""
+    url = (url or "").strip()
+    if url.startswith("<"):
+        url = url[1:].split(">", 1)[0]
+    return url.split("|", 1)[0].strip()
+
+
+def canonical_url(url: str) -> str:
+    """照合用の正規形のURLを返す（http(s) 以外や解析できないURLは Slack の表記を除いただけ）。"""
+    url = strip_slack_markup(url)
+    if not _enabled():
+        return url
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+        return url
+
+    host = _normalize_host(parts.hostname)
+    path = re.sub(r"/{2,}", "/", parts.path or "")
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)
+    ]
+    rule = DOMAIN_RULES.get(host)
+    if rule is not None:
+        host, path, query = rule(host, path, query)
+    if _in_domain(host, _strip_query_domains()):
+        query = []
+    if path.endswith("/"):
+        path = path.rstrip("/")
+    netloc = host if port in (None, 80, 443) else f"{host}:{port}"
+    return urlunsplit(("https", netloc, path, urlencode(sorted(query)), ""))
+
+
+def url_key(url: str) -> str:
+    """重複判定のキー（スキームなしの正規形。同じページの別形は同じキーにする）。"""
+    canonical = canonical_url(url)
+    parts = urlsplit(canonical)
+    if not parts.hostname:
+        return canonical
+    path = parts.path
+    if parts.hostname == "qiita.com":
+        match = _QIITA_ITEM.match(path)
+        if match:
+            path = f"/items/{match.group(1)}"
+    return parts.netloc + path + (f"?{parts.query}" if parts.query else "")
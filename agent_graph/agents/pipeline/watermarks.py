@@ -0,0 +1,66 @@
+"""
+チャンネルごとの収集ウォーターマーク（output_history.processing_history）。
+
+slack_fetch の成功行のうち、チャンネルごとに最新の last_slack_timestamp を次回の oldest として使う。
+失敗したチャンネルは failed 行を残し、ウォーターマークは進めない。
+"""
+from __future__ import annotations
+
+import json
+import logging
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from agents.pipeline.persistence import SCHEMA, ActivityStore, sql_literal
+
+log = logging.getLogger("channel_watermarks")
+
+PROCESS_TYPE = "slack_fetch"
+
+
+class WatermarkStore:
+    """processing_history を読み書きしてチャンネルごとの oldest を管理する。"""
+
+    def __init__(self, store: ActivityStore):
+        self.store = store
+
+    async def load(self, channels: List[str]) -> Dict[str, str]:
+        """チャンネルID → 前回収集した最新メッセージの ts（Slack形式の文字列）。"""
+        if not channels:
+            return {}
+        sql = (
+            f"SELECT slack_channel, EXTRACT(EPOCH FROM MAX(last_slack_timestamp)) AS latest_ts "
+            f"FROM {SCHEMA}.processing_history "
+            f"WHERE process_type = {sql_literal(PROCESS_TYPE)} AND status = 'success' "
+            f"AND slack_channel IN ({', '.join(sql_literal(c) for c in channels)}) "
+            f"GROUP BY slack_channel"
+        )
+        try:
+            rows = await self.store.query(sql)
+        except Exception as e:
+            # 読めない場合は全件取得にフォールバックする（重複は保存時に除外される）
+            log.warning(f"⚠️ ウォーターマークを取得できません: {e}")
+            return {}
+        marks: Dict[str, str] = {}
+        for row in rows:
+            if row.get("latest_ts") is not None:
+                marks[row["slack_channel"]] = f"{Decimal(str(row['latest_ts'])):.6f}"
+        log.info(f"🔖 ウォーターマーク: {marks}")
+        return marks
+
+    async def save(self, channel: str, latest_ts: Optional[str], records: int,
+                   error: Optional[str] = None, details: Optional[Dict[str, Any]] = None) -> None:
+        """1チャンネル分の収集結果を記録する（latest_ts が None なら前回の値を保つ）。"""
+        status = "failed" if error else "success"
+        latest = f"to_timestamp({float(latest_ts)})" if latest_ts and not error else "NULL"
+        payload = {"channel": channel, "records": records, "latest_ts": latest_ts, **(details or {})}
+        sql = (
+            f"INSERT INTO {SCHEMA}.processing_history "
+            f"(process_type, slack_channel, last_slack_timestamp, status, details, error_message) "
+            f"VALUES ({sql_literal(PROCESS_TYPE)}, {sql_literal(channel)}, {latest}, {sql_literal(status)}, "
+            f"{sql_literal(json.dumps(payload, ensure_ascii=False))}, {sql_literal(error)})"
+        )
+        try:
+            await self.store.transact([sql])
+        except Exception as e:
+            log.warning(f"⚠️ ウォーターマークを保存できません（{channel}）: {e}")
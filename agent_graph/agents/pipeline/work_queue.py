@@ -0,0 +1,273 @@
+"""
+収集と分析の間に置くローカルの永続キュー（SQLite）とワーカープール。
+
+Slack の履歴を読む側は CollectedPost をキューに積むだけにし、ワーカーが並行に
+取り出して ActivityPipeline（スクレイプ → 分析 → 保存）を実行する。遅いページがあっても
+他のワーカーは先に進み、プロセスが途中で落ちても積んだ項目はファイルに残る。
+
+- 取り出した項目は可視性タイムアウトの間だけ他のワーカーから見えなくなる（リース）。
+  ワーカーが落ちて ack されなかった項目は、タイムアウト後に再び取り出される
+- 失敗した項目は間隔を倍々に空けて再試行し、WORK_QUEUE_MAX_ATTEMPTS 回失敗したら dead にする
+- エンドポイント障害で後回し（deferred）になった項目は試行回数に数えずに戻す
+- 同じ項目（item_key）は一度しか積まない。完了した行は WORK_QUEUE_RETENTION_DAYS 日で削除する
+
+コンテナをまたいで残すには WORK_QUEUE_PATH を永続ボリューム上に置く。
+
+環境変数:
+- WORK_QUEUE: true でキュー経由で処理する（既定 false、run_collection.py の --queue でも指定可）
+- WORK_QUEUE_PATH: SQLiteファイルのパス（既定 .cache/work_queue.sqlite3）
+- WORK_QUEUE_WORKERS: ワーカー数（既定 4）
+- WORK_QUEUE_BATCH_SIZE: 1ワーカーが一度に取り出す項目数（既定 4）
+- WORK_QUEUE_VISIBILITY_TIMEOUT_SECONDS: リースの有効期間（既定 900）
+- WORK_QUEUE_MAX_ATTEMPTS: dead にするまでの試行回数（既定 3）
+- WORK_QUEUE_RETRY_DELAY_SECONDS: 失敗後の最初の再試行までの間隔（既定 30）
+- WORK_QUEUE_DEFER_DELAY_SECONDS: 後回しにした項目を戻すまでの間隔（既定 60）
+- WORK_QUEUE_RETENTION_DAYS: 完了した行を残す日数（既定 7）
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from agents.pipeline.activity_pipeline import ActivityPipeline, ItemOutcome
+from agents.pipeline.records import CollectedPost
+
+log = logging.getLogger("work_queue")
+
+DEFAULT_QUEUE_PATH = ".cache/work_queue.sqlite3"
+
+
+def work_queue_enabled() -> bool:
+    return os.environ.get("WORK_QUEUE", "false").lower() == "true"
+
+
+@dataclass
+class LeasedItem:
+    key: str
+    post: CollectedPost
+    attempts: int
+    lease_token: str
+
+
+class WorkQueue:
+    """item_key ごとの作業項目（queued → leased → done / dead）。"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path or os.environ.get("WORK_QUEUE_PATH", DEFAULT_QUEUE_PATH))
+        self.visibility_timeout = float(os.environ.get("WORK_QUEUE_VISIBILITY_TIMEOUT_SECONDS", "900"))
+        self.max_attempts = int(os.environ.get("WORK_QUEUE_MAX_ATTEMPTS", "3"))
+        self.retry_delay = float(os.environ.get("WORK_QUEUE_RETRY_DELAY_SECONDS", "30"))
+        self.defer_delay = float(os.environ.get("WORK_QUEUE_DEFER_DELAY_SECONDS", "60"))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # 別プロセスと同じファイルを共有しても取り出しが重ならないよう、トランザクションは明示的に張る
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS work_items ("
+            " item_key TEXT PRIMARY KEY,"
+            " post TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " visible_at REAL NOT NULL,"
+            " lease_token TEXT,"
+            " last_error TEXT,"
+            " enqueued_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS work_items_visible ON work_items (status, visible_at)")
+        retention = float(os.environ.get("WORK_QUEUE_RETENTION_DAYS", "7")) * 86400
+        self._conn.execute("DELETE FROM work_items WHERE status = 'done' AND updated_at < ?", (time.time() - retention,))
+
+    def _transaction(self, statements: Iterable[Tuple[str, tuple]]) -> int:
+        """statements を1つの書き込みトランザクションで実行し、変更した行数を返す。"""
+        with self._lock:
+            changes = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._conn.total_changes - changes
+
+    def enqueue(self, posts: List[CollectedPost]) -> int:
+        """posts を積み、新しく積んだ件数を返す（積んだことのある項目は無視する）。"""
+        now = time.time()
+        return self._transaction(
+            (
+                "INSERT INTO work_items (item_key, post, status, visible_at, enqueued_at, updated_at)"
+                " VALUES (?, ?, 'queued', ?, ?, ?) ON CONFLICT (item_key) DO NOTHING",
+                (post.item_key, json.dumps(post.to_dict(), ensure_ascii=False), now, now, now),
+            )
+            for post in posts
+        )
+
+    def lease(self, limit: int) -> List[LeasedItem]:
+        """見えている項目を最大 limit 件取り出す（リース切れの項目を含む）。"""
+        now = time.time()
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # リース切れのまま試行回数を使い切った項目（処理中に落ち続ける項目）は dead にする
+                self._conn.execute(
+                    "UPDATE work_items SET status = 'dead', last_error = 'visibility timeout', updated_at = ?"
+                    " WHERE status = 'leased' AND visible_at <= ? AND attempts >= ?",
+                    (now, now, self.max_attempts),
+                )
+                rows = self._conn.execute(
+                    "SELECT item_key, post, attempts FROM work_items"
+                    " WHERE status IN ('queued', 'leased') AND visible_at <= ? ORDER BY visible_at LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE work_items SET status = 'leased', lease_token = ?, attempts = attempts + 1,"
+                    " visible_at = ?, updated_at = ? WHERE item_key = ?",
+                    [(token, now + self.visibility_timeout, now, key) for key, _, _ in rows],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [
+            LeasedItem(key=key, post=CollectedPost.from_dict(json.loads(post)), attempts=attempts + 1, lease_token=token)
+            for key, post, attempts in rows
+        ]
+
+    def ack(self, items: List[LeasedItem]) -> None:
+        now = time.time()
+        self._transaction(
+            ("UPDATE work_items SET status = 'done', last_error = NULL, updated_at = ?"
+             " WHERE item_key = ? AND lease_token = ?", (now, item.key, item.lease_token))
+            for item in items
+        )
+
+    def fail(self, item: LeasedItem, error: str) -> bool:
+        """失敗を記録して再試行に回す。試行回数を使い切ったら dead にして True を返す。"""
+        now = time.time()
+        dead = item.attempts >= self.max_attempts
+        if dead:
+            sql, params = ("UPDATE work_items SET status = 'dead', last_error = ?, updated_at = ?"
+                           " WHERE item_key = ? AND lease_token = ?", (error[:1000], now, item.key, item.lease_token))
+        else:
+            delay = self.retry_delay * (2 ** (item.attempts - 1))
+            sql, params = ("UPDATE work_items SET status = 'queued', last_error = ?, visible_at = ?, updated_at = ?"
+                           " WHERE item_key = ? AND lease_token = ?",
+                           (error[:1000], now + delay, now, item.key, item.lease_token))
+        self._transaction([(sql, params)])
+        return dead
+
+    def release(self, item: LeasedItem, error: Optional[str] = None) -> None:
+        """試行回数に数えずにキューへ戻す（後回し）。"""
+        now = time.time()
+        self._transaction([(
+            "UPDATE work_items SET status = 'queued', attempts = attempts - 1, last_error = ?, visible_at = ?,"
+            " updated_at = ? WHERE item_key = ? AND lease_token = ?",
+            (error[:1000] if error else None, now + self.defer_delay, now, item.key, item.lease_token),
+        )])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM work_items GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class WorkerPool:
+    """WorkQueue から項目を取り出して ActivityPipeline を実行するワーカーの集まり。
+
+    常駐する取り込みサーバー（run_event_ingest.py）でも動き続けるため、処理結果は保持せず
+    ステータスごとの件数だけを数える。項目ごとの結果が必要な呼び出し側は on_outcome で受け取る。
+
+    Args:
+        workers: 同時に動かすワーカー数（環境変数 WORK_QUEUE_WORKERS、既定 4）
+        batch_size: 1回の取り出し件数（環境変数 WORK_QUEUE_BATCH_SIZE、既定 4）
+        on_outcome: 項目の処理が終わるたびに (item_key, 投稿, 処理結果) で呼ぶ（再試行した項目は試行ごと）
+    """
+
+    def __init__(self, queue: WorkQueue, pipeline: ActivityPipeline, workers: Optional[int] = None,
+                 batch_size: Optional[int] = None, poll_interval: float = 1.0,
+                 on_outcome: Optional[Callable[[str, CollectedPost, ItemOutcome], None]] = None):
+        self.queue = queue
+        self.pipeline = pipeline
+        self.workers = workers or int(os.environ.get("WORK_QUEUE_WORKERS", "4"))
+        self.batch_size = batch_size or int(os.environ.get("WORK_QUEUE_BATCH_SIZE", "4"))
+        self.poll_interval = poll_interval
+        self.on_outcome = on_outcome
+        # 処理結果のステータス → 件数（再試行した項目は試行ごとに数える）
+        self.status_counts: Dict[str, int] = {}
+        self.dead_lettered = 0
+
+    @property
+    def processed(self) -> int:
+        return sum(self.status_counts.values())
+
+    def _record(self, item: LeasedItem, outcome: ItemOutcome) -> None:
+        self.status_counts[outcome.status] = self.status_counts.get(outcome.status, 0) + 1
+        if self.on_outcome is not None:
+            self.on_outcome(item.key, item.post, outcome)
+
+    async def _process(self, items: List[LeasedItem]) -> None:
+        posts = [item.post for item in items]
+        try:
+            report = await self.pipeline.run(posts)
+        except Exception as e:
+            log.error(f"❌ キューの {len(items)} 件の処理に失敗: {e}")
+            for item in items:
+                self._finish(item, ItemOutcome(item.post.url, item.post.slack_message_id,
+                                               status="failed", stage="collected", error=str(e)))
+            return
+        # report.items は posts と同じ順（item_key はキュー内で重複しない）
+        done = []
+        for item, outcome in zip(items, report.items):
+            if outcome.status in ("stored", "skipped"):
+                done.append(item)
+                self._record(item, outcome)
+            else:
+                self._finish(item, outcome)
+        self.queue.ack(done)
+
+    def _finish(self, item: LeasedItem, outcome: ItemOutcome) -> None:
+        self._record(item, outcome)
+        if outcome.status == "deferred":
+            self.queue.release(item, outcome.error)
+        elif self.queue.fail(item, outcome.error or "failed"):
+            self.dead_lettered += 1
+            log.error(f"🪦 {item.attempts} 回失敗したため dead にしました: {item.post.url}: {outcome.error}")
+
+    async def _worker(self, producer_done: asyncio.Event) -> None:
+        while True:
+            items = self.queue.lease(self.batch_size)
+            if items:
+                await self._process(items)
+                continue
+            if producer_done.is_set():
+                return
+            try:
+                await asyncio.wait_for(producer_done.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, producer_done: asyncio.Event) -> None:
+        """producer_done が立ち、見えている項目がなくなるまで処理する。
+
+        再試行・後回しで間隔を空けた項目はキューに残り、次回の実行で処理される。
+        """
+        log.info(f"👷 ワーカー {self.workers} 台でキューの処理を開始")
+        await asyncio.gather(*[self._worker(producer_done) for _ in range(self.workers)])
+        log.info(f"👷 キューの処理を終了: {self.processed} 件（dead {self.dead_lettered}）/ 残り {self.queue.stats()}")
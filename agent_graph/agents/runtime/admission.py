@@ -0,0 +1,250 @@
+"""
+エントリーポイントの受付制御（同時実行数の上限と、対話リクエスト優先の待ち行列）。
+
+フロントエンドからの対話（チャットの質問）と、バックフィル等の重い収集が同じ @app.entrypoint に届く。
+スケジューリングがないと、重い実行が同時実行枠を占めて対話リクエストが待たされる。
+
+- 同時に実行するリクエストは ADMISSION_MAX_CONCURRENT まで。超えた分はクラスごとの待ち行列に入る
+- 枠が空いたら対話（interactive）を先に通す。batch は ADMISSION_INTERACTIVE_RESERVED 枠を残して実行し、
+  対話が待っている間は始めない（残りの枠で進む）
+- 待ち行列がクラスごとの上限に達していれば、待たせずに拒否し、再試行までの目安（retry_after）を返す
+- 締め切りまでに枠が空かなければ拒否する（待ち時間も締め切りに含まれる）
+- クラスごとの待ち時間・処理時間の分位点を記録する（コンテナ起動からの直近 ADMISSION_LATENCY_WINDOW 件）
+
+クラスはペイロードの "priority"（interactive / batch）で指定する。省略時は mode=backfill なら batch、それ以外は interactive。
+待ち行列は asyncio の Future で実装しているため、エントリーポイントのイベントループ上で使う。
+
+    async with admission_controller().admit(request_class(payload), timeout=deadline.remaining()) as ticket:
+        ...
+
+環境変数:
+- ADMISSION_CONTROL: false で受付制御を行わない（既定 true）
+- ADMISSION_MAX_CONCURRENT: 同時に実行するリクエスト数（既定 4）
+- ADMISSION_INTERACTIVE_RESERVED: batch が使わずに残す対話用の枠（既定 1）
+- ADMISSION_MAX_QUEUE_INTERACTIVE: 対話の待ち行列の上限（既定 16）
+- ADMISSION_MAX_QUEUE_BATCH: batch の待ち行列の上限（既定 4）
+- ADMISSION_LATENCY_WINDOW: 分位点の計算に使う直近の件数（既定 500）
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+log = logging.getLogger("admission")
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+REQUEST_CLASSES = (INTERACTIVE, BATCH)  # 優先順
+
+# 処理時間の実績がまだないときの1リクエストの見込み（retry_after の計算用）
+DEFAULT_SERVICE_SECONDS = {INTERACTIVE: 30.0, BATCH: 300.0}
+
+
+class AdmissionRejectedError(RuntimeError):
+    """待ち行列が一杯、または締め切りまでに枠が空かないため受け付けなかった。"""
+
+    def __init__(self, request_class: str, reason: str, retry_after: float):
+        self.request_class = request_class
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"{request_class} リクエストを受け付けられません（{reason}）。約{retry_after:.0f}秒後に再試行してください")
+
+
+def request_class(payload: Dict[str, Any]) -> str:
+    """ペイロードからリクエストのクラスを決める。"""
+    input_data = payload.get("input") if isinstance(payload.get("input"), dict) else {}
+    priority = payload.get("priority") or input_data.get("priority")
+    if priority in REQUEST_CLASSES:
+        return priority
+    mode = payload.get("mode") or input_data.get("mode")
+    return BATCH if mode == "backfill" else INTERACTIVE
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 1)
+
+
+class ClassStats:
+    """1クラス分の受付数と、待ち時間・処理時間の直近の記録。"""
+
+    def __init__(self, window: int):
+        self.admitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.wait_ms: Deque[float] = deque(maxlen=window)
+        self.latency_ms: Deque[float] = deque(maxlen=window)
+
+    def mean_service_seconds(self, request_class: str) -> float:
+        if not self.latency_ms:
+            return DEFAULT_SERVICE_SECONDS[request_class]
+        return sum(self.latency_ms) / len(self.latency_ms) / 1000
+
+    @staticmethod
+    def _summary(samples: Deque[float]) -> Dict[str, float]:
+        if not samples:
+            return {}
+        ordered = sorted(samples)
+        return {"p50": _percentile(ordered, 0.5), "p95": _percentile(ordered, 0.95),
+                "p99": _percentile(ordered, 0.99), "max": round(ordered[-1], 1)}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "wait_ms": self._summary(self.wait_ms),
+            "latency_ms": self._summary(self.latency_ms),
+        }
+
+
+@dataclass
+class AdmissionTicket:
+    """受け付けたリクエスト（待ち時間はレスポンスの metadata.admission に含める）。"""
+    request_class: str
+    queued_at: float
+    admitted_at: float = 0.0
+    queue_depth: int = 0  # 到着時にすでに待っていた同じクラスの数
+
+    @property
+    def wait_ms(self) -> float:
+        return round((self.admitted_at - self.queued_at) * 1000, 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"class": self.request_class, "wait_ms": self.wait_ms, "queue_depth_on_arrival": self.queue_depth}
+
+
+class AdmissionController:
+    """同時実行数の上限と、クラスごとの優先度付き待ち行列。"""
+
+    def __init__(self, max_concurrent: Optional[int] = None, interactive_reserved: Optional[int] = None,
+                 max_queue: Optional[Dict[str, int]] = None):
+        self.max_concurrent = max(1, max_concurrent or int(os.environ.get("ADMISSION_MAX_CONCURRENT", "4")))
+        reserved = interactive_reserved if interactive_reserved is not None else int(
+            os.environ.get("ADMISSION_INTERACTIVE_RESERVED", "1")
+        )
+        # batch にも最低1枠は残す
+        self.interactive_reserved = min(max(reserved, 0), self.max_concurrent - 1)
+        self.max_queue = max_queue or {
+            INTERACTIVE: int(os.environ.get("ADMISSION_MAX_QUEUE_INTERACTIVE", "16")),
+            BATCH: int(os.environ.get("ADMISSION_MAX_QUEUE_BATCH", "4")),
+        }
+        window = int(os.environ.get("ADMISSION_LATENCY_WINDOW", "500"))
+        self.running = {c: 0 for c in REQUEST_CLASSES}
+        self.stats = {c: ClassStats(window) for c in REQUEST_CLASSES}
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {c: deque() for c in REQUEST_CLASSES}
+
+    def capacity(self, request_class: str) -> int:
+        return self.max_concurrent - self.interactive_reserved if request_class == BATCH else self.max_concurrent
+
+    def _has_slot(self, request_class: str) -> bool:
+        if sum(self.running.values()) >= self.max_concurrent:
+            return False
+        if request_class == BATCH:
+            return self.running[BATCH] < self.capacity(BATCH) and not self._waiters[INTERACTIVE]
+        return True
+
+    def _wake(self) -> None:
+        """空いた枠を優先順に待ち行列の先頭へ渡す。"""
+        for cls in REQUEST_CLASSES:
+            waiters = self._waiters[cls]
+            while waiters and waiters[0].done():
+                waiters.popleft()
+            while waiters and self._has_slot(cls):
+                future = waiters.popleft()
+                if not future.done():
+                    self.running[cls] += 1
+                    future.set_result(None)
+
+    def _release(self, request_class: str) -> None:
+        self.running[request_class] -= 1
+        self._wake()
+
+    def retry_after(self, request_class: str) -> float:
+        """待ち行列が捌けるまでの目安（秒）。"""
+        depth = len(self._waiters[request_class]) + 1
+        seconds = self.stats[request_class].mean_service_seconds(request_class) * depth / self.capacity(request_class)
+        return round(max(seconds, 1.0), 1)
+
+    def _reject(self, request_class: str, reason: str) -> AdmissionRejectedError:
+        self.stats[request_class].rejected += 1
+        error = AdmissionRejectedError(request_class, reason, self.retry_after(request_class))
+        log.warning(f"🚦 {error}（実行中 {self.running}、待ち {self.queue_depths()}）")
+        return error
+
+    async def _wait_for_slot(self, ticket: AdmissionTicket, timeout: Optional[float]) -> None:
+        cls = ticket.request_class
+        if len(self._waiters[cls]) >= self.max_queue[cls]:
+            raise self._reject(cls, "queue_full")
+        if timeout is not None and timeout <= 0:
+            raise self._reject(cls, "deadline")
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[cls].append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # 枠を受け取った直後に取り消された
+                self._release(cls)
+            with contextlib.suppress(ValueError):
+                self._waiters[cls].remove(future)
+            # 待っていた対話リクエストが抜けると batch が始められることがある
+            self._wake()
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject(cls, "deadline") from None
+            raise
+
+    @contextlib.asynccontextmanager
+    async def admit(self, request_class: str, timeout: Optional[float] = None) -> AsyncIterator[AdmissionTicket]:
+        """枠が空くまで待ってから実行させる（待ち行列が一杯・締め切りなら AdmissionRejectedError）。"""
+        ticket = AdmissionTicket(request_class, queued_at=time.perf_counter(),
+                                 queue_depth=len(self._waiters[request_class]))
+        if not self._waiters[request_class] and self._has_slot(request_class):
+            self.running[request_class] += 1
+        else:
+            await self._wait_for_slot(ticket, timeout)
+        ticket.admitted_at = time.perf_counter()
+        stats = self.stats[request_class]
+        stats.admitted += 1
+        stats.wait_ms.append(ticket.wait_ms)
+        if ticket.wait_ms >= 1000:
+            log.info(f"🚦 {request_class} リクエストを {ticket.wait_ms:.0f}ms 待たせて受付")
+        try:
+            yield ticket
+        finally:
+            stats.completed += 1
+            stats.latency_ms.append(round((time.perf_counter() - ticket.admitted_at) * 1000, 1))
+            self._release(request_class)
+
+    def queue_depths(self) -> Dict[str, int]:
+        return {cls: sum(1 for f in waiters if not f.done()) for cls, waiters in self._waiters.items()}
+
+    def report(self) -> Dict[str, Any]:
+        """クラスごとの実行中・待ち・受付数と分位点（コンテナ起動からの累計）。"""
+        depths = self.queue_depths()
+        return {
+            "max_concurrent": self.max_concurrent,
+            "interactive_reserved": self.interactive_reserved,
+            "classes": {
+                cls: {"running": self.running[cls], "queued": depths[cls], **self.stats[cls].to_dict()}
+                for cls in REQUEST_CLASSES
+            },
+        }
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def admission_controller() -> Optional[AdmissionController]:
+    """プロセス共通の受付制御（ADMISSION_CONTROL=false なら None）。"""
+    global _controller
+    if os.environ.get("ADMISSION_CONTROL", "true").lower() == "false":
+        return None
+    if _controller is None:
+        _controller = AdmissionController()
+    return _controller
@@ -0,0 +1,232 @@
+"""
+1実行あたりのトークン・推定コストの上限（予算）。
+
+長い記事の多いチャンネルでは、1つのプロンプトで使うトークンに上限がなく、コストも実行時間も膨らむ。
+ペイロード（"budget_tokens" / "budget_usd"）または環境変数で上限を決め、現在のコンテキストに置いた
+RunBudget に使用量を積算し、使い切ったら新しい作業を始めない。
+
+- RunBudget: モデルごとの入力・出力トークンと、単価表からの推定コストを積算する
+- BudgetHook: エージェント（slack_agent / firecrawl_agent）のツール呼び出しのたびに accumulated_usage の
+  増分を積算し、使い切ったらツールを取り消し、ツール実行後にモデルを呼ばずにループを終える
+  （DeadlineHook と同じ止め方。実行中のモデル呼び出しは打ち切れないため、最大で1回分は超えうる）
+- 活動分析（agents/pipeline/analyzer.py）は呼び出しごとに結果の使用量（accumulated_usage）を積算する。
+  呼び出し前に使い切っていれば BudgetExceededError になり、パイプラインでは後回し（deferred）になる
+- 使い切ったために止めた作業は RunBudget.note() で記録し、レスポンスの status を partial にする
+
+上限を指定しない場合も使用量は積算し、レスポンスの metadata.budget で報告する。
+
+環境変数:
+- RUN_TOKEN_BUDGET: 1実行のトークン上限（既定 0 = 上限なし、ペイロードの "budget_tokens" が優先）
+- RUN_COST_BUDGET_USD: 1実行の推定コスト上限（USD、既定 0 = 上限なし、ペイロードの "budget_usd" が優先）
+- MODEL_PRICES_JSON: 100万トークンあたりの単価 {"<モデルIDに含まれる文字列>": [入力, 出力]}。
+  既定の単価表（sonnet / haiku / opus）に上書きで追加する
+"""
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import os
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from strands.hooks import AfterInvocationEvent, AfterToolCallEvent, BeforeToolCallEvent, HookProvider, HookRegistry
+
+log = logging.getLogger("budget")
+
+_current_budget: ContextVar[Optional["RunBudget"]] = ContextVar("shiori_budget", default=None)
+
+# 100万トークンあたりの USD（入力, 出力）。モデルIDに含まれる文字列で引く
+DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+    "sonnet": (3.0, 15.0),
+    "haiku": (1.0, 5.0),
+    "opus": (15.0, 75.0),
+}
+# 単価表にないモデルは大型モデル相当として見積もる
+FALLBACK_PRICE = DEFAULT_PRICES["sonnet"]
+
+
+class BudgetExceededError(RuntimeError):
+    """実行の予算（トークン・推定コスト）を使い切ったため、呼び出さなかった。"""
+
+
+def _load_prices() -> Dict[str, Tuple[float, float]]:
+    prices = dict(DEFAULT_PRICES)
+    raw = os.environ.get("MODEL_PRICES_JSON")
+    if raw:
+        try:
+            prices.update({key: (float(v[0]), float(v[1])) for key, v in json.loads(raw).items()})
+        except (ValueError, TypeError, IndexError, AttributeError) as e:
+            log.warning(f"⚠️ MODEL_PRICES_JSON を読めないため既定の単価を使います: {e}")
+    return prices
+
+
+class RunBudget:
+    """1実行のトークン・推定コストの上限と使用量（0 の上限は「上限なし」）。"""
+
+    def __init__(self, max_tokens: int = 0, max_cost_usd: float = 0.0,
+                 prices: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.max_tokens = max_tokens
+        self.max_cost_usd = max_cost_usd
+        self.prices = prices or _load_prices()
+        self._lock = threading.Lock()
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+        self.by_source: Dict[str, Dict[str, Any]] = {}
+        self.events: List[Dict[str, Any]] = []
+
+    @classmethod
+    def start(cls, max_tokens: Optional[int] = None, max_cost_usd: Optional[float] = None) -> "RunBudget":
+        """ペイロードの指定、なければ RUN_TOKEN_BUDGET / RUN_COST_BUDGET_USD で予算を決める。"""
+        tokens = int(max_tokens if max_tokens is not None else os.environ.get("RUN_TOKEN_BUDGET", "0"))
+        cost = float(max_cost_usd if max_cost_usd is not None else os.environ.get("RUN_COST_BUDGET_USD", "0"))
+        return cls(tokens, cost)
+
+    def price_for(self, model_id: str) -> Tuple[float, float]:
+        model_id = (model_id or "").lower()
+        for key, price in self.prices.items():
+            if key.lower() in model_id:
+                return price
+        return FALLBACK_PRICE
+
+    def charge(self, source: str, model_id: str, input_tokens: int, output_tokens: int) -> None:
+        """使用量を積算する（source はエージェント名や分析タスク）。"""
+        if input_tokens <= 0 and output_tokens <= 0:
+            return
+        price_in, price_out = self.price_for(model_id)
+        cost = (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+        with self._lock:
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.cost_usd += cost
+            entry = self.by_source.setdefault(source, {"input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+            entry["input_tokens"] += input_tokens
+            entry["output_tokens"] += output_tokens
+            entry["cost_usd"] += cost
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    @property
+    def limited(self) -> bool:
+        return self.max_tokens > 0 or self.max_cost_usd > 0
+
+    @property
+    def exhausted(self) -> bool:
+        with self._lock:
+            return (self.max_tokens > 0 and self.input_tokens + self.output_tokens >= self.max_tokens) or (
+                self.max_cost_usd > 0 and self.cost_usd >= self.max_cost_usd
+            )
+
+    def note(self, kind: str, **details: Any) -> None:
+        """予算を使い切ったために止めた作業を記録する。"""
+        with self._lock:
+            self.events.append({"kind": kind, **details})
+        log.warning(f"💸 予算を使い切ったため {kind}: {details}")
+
+    @property
+    def hit(self) -> bool:
+        with self._lock:
+            return bool(self.events)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            used = self.input_tokens + self.output_tokens
+            return {
+                "max_tokens": self.max_tokens or None,
+                "max_cost_usd": self.max_cost_usd or None,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "total_tokens": used,
+                "estimated_cost_usd": round(self.cost_usd, 4),
+                "remaining_tokens": max(self.max_tokens - used, 0) if self.max_tokens else None,
+                "remaining_cost_usd": round(max(self.max_cost_usd - self.cost_usd, 0.0), 4) if self.max_cost_usd else None,
+                "hit": bool(self.events),
+                "by_source": {
+                    source: {**entry, "cost_usd": round(entry["cost_usd"], 4)}
+                    for source, entry in self.by_source.items()
+                },
+                "events": list(self.events),
+            }
+
+
+def current_budget() -> Optional[RunBudget]:
+    return _current_budget.get()
+
+
+@contextlib.contextmanager
+def budget_scope(budget: Optional[RunBudget]) -> Iterator[Optional[RunBudget]]:
+    """budget を現在のコンテキストの予算にする（None なら予算なし）。"""
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        try:
+            _current_budget.reset(token)
+        except ValueError:
+            # 非同期ジェネレータが別コンテキストで閉じられた場合
+            _current_budget.set(None)
+
+
+def check_budget(source: str) -> None:
+    """予算を使い切っていれば BudgetExceededError を送出する（モデル呼び出しの前に呼ぶ）。"""
+    budget = current_budget()
+    if budget is not None and budget.exhausted:
+        budget.note("model_call_skipped", source=source)
+        raise BudgetExceededError(f"予算を使い切ったため {source} を実行しません")
+
+
+def _model_id(agent: Any) -> str:
+    try:
+        return agent.model.get_config().get("model_id", "")
+    except Exception:
+        return ""
+
+
+class BudgetHook(HookProvider):
+    """エージェントの使用量を予算に積算し、使い切ったらツールループを止める。"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self._seen_input = 0
+        self._seen_output = 0
+
+    def register_hooks(self, registry: HookRegistry, **kwargs: Any) -> None:
+        registry.add_callback(BeforeToolCallEvent, self._before_tool_call)
+        registry.add_callback(AfterToolCallEvent, self._after_tool_call)
+        registry.add_callback(AfterInvocationEvent, self._after_invocation)
+
+    def _sync(self, agent: Any) -> Optional[RunBudget]:
+        """前回からの accumulated_usage の増分を積算する。"""
+        budget = current_budget()
+        if budget is None:
+            return None
+        usage = agent.event_loop_metrics.accumulated_usage
+        input_tokens, output_tokens = usage.get("inputTokens", 0), usage.get("outputTokens", 0)
+        budget.charge(self.source, _model_id(agent),
+                      input_tokens - self._seen_input, output_tokens - self._seen_output)
+        self._seen_input, self._seen_output = input_tokens, output_tokens
+        return budget
+
+    def _before_tool_call(self, event: BeforeToolCallEvent) -> None:
+        budget = self._sync(event.agent)
+        if budget is not None and budget.exhausted:
+            budget.note("agent_tool_cancelled", source=self.source, tool=event.tool_use.get("name"))
+            event.cancel_tool = "実行の予算を使い切ったため、このツールは実行しませんでした。ここまでの結果で回答を終えてください。"
+
+    def _after_tool_call(self, event: AfterToolCallEvent) -> None:
+        budget = self._sync(event.agent)
+        if budget is not None and budget.exhausted:
+            event.invocation_state.setdefault("request_state", {})["stop_event_loop"] = True
+
+    def _after_invocation(self, event: AfterInvocationEvent) -> None:
+        self._sync(event.agent)
+
+
+def with_budget(agent: Any, source: str) -> Any:
+    """Agent に BudgetHook を付けて返す。"""
+    agent.hooks.add_hook(BudgetHook(source))
+    return agent
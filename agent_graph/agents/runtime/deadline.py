@@ -0,0 +1,161 @@
+"""
+リクエストのデッドライン（締め切り）の伝播。
+
+フロントエンドは一定時間（既定 600 秒）でレスポンスを待つのをやめるため、それを過ぎてから
+完了した作業は捨てられる。ペイロードで受け取った締め切りを現在のコンテキストに置き、
+各ノード・各ツール呼び出しが残り時間を見て、新しい作業を始めない・途中で打ち切る。
+
+- Deadline: 締め切りと、レスポンスの組み立て用に残す時間（reserve）。残り時間は締め切り - reserve
+- DeadlineMiddleware: MCPツール呼び出しを残り時間で打ち切る。残りがなければ呼び出さない。
+  どちらも DeadlineExceededError（MCPUnavailableError）になり、パイプラインでは後回し（deferred）になる
+- DeadlineHook: エージェント（slack_agent / firecrawl_agent）のツール呼び出しを取り消し、
+  残りがなくなったらツール実行後にモデルを呼ばずにループを終える
+- 打ち切った作業は Deadline.note() で記録し、レスポンスの status を partial にする
+
+    deadline = Deadline.start(deadline_ms=payload.get("deadline_ms"))
+    with deadline_scope(deadline):
+        ...
+
+環境変数:
+- REQUEST_DEADLINE_SECONDS: ペイロードに締め切りがないときの制限時間（既定 570、0 で無効）
+- DEADLINE_RESERVE_SECONDS: レスポンスの組み立て用に残す時間（既定 15）
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from strands.hooks import AfterToolCallEvent, BeforeToolCallEvent, HookProvider, HookRegistry
+from strands.tools.mcp.mcp_types import MCPToolResult
+
+from agents.middleware.mcp_middleware import MCPToolMiddleware, ToolCall, ToolCallHandler
+from agents.middleware.resilience import MCPUnavailableError
+
+log = logging.getLogger("deadline")
+
+_current_deadline: ContextVar[Optional["Deadline"]] = ContextVar("shiori_deadline", default=None)
+
+
+class DeadlineExceededError(MCPUnavailableError):
+    """締め切りまでに終わらないため、呼び出さなかった・打ち切った。"""
+
+
+class Deadline:
+    """1リクエストの締め切り（time.monotonic() 基準）と、打ち切った作業の記録。"""
+
+    def __init__(self, expires_at: float, reserve: float = 0.0):
+        self.expires_at = expires_at
+        self.reserve = reserve
+        self._lock = threading.Lock()
+        self.events: List[Dict[str, Any]] = []
+
+    @classmethod
+    def start(cls, deadline_ms: Optional[float] = None, timeout_seconds: Optional[float] = None) -> Optional["Deadline"]:
+        """deadline_ms（UNIXエポックのミリ秒）、timeout_seconds、REQUEST_DEADLINE_SECONDS の順に締め切りを決める。"""
+        now = time.monotonic()
+        reserve = float(os.environ.get("DEADLINE_RESERVE_SECONDS", "15"))
+        if deadline_ms is not None:
+            return cls(now + float(deadline_ms) / 1000 - time.time(), reserve)
+        seconds = float(timeout_seconds if timeout_seconds is not None
+                        else os.environ.get("REQUEST_DEADLINE_SECONDS", "570"))
+        return cls(now + seconds, reserve) if seconds > 0 else None
+
+    def remaining(self) -> float:
+        """新しい作業に使える残り時間（秒、reserve を除く）。"""
+        return self.expires_at - self.reserve - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def note(self, kind: str, **details: Any) -> None:
+        """締め切りのために飛ばした・打ち切った作業を記録する。"""
+        with self._lock:
+            self.events.append({"kind": kind, **details})
+        log.warning(f"⌛ 締め切りのため {kind}: {details}")
+
+    @property
+    def hit(self) -> bool:
+        with self._lock:
+            return bool(self.events)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            events = list(self.events)
+        return {
+            "remaining_ms": round(self.remaining() * 1000, 1),
+            "reserve_ms": round(self.reserve * 1000, 1),
+            "hit": bool(events),
+            "events": events,
+        }
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+@contextlib.contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """deadline を現在のコンテキストの締め切りにする（None なら締め切りなし）。"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        try:
+            _current_deadline.reset(token)
+        except ValueError:
+            # 非同期ジェネレータが別コンテキストで閉じられた場合
+            _current_deadline.set(None)
+
+
+class DeadlineMiddleware(MCPToolMiddleware):
+    """現在の締め切りまでにツール呼び出しを打ち切る（締め切りがなければそのまま通す）。"""
+
+    async def __call__(self, call: ToolCall, call_next: ToolCallHandler) -> MCPToolResult:
+        deadline = current_deadline()
+        if deadline is None:
+            return await call_next(call)
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            deadline.note("tool_skipped", endpoint=call.endpoint, tool=call.name)
+            raise DeadlineExceededError(call.endpoint, call.name, "締め切りを過ぎたため呼び出しません")
+        try:
+            return await asyncio.wait_for(call_next(call), timeout=remaining)
+        except asyncio.TimeoutError:
+            deadline.note("tool_cut_short", endpoint=call.endpoint, tool=call.name)
+            raise DeadlineExceededError(call.endpoint, call.name, f"締め切りのため {remaining:.1f}s で打ち切りました")
+
+
+class DeadlineHook(HookProvider):
+    """エージェントのツールループを締め切りで止める。
+
+    モデル呼び出し自体は打ち切れないため、締め切り後はツールを取り消し、
+    ツール実行後にモデルを呼ばずにループを終える（それまでの出力は次のノードに渡る）。
+    """
+
+    def register_hooks(self, registry: HookRegistry, **kwargs: Any) -> None:
+        registry.add_callback(BeforeToolCallEvent, self._before_tool_call)
+        registry.add_callback(AfterToolCallEvent, self._after_tool_call)
+
+    def _before_tool_call(self, event: BeforeToolCallEvent) -> None:
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired:
+            deadline.note("agent_tool_cancelled", tool=event.tool_use.get("name"))
+            event.cancel_tool = "締め切りを過ぎたため、このツールは実行しませんでした。ここまでの結果で回答を終えてください。"
+
+    def _after_tool_call(self, event: AfterToolCallEvent) -> None:
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired:
+            event.invocation_state.setdefault("request_state", {})["stop_event_loop"] = True
+
+
+def with_deadline(agent: Any) -> Any:
+    """Agent に DeadlineHook を付けて返す。"""
+    agent.hooks.add_hook(DeadlineHook())
+    return agent
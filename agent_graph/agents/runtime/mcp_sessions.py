@@ -0,0 +1,71 @@
+"""
+MCPクライアント（Gateway / Firecrawl / Aurora DSQL）の準備。
+
+AgentCore のエントリーポイントとヘッドレス実行（run_collection.py）で同じ手順を使う。
+返すクライアントはまだセッションを開いていないので、呼び出し側で `with clients.sessions():` の中で使う。
+
+3つのエンドポイントの認証・クライアント作成は並行に行い、それぞれ MCP_CONNECT_TIMEOUT_SECONDS で打ち切る。
+遅延接続（MCP_LAZY_SESSIONS、既定）では `with` でもセッションは開かれず、そのエンドポイントを使う
+ノードの最初のツール呼び出しで開かれる（使われないセッションは開かない）。
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Iterator, List
+
+from strands.tools.mcp import MCPClient
+
+from agents.config.gateway_identity_config import GatewayIdentityConfig
+from agents.config.local_mcp_config import LocalMCPConfig
+from agents.config.mcp_client_factory import connect_timeout
+from agents.config.remote_mcp_config import RemoteMCPConfig
+from agents.runtime.phase_timer import phase
+
+log = logging.getLogger("mcp_sessions")
+
+
+@dataclass
+class MCPClients:
+    gateway: MCPClient
+    firecrawl: MCPClient
+    dsql: MCPClient
+
+    def all(self) -> List[MCPClient]:
+        return [self.gateway, self.firecrawl, self.dsql]
+
+    @contextlib.contextmanager
+    def sessions(self) -> Iterator["MCPClients"]:
+        """3つのMCPセッションを開き（遅延接続時は最初の利用時に開き）、抜けるときに開いたものを閉じる。"""
+        with self.gateway, self.firecrawl, self.dsql:
+            yield self
+
+
+async def _build(endpoint: str, builder: Awaitable[MCPClient]) -> MCPClient:
+    with phase(f"mcp_client.{endpoint}"):
+        try:
+            return await asyncio.wait_for(builder, timeout=connect_timeout(endpoint))
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"MCPクライアント {endpoint} の準備が {connect_timeout(endpoint):.0f} 秒以内に終わりませんでした")
+
+
+async def create_mcp_clients() -> MCPClients:
+    """認証とクライアント作成を3つ並行に行う（PhaseTimer が有効ならフェーズを記録する）。"""
+    # Firecrawl MCP（SSE）の接続設定
+    sse_config = RemoteMCPConfig(
+        provider_name="firecrawl_api_key",
+        base_url=os.environ.get("FIRECRAWL_MCP_BASE_URL", "https://mcp.firecrawl.dev"),
+        http_path_template=None,
+        sse_path_template="/{API_KEY}/v2/sse"
+    )
+    gateway_mcp, sse_mcp, dsql_mcp = await asyncio.gather(
+        # AgentCore Gatewayを用いたMCP
+        _build("gateway", GatewayIdentityConfig().create_mcp_client_and_tools()),
+        _build("firecrawl", sse_config.build_client()),
+        # Aurora DSQL
+        _build("dsql", LocalMCPConfig().build_client()),
+    )
+    return MCPClients(gateway=gateway_mcp, firecrawl=sse_mcp, dsql=dsql_mcp)
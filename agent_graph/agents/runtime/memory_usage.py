@@ -0,0 +1,114 @@
+"""
+リクエスト中のプロセスの RSS（常駐メモリ）の計測。
+
+/proc/self/statm を一定間隔で読み、リクエスト開始時・ピーク・現在の RSS を返す（レスポンスの metadata.memory）。
+RSS はプロセス全体の値なので、同時に処理中のリクエストがあればその分も含まれる。
+重なったリクエスト数の最大を max_concurrent_requests として一緒に返す。
+/proc がない環境（macOS 等）では、プロセス起動からの最大 RSS（getrusage）だけを返す。
+
+    with RssWatermark() as rss:
+        ...
+        metadata["memory"] = rss.to_dict()
+
+環境変数:
+- RSS_SAMPLE_INTERVAL_MS: RSS を読む間隔（既定 100）
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sys
+import threading
+from typing import Any, Dict, Optional
+
+log = logging.getLogger("memory_usage")
+
+_STATM = "/proc/self/statm"
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# 計測中のリクエスト数（RSS に他のリクエストの分が含まれるかの目安）
+_active_lock = threading.Lock()
+_active = 0
+
+
+def current_rss_bytes() -> Optional[int]:
+    """現在の RSS（/proc がなければ None）。"""
+    try:
+        with open(_STATM) as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def max_rss_bytes() -> Optional[int]:
+    """プロセス起動からの最大 RSS。"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _mb(value: Optional[int]) -> Optional[float]:
+    return round(value / (1024 * 1024), 1) if value is not None else None
+
+
+class RssWatermark:
+    """別スレッドで RSS を読み、リクエスト中のピークを記録する。"""
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = interval if interval is not None else (
+            float(os.environ.get("RSS_SAMPLE_INTERVAL_MS", "100")) / 1000
+        )
+        self.start_bytes: Optional[int] = None
+        self.peak_bytes: Optional[int] = None
+        self.max_concurrent = 1
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        rss = current_rss_bytes()
+        if rss is not None and (self.peak_bytes is None or rss > self.peak_bytes):
+            self.peak_bytes = rss
+        with _active_lock:
+            self.max_concurrent = max(self.max_concurrent, _active)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self) -> "RssWatermark":
+        global _active
+        with _active_lock:
+            _active += 1
+        self.start_bytes = current_rss_bytes()
+        self._sample()
+        if self.start_bytes is not None:
+            self._thread = threading.Thread(target=self._run, name="rss-watermark", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        global _active
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        with _active_lock:
+            _active -= 1
+        log.info(f"🧠 RSS: {self.to_dict()}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """これまでの計測結果（ピークは呼び出し時点の値も含める）。"""
+        if self.start_bytes is None:
+            return {"process_max_rss_mb": _mb(max_rss_bytes())}
+        self._sample()
+        current = current_rss_bytes()
+        return {
+            "rss_start_mb": _mb(self.start_bytes),
+            "rss_peak_mb": _mb(self.peak_bytes),
+            "rss_current_mb": _mb(current),
+            "peak_growth_mb": _mb(self.peak_bytes - self.start_bytes),
+            "max_concurrent_requests": self.max_concurrent,
+        }
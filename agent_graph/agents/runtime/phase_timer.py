@@ -0,0 +1,143 @@
+"""
+リクエスト内のフェーズ別レイテンシ計測。
+
+invoke_agent_graph の各フェーズ（トークン取得、APIキー取得、MCP接続、uvx起動、ツール列挙、
+エージェント構築、Graph実行、レスポンス組み立て）と、ノード内のMCPツール呼び出しごとの所要時間を記録する。
+各フェーズ/ツール呼び出しは OpenTelemetry のスパンとしても出力される。
+
+    timer = PhaseTimer()
+    with timer.activated():
+        with phase("fetch_access_token"):
+            ...
+    timer.to_dict()  # → {"phases": [...], "tool_calls": [...]}
+
+phase() は現在のリクエストのタイマーが無い場合でもOTelスパンだけを出す。
+"""
+from __future__ import annotations
+
+import contextlib
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from opentelemetry import trace
+from strands.tools.mcp.mcp_types import MCPToolResult
+
+from agents.middleware.mcp_middleware import MCPToolMiddleware, ToolCall, ToolCallHandler
+
+log = logging.getLogger("phase_timer")
+
+_tracer = trace.get_tracer("shiori_agent_graph")
+_current_timer: ContextVar[Optional["PhaseTimer"]] = ContextVar("shiori_phase_timer", default=None)
+
+
+@dataclass
+class TimingSpan:
+    name: str
+    start_ms: float
+    duration_ms: float
+    status: str = "ok"
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+
+class PhaseTimer:
+    """1リクエスト分のフェーズ/ツール呼び出しの計測結果を保持する。"""
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.phases: List[TimingSpan] = []
+        self.tool_calls: List[TimingSpan] = []
+
+    def _offset_ms(self, at: float) -> float:
+        return round((at - self._origin) * 1000, 1)
+
+    def record(self, name: str, started: float, status: str = "ok", **attributes: Any) -> None:
+        """perf_counter() の開始時刻から現在までをフェーズとして記録する。"""
+        span = TimingSpan(name, self._offset_ms(started), round((time.perf_counter() - started) * 1000, 1),
+                          status, attributes)
+        with self._lock:
+            self.phases.append(span)
+
+    def record_tool_call(self, name: str, started: float, status: str, **attributes: Any) -> None:
+        span = TimingSpan(name, self._offset_ms(started), round((time.perf_counter() - started) * 1000, 1),
+                          status, attributes)
+        with self._lock:
+            self.tool_calls.append(span)
+
+    @contextlib.contextmanager
+    def phase(self, name: str, **attributes: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        status = "ok"
+        with _tracer.start_as_current_span(f"shiori.{name}", attributes=attributes):
+            try:
+                yield
+            except BaseException:
+                status = "error"
+                raise
+            finally:
+                self.record(name, started, status, **attributes)
+
+    @contextlib.contextmanager
+    def activated(self) -> Iterator["PhaseTimer"]:
+        """このタイマーを現在のコンテキストのタイマーにする。"""
+        token = _current_timer.set(self)
+        try:
+            yield self
+        finally:
+            try:
+                _current_timer.reset(token)
+            except ValueError:
+                # 非同期ジェネレータが別コンテキストで閉じられた場合
+                _current_timer.set(None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "phases": [asdict(s) for s in self.phases],
+                "tool_calls": [asdict(s) for s in self.tool_calls],
+            }
+
+    def summary(self) -> str:
+        with self._lock:
+            return " | ".join(f"{s.name}={s.duration_ms}ms" for s in self.phases)
+
+
+def current_timer() -> Optional[PhaseTimer]:
+    return _current_timer.get()
+
+
+@contextlib.contextmanager
+def phase(name: str, **attributes: Any) -> Iterator[None]:
+    """現在のリクエストのタイマーにフェーズを記録する（タイマーが無ければOTelスパンのみ）。"""
+    timer = current_timer()
+    if timer is not None:
+        with timer.phase(name, **attributes):
+            yield
+        return
+    with _tracer.start_as_current_span(f"shiori.{name}", attributes=attributes):
+        yield
+
+
+class ToolTimingMiddleware(MCPToolMiddleware):
+    """MCPツール呼び出しごとの所要時間を記録するミドルウェア。"""
+
+    def __init__(self, timer: PhaseTimer):
+        self.timer = timer
+
+    async def __call__(self, call: ToolCall, call_next: ToolCallHandler) -> MCPToolResult:
+        started = time.perf_counter()
+        status = "error"
+        with _tracer.start_as_current_span(
+            "shiori.mcp_tool_call", attributes={"mcp.endpoint": call.endpoint, "mcp.tool": call.name}
+        ) as span:
+            try:
+                result = await call_next(call)
+                status = result.get("status", "success")
+                span.set_attribute("mcp.status", status)
+                return result
+            finally:
+                self.timer.record_tool_call(call.name, started, status, endpoint=call.endpoint, **call.annotations)
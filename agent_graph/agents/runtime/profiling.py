@@ -0,0 +1,327 @@
+"""
+リクエスト単位のプロファイリング（オプトイン）。
+
+遅い実行で、時間が自前の Python（レスポンス組み立て・extract_message_content・JSON化）に
+かかっているのか、イベントループがブロックされているのか、上流の応答待ちなのかを切り分ける。
+ペイロードの "profile"（または REQUEST_PROFILING=true）で有効にすると、1リクエストにつき次を記録する。
+
+- CPU: 全スレッドのスタックを一定間隔でサンプリング（MCP クライアントは別スレッドのループで動くため）。
+  PROFILE_CPU=cprofile ならエントリーポイントのスレッドを cProfile で決定的に計測する
+- イベントループの遅延: エントリーポイントと Graph のループで、定期タイマーが予定より遅れた時間
+- メモリ: tracemalloc の開始・終了スナップショットの差分（行単位の上位）とピーク
+
+成果物は PROFILE_OUTPUT_DIR に <session_id>-<時刻>.* の名前で書き出す。
+- .summary.json: 上位の関数・ループ遅延・メモリ差分のまとめ（レスポンスの metadata.profile にも要約）
+- .collapsed.txt: サンプリングしたスタック（flamegraph.pl / speedscope で読める collapsed 形式）
+- .prof: cProfile の結果（PROFILE_CPU=cprofile のとき。snakeviz / pstats で読める）
+- .tracemalloc: 終了時のスナップショット（tracemalloc.Snapshot.load で読める。PROFILE_MEMORY=false なら出力しない）
+
+計測はプロセス全体に影響するため、同時にプロファイルできるリクエストは1つだけ（他は計測せずに実行する）。
+
+環境変数:
+- REQUEST_PROFILING: true で全リクエストを計測（既定 false、ペイロードの "profile" が優先）
+- PROFILE_OUTPUT_DIR: 成果物の出力先（既定 .profiles）
+- PROFILE_CPU: sampling(既定) / cprofile
+- PROFILE_SAMPLE_INTERVAL_MS: スタックのサンプリング間隔（既定 5）
+- PROFILE_LOOP_INTERVAL_MS: ループ遅延の計測間隔（既定 50）
+- PROFILE_MEMORY: false で tracemalloc を使わない（確保の多い処理が数倍遅くなるため、CPU だけ見たいとき）
+- PROFILE_TRACEMALLOC_FRAMES: 確保元として保持するフレーム数（既定 1、増やすほど遅くなる）
+"""
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import contextlib
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from strands.hooks import AfterMultiAgentInvocationEvent, BeforeMultiAgentInvocationEvent, HookProvider, HookRegistry
+
+log = logging.getLogger("profiling")
+
+_current_profiler: ContextVar[Optional["RequestProfiler"]] = ContextVar("shiori_profiler", default=None)
+# プロセス全体の計測（tracemalloc・cProfile）は同時に1リクエストだけ
+_active_lock = threading.Lock()
+_TOP = 30
+
+
+class StackSampler:
+    """全スレッドのスタックを一定間隔で取り、collapsed 形式で数える。"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    @staticmethod
+    def _frame_label(frame: Any) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(self._frame_label(frame))
+                    frame = frame.f_back
+                labels.append(f"[{names.get(ident, ident)}]")
+                self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self) -> Dict[str, List[Dict[str, Any]]]:
+        """末端（その関数自身で止まっていた）と累積（スタックに含まれていた）の上位。"""
+        own: Counter = Counter()
+        cumulative: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for label in set(frames):
+                cumulative[label] += count
+        ms = self.interval * 1000
+        return {
+            "self": [{"frame": f, "samples": c, "approx_ms": round(c * ms, 1)} for f, c in own.most_common(_TOP)],
+            "cumulative": [{"frame": f, "samples": c, "approx_ms": round(c * ms, 1)} for f, c in cumulative.most_common(_TOP)],
+        }
+
+
+class LoopLagMonitor:
+    """イベントループ上の定期タイマーの遅れを測る（ブロッキング処理の検出）。"""
+
+    def __init__(self, name: str, interval: float):
+        self.name = name
+        self.interval = interval
+        self.lags: List[float] = []
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+
+    def start(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    def to_dict(self) -> Dict[str, Any]:
+        lags = sorted(self.lags)
+        if not lags:
+            return {"samples": 0}
+
+        def pct(p: float) -> float:
+            return round(lags[min(len(lags) - 1, int(len(lags) * p))] * 1000, 1)
+
+        return {
+            "samples": len(lags),
+            "p50_ms": pct(0.5),
+            "p99_ms": pct(0.99),
+            "max_ms": round(lags[-1] * 1000, 1),
+            "blocked_over_100ms": sum(1 for lag in lags if lag > 0.1),
+            "total_lag_ms": round(sum(lags) * 1000, 1),
+        }
+
+
+class RequestProfiler:
+    """1リクエスト分の CPU・ループ遅延・メモリの計測と成果物の書き出し。"""
+
+    def __init__(self, session_id: str, output_dir: Optional[str] = None):
+        safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", session_id or "unknown")[:80]
+        self.output_dir = Path(output_dir or os.environ.get("PROFILE_OUTPUT_DIR", ".profiles"))
+        self.prefix = f"{safe_id}-{datetime.now().strftime('%Y%m%dT%H%M%S')}"
+        self.cpu_mode = os.environ.get("PROFILE_CPU", "sampling").lower()
+        self.loop_interval = float(os.environ.get("PROFILE_LOOP_INTERVAL_MS", "50")) / 1000
+        self.memory = os.environ.get("PROFILE_MEMORY", "true").lower() != "false"
+        self.sampler: Optional[StackSampler] = None
+        self.cprofile: Optional[cProfile.Profile] = None
+        self.loops: List[LoopLagMonitor] = []
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._started_tracemalloc = False
+        self._started = 0.0
+        self.summary: Dict[str, Any] = {}
+
+    def artifact(self, suffix: str) -> str:
+        return str(self.output_dir / f"{self.prefix}{suffix}")
+
+    @property
+    def artifacts(self) -> List[str]:
+        suffixes = [".summary.json", ".prof" if self.cpu_mode == "cprofile" else ".collapsed.txt"]
+        if self.memory:
+            suffixes.append(".tracemalloc")
+        return [self.artifact(s) for s in suffixes]
+
+    def monitor_loop(self, name: str) -> Optional[LoopLagMonitor]:
+        """実行中のイベントループの遅延計測を始める（計測済みのループなら None）。"""
+        if any(monitor.loop is asyncio.get_running_loop() for monitor in self.loops):
+            return None
+        monitor = LoopLagMonitor(name, self.loop_interval)
+        monitor.start()
+        self.loops.append(monitor)
+        return monitor
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(int(os.environ.get("PROFILE_TRACEMALLOC_FRAMES", "1")))
+                self._started_tracemalloc = True
+            tracemalloc.reset_peak()
+            self._snapshot = tracemalloc.take_snapshot()
+        if self.cpu_mode == "cprofile":
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        else:
+            self.sampler = StackSampler(float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000)
+            self.sampler.start()
+        log.info(f"🔬 プロファイリング開始: {self.prefix}")
+
+    def _cpu_summary(self) -> Dict[str, Any]:
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.artifact(".prof"))
+            out = io.StringIO()
+            pstats.Stats(self.cprofile, stream=out).sort_stats("cumulative").print_stats(_TOP)
+            return {"mode": "cprofile", "top_cumulative": out.getvalue().splitlines()}
+        self.sampler.stop()
+        Path(self.artifact(".collapsed.txt")).write_text(self.sampler.collapsed())
+        return {"mode": "sampling", "samples": self.sampler.samples, **self.sampler.top()}
+
+    def _memory_summary(self) -> Dict[str, Any]:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot.dump(self.artifact(".tracemalloc"))
+        growth = snapshot.compare_to(self._snapshot, "lineno")[:_TOP]
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        return {
+            "traced_current_kb": round(current / 1024, 1),
+            "traced_peak_kb": round(peak / 1024, 1),
+            "top_growth": [
+                {"where": str(stat.traceback[0]), "size_diff_kb": round(stat.size_diff / 1024, 1),
+                 "count_diff": stat.count_diff}
+                for stat in growth
+            ],
+        }
+
+    def stop(self) -> Dict[str, Any]:
+        """計測を止めて成果物を書き出し、要約を返す。"""
+        for monitor in self.loops:
+            monitor.stop()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.summary = {
+            "wall_ms": round((time.perf_counter() - self._started) * 1000, 1),
+            "cpu": self._cpu_summary(),
+            "event_loops": {monitor.name: monitor.to_dict() for monitor in self.loops},
+            "memory": self._memory_summary() if self.memory else None,
+        }
+        Path(self.artifact(".summary.json")).write_text(json.dumps(self.summary, ensure_ascii=False, indent=2))
+        log.info(f"🔬 プロファイリング結果: {self.artifacts}")
+        return self.summary
+
+    def brief(self) -> Dict[str, Any]:
+        """レスポンスに含める要約（成果物のパスとループ遅延）。"""
+        return {
+            "artifacts": self.artifacts,
+            "event_loops": {monitor.name: monitor.to_dict() for monitor in self.loops},
+        }
+
+
+def current_profiler() -> Optional[RequestProfiler]:
+    return _current_profiler.get()
+
+
+@contextlib.contextmanager
+def profiling_scope(session_id: Optional[str]) -> Iterator[Optional[RequestProfiler]]:
+    """session_id が指定されていれば、このコンテキストの間プロファイリングする。
+
+    別のリクエストを計測中なら計測せずに None を返す。
+    """
+    if session_id is None:
+        yield None
+        return
+    if not _active_lock.acquire(blocking=False):
+        log.warning("⚠️ 別のリクエストをプロファイリング中のため、このリクエストは計測しません")
+        yield None
+        return
+    profiler = RequestProfiler(session_id)
+    token = _current_profiler.set(profiler)
+    try:
+        profiler.start()
+        try:
+            profiler.monitor_loop("entrypoint")
+        except RuntimeError:
+            # イベントループ外（同期呼び出し）ではエントリーポイントのループ遅延は測らない
+            pass
+        yield profiler
+    finally:
+        try:
+            profiler.stop()
+        except Exception as e:
+            log.error(f"❌ プロファイリング結果を書き出せません: {e}")
+        finally:
+            try:
+                _current_profiler.reset(token)
+            except ValueError:
+                # 非同期ジェネレータが別コンテキストで閉じられた場合
+                _current_profiler.set(None)
+            _active_lock.release()
+
+
+class GraphLoopProfilingHook(HookProvider):
+    """Graph を実行するイベントループの遅延も計測する。
+
+    同期呼び出し（graph(task)）では Graph は別スレッドのループで動く。
+    エントリーポイントと同じループで動く場合は、エントリーポイントの計測がそのまま Graph の分になる。
+    """
+
+    def __init__(self, profiler: RequestProfiler):
+        self.profiler = profiler
+        self._monitor: Optional[LoopLagMonitor] = None
+
+    def register_hooks(self, registry: HookRegistry, **kwargs: Any) -> None:
+        registry.add_callback(BeforeMultiAgentInvocationEvent, self._before)
+        registry.add_callback(AfterMultiAgentInvocationEvent, self._after)
+
+    def _before(self, event: BeforeMultiAgentInvocationEvent) -> None:
+        self._monitor = self.profiler.monitor_loop("graph")
+
+    def _after(self, event: AfterMultiAgentInvocationEvent) -> None:
+        if self._monitor is not None:
+            self._monitor.stop()
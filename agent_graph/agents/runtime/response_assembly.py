@@ -0,0 +1,129 @@
+"""
+Graph の結果を、ノードが終わるたびにレスポンスへ組み立てる（リクエストあたりのメモリを抑える）。
+
+Graph の終了を待ってから結果を組み立てると、全エージェントの会話履歴（スクレイプしたページ本文を
+含むツール結果）・テキストの一覧・それを連結した full_text を同時に抱えることになり、
+同時リクエストや長いスクレイプでメモリが内容の大きさに比例して増える。
+
+- ノードが終わったら（multiagent_node_stop）そのノードの出力を取り出し、
+  エージェントの会話履歴を解放する（次のノードへの入力はノードの結果から作られるため不要）
+- stream_nodes 指定時はノードの出力を終わった順にレスポンスへ流し（{"type": "node_result", "agent": ...}）、
+  最終レスポンスの agents にはメッセージを残さない（"streamed": true）
+- full_text（フロントエンドのフォールバック表示用で、agents のメッセージと重複する）は上限までに切り詰める
+
+    assembler = NodeResultAssembler(stream_nodes=True)
+    async for event in graph.stream_async(task):
+        if event.get("type") == "multiagent_node_stop":
+            node_data = assembler.add(event["node_id"], event["node_result"], graph.nodes[event["node_id"]].executor)
+
+環境変数:
+- RESPONSE_STREAM_NODES: true でノードの出力を終わった順に流す（既定 false、ペイロードの "stream_nodes" が優先）
+- RESPONSE_FULL_TEXT_MAX_CHARS: full_text の上限文字数（既定 4000、0 で full_text を含めない）
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from strands import Agent
+from strands.multiagent.base import NodeResult
+
+from agents.config.gateway_identity_config import detect_mcp_usage, extract_message_content
+
+log = logging.getLogger("response_assembly")
+
+_TRUNCATED_MARK = "\n\n…（以降は省略。各エージェントの出力は agents を参照してください）"
+
+
+class NodeResultAssembler:
+    """ノードの結果を1つずつ node_data にし、会話履歴を解放する。"""
+
+    def __init__(self, stream_nodes: bool = False, full_text_max_chars: Optional[int] = None):
+        self.stream_nodes = stream_nodes
+        self.full_text_max_chars = full_text_max_chars if full_text_max_chars is not None else int(
+            os.environ.get("RESPONSE_FULL_TEXT_MAX_CHARS", "4000")
+        )
+        self.agents: List[Dict[str, Any]] = []
+        self.mcp_tools_used = False
+        self.released_messages = 0
+        self._texts: List[str] = []
+        self._text_chars = 0
+        self._text_truncated = False
+
+    def _append_text(self, node_name: str, text: str) -> None:
+        if self.full_text_max_chars <= 0 or self._text_truncated:
+            return
+        entry = f"[{node_name}] {text}"
+        room = self.full_text_max_chars - self._text_chars
+        if len(entry) > room:
+            entry = entry[:max(room, 0)]
+            self._text_truncated = True
+        if entry:
+            self._texts.append(entry)
+            self._text_chars += len(entry) + 2
+
+    def _release(self, node_name: str, executor: Any) -> None:
+        """エージェントの会話履歴を捨てる（入れ子の Graph 等は各自の実行後に捨てられる）。"""
+        if isinstance(executor, Agent) and executor.messages:
+            self.released_messages += len(executor.messages)
+            log.debug(f"🧹 {node_name}: 会話履歴 {len(executor.messages)} 件を解放")
+            executor.messages = []
+
+    def add(self, node_name: str, node_result: NodeResult, executor: Any = None) -> Dict[str, Any]:
+        """終わったノードの出力を node_data にして返す（stream_nodes ならそのまま流す）。"""
+        node_data: Dict[str, Any] = {
+            "name": node_name,
+            "messages": [],
+            "execution_time_ms": getattr(node_result, "execution_time", 0),
+            "status": str(getattr(node_result, "status", "unknown")),
+            "tokens_used": node_result.accumulated_usage.get("totalTokens", 0) if hasattr(node_result, "accumulated_usage") else 0
+        }
+
+        # NodeResult.get_agent_results() で入れ子もフラットに
+        for agent_result in node_result.get_agent_results():
+            text, jsons = extract_message_content(agent_result)
+
+            if text:
+                node_data["messages"].append({"type": "text", "content": text})
+                self._append_text(node_name, text)
+
+                # MCPツール使用を検出
+                if detect_mcp_usage(text):
+                    self.mcp_tools_used = True
+
+            if jsons:
+                node_data["messages"].append({"type": "json", "content": jsons})
+
+            log.info(
+                f"📦 Node: {node_name} | status={node_data['status']} | "
+                f"stop_reason={getattr(agent_result, 'stop_reason', None)}"
+            )
+
+        self._release(node_name, executor)
+        if self.stream_nodes:
+            # メッセージは流したものだけにし、最終レスポンスには件数だけ残す
+            self.agents.append({
+                **{k: v for k, v in node_data.items() if k != "messages"},
+                "message_count": len(node_data["messages"]),
+                "streamed": True,
+            })
+        else:
+            self.agents.append(node_data)
+        return node_data
+
+    @property
+    def full_text(self) -> Optional[str]:
+        """フロントエンド表示用の統合テキスト（RESPONSE_FULL_TEXT_MAX_CHARS=0 なら None）。"""
+        if self.full_text_max_chars <= 0:
+            return None
+        if not self._texts:
+            return "レスポンスが空でした"
+        return "\n\n".join(self._texts) + (_TRUNCATED_MARK if self._text_truncated else "")
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "streamed_nodes": self.stream_nodes,
+            "released_messages": self.released_messages,
+            "full_text_truncated": self._text_truncated,
+        }
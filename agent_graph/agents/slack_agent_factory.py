@@ -4,8 +4,10 @@ from strands_tools.code_interpreter import AgentCoreCodeInterpreter
 import logging
 from boto3.session import Session
 import os
+from typing import Any, List, Optional
 
-from agents.config.gateway_identity_config import GatewayIdentityConfig, _filter_tools_by_keyword, _get_tool_name
+from agents.config.gateway_identity_config import GatewayIdentityConfig, _get_tool_name
+from agents.config.tool_catalog import resolve_agent_tools
 
 logger = logging.getLogger("agent_graph")
 logger.setLevel(logging.INFO)
@@ -49,8 +51,9 @@ SLACK_SEARCH_SYSTEM_PROMPT = """
   - "url": 文字列（抽出したアウトプットURL）
   - "slack_upload_time": 文字列（"YYYYMMDD"）
   - "slack_channel": 文字列（常に "{SLACK_CHANNEL}" を入れる）
+  - "slack_message_id": 文字列（メッセージの ts をそのまま入れる。例 "1726470000.123456"）
 - 例:
-  {{"slack_user_id":"U123ABC","slack_user_name":"alice","slack_user_email":null,"url":"https://qiita.com/...","slack_upload_time":"20250916","slack_channel":"{SLACK_CHANNEL}"}}
+  {{"slack_user_id":"U123ABC","slack_user_name":"alice","slack_user_email":null,"url":"https://qiita.com/...","slack_upload_time":"20250916","slack_channel":"{SLACK_CHANNEL}","slack_message_id":"1726470000.123456"}}
 
 <ツール使用の明示指示>
 - 履歴取得: slack___conversationsHistory(channel="{SLACK_CHANNEL}", limit を明示指定し、cursor は**使用しない**)
@@ -63,6 +66,15 @@ SLACK_SEARCH_SYSTEM_PROMPT = """
 - 1メッセージに複数URLがあれば、それぞれ別レコードとして出力。
 """
 
+# 前回収集以降のメッセージだけを取得する場合にシステムプロンプトへ追記する
+SLACK_OLDEST_PROMPT = """
+<取得範囲>
+- slack___conversationsHistory に oldest="{OLDEST}" を必ず指定し、前回収集以降のメッセージのみ取得する。
+- この場合は cursor を使ってよい（上の「cursor は使用しない」より優先）。next_cursor が空になるまで
+  cursor を指定して呼び直し、前回収集以降のメッセージをすべて読む（途中で止めると次回の取得範囲から漏れる）。
+</取得範囲>
+"""
+
 # ==== Slack Agent Factory ======================================================
 # 最終的にはこのAgentを使うのではなく、Agentをベースにしたカスタムノード(nodes/slack_agent_node.py)をGraphに登録する
 class SlackAgentFactory(GatewayIdentityConfig):
@@ -75,7 +87,8 @@ class SlackAgentFactory(GatewayIdentityConfig):
     def __init__(
             self,
             model_id: str,
-            slack_channel: str
+            slack_channel: str,
+            oldest: Optional[str] = None
         ):
         super().__init__()
         self.model_id = model_id
@@ -91,21 +104,29 @@ class SlackAgentFactory(GatewayIdentityConfig):
             raise ValueError("環境変数にSlackチャンネルIDを設定してください")
         if self.slack_channel == "":
             raise ValueError("環境変数にSlackチャンネルIDを設定してください")
+
+        # チャンネルのウォーターマーク（Slackの ts）。指定時はそれ以降のみ取得する
+        self.oldest = oldest
     
     def _render_prompt(self) -> str:
         """環境変数に設定したSLACK_CHANNELをシステムプロンプトに埋め込む"""
-        return self.system_prompt.format(SLACK_CHANNEL=self.slack_channel)
+        prompt = self.system_prompt.format(SLACK_CHANNEL=self.slack_channel)
+        if self.oldest:
+            prompt += SLACK_OLDEST_PROMPT.format(OLDEST=self.oldest)
+        return prompt
 
-    def build(self, mcp_client: MCPClient) -> Agent:
+    def build(self, mcp_client: MCPClient, tools: Optional[List[Any]] = None) -> Agent:
         """
         with mcp_client: の内側で呼び出すこと。
-        MCPツールを列挙し、Slack系のみを選り分けて Agent を生成して返す。
+        MCPツールを列挙し、許可リストのSlackツールのみを選り分けて Agent を生成して返す。
+        tools を渡した場合は列挙を省略する（複数チャンネル分のエージェントを作る場合）。
         """
         # 1) 現在のセッションでツール列挙（← これが with の内側必須）
-        tools = self.get_full_tools_list(mcp_client)
+        if tools is None:
+            tools = self.get_full_tools_list(mcp_client)
 
-        # 2) Slack系ツールに絞る（無ければ全部使う）
-        slack_tools = _filter_tools_by_keyword(tools, "slack") or tools
+        # 2) 許可リストのツールに絞る（一致が無ければSlack系のみ。全ツールは渡さない）
+        slack_tools = resolve_agent_tools("SlackAgent", tools, fallback_keyword="slack")
 
         # 2-2) 最終的なエージェント使用可能ツール
         agent_tools = slack_tools # + [interpreter.code_interpreter]
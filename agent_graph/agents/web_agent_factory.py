@@ -7,6 +7,8 @@ from typing import Any, List
 from agents.config.gateway_identity_config import _get_tool_name
 from agents.config.remote_mcp_config import RemoteMCPConfig
 from agents.config.local_mcp_config import LocalMCPConfig
+from agents.config.tool_catalog import resolve_agent_tools
+from agents.runtime.phase_timer import phase
 
 logger = logging.getLogger("web_search_agent")
 logger.setLevel(logging.INFO)
@@ -97,10 +99,13 @@ class FirecrawlAgentFactory(RemoteMCPConfig, LocalMCPConfig):
 
     def build(self, remote_mcp_client: MCPClient, local_mcp_client: MCPClient) -> Agent:
         # ★ with mcp_client: の内側で呼ぶこと
-        firecrawl_tools = list(remote_mcp_client.list_tools_sync())
-        dsql_tools = list(local_mcp_client.list_tools_sync())
+        with phase("list_tools.firecrawl"):
+            firecrawl_tools = list(remote_mcp_client.list_tools_sync())
+        with phase("list_tools.dsql"):
+            dsql_tools = list(local_mcp_client.list_tools_sync())
 
-        agent_tools: List[Any] = [*firecrawl_tools, *dsql_tools]
+        # 許可リストのツールのみ渡す（全ツールのスキーマを毎ターン送らない）
+        agent_tools: List[Any] = resolve_agent_tools("FirecrawlAgent", [*firecrawl_tools, *dsql_tools])
 
         agent = Agent(
             name="FirecrawlAgent",
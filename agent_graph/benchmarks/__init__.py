@@ -0,0 +1,9 @@
+"""
+Shiori Agent Graph - ローカルベンチマーク
+
+Slack / Firecrawl / Aurora DSQL / Bedrock をローカルのスタンドインに置き換え、
+ネットワーク無しで invoke_agent_graph の性能を計測するためのハーネス。
+
+実行例（agent_graph ディレクトリで）:
+    python -m benchmarks.run_benchmark --requests 20 --concurrency 4 --messages 50
+"""
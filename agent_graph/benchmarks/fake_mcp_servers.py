@@ -0,0 +1,323 @@
+"""
+ベンチマーク用のスタンドインMCPサーバー群。
+
+- Gateway (Slack):   streamable HTTP  → slack___conversationsHistory / slack___usersList / slack___conversationsList
+- Firecrawl:         SSE              → firecrawl_scrape / firecrawl_search
+- Aurora DSQL:       stdio            → readonly_query / transact / get_schema
+
+レスポンスは本物のAPIに近い形（Slackの blocks / reactions、Firecrawlのページ装飾付きMarkdown）を
+決定的に生成するため、ペイロードサイズに依存する処理の計測にも使える。
+
+stdio サーバーは別プロセスとして起動する:
+    python -m benchmarks.fake_mcp_servers dsql --latency-ms 20
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from mcp.server.fastmcp import FastMCP
+
+# スタンドインの Firecrawl は API キーをこの値として受け付ける
+FAKE_API_KEY = "bench-api-key"
+FAKE_ACCESS_TOKEN = "bench-access-token"
+
+_URL_TEMPLATES = [
+    "https://qiita.com/user{n}/items/{h}",
+    "https://zenn.dev/user{n}/articles/{h}",
+    "https://speakerdeck.com/user{n}/{h}",
+    "https://connpass.com/event/{n}{n}/",
+    "https://dev.classmethod.jp/articles/{h}/",
+]
+
+_AWS_SERVICES = ["Amazon S3", "AWS Lambda", "Amazon Bedrock", "Amazon DynamoDB", "Amazon ECS", "Aurora DSQL"]
+
+
+@dataclass
+class FakeDataset:
+    """スタンドインサーバーが返すデータの生成パラメータ。"""
+    channel: str = "CBENCH0001"
+    messages: int = 50
+    users: int = 10
+    page_kb: int = 24
+    tool_latency_ms: float = 30.0
+    seed: int = 42
+
+    def _rng(self, salt: str) -> random.Random:
+        return random.Random(f"{self.seed}:{salt}")
+
+    # ---- Slack ------------------------------------------------------------
+    def slack_messages(self) -> List[Dict[str, Any]]:
+        rng = self._rng("messages")
+        base_ts = 1726450000.0
+        messages = []
+        for i in range(self.messages):
+            user_id = f"UBENCH{i % self.users:04d}"
+            url = rng.choice(_URL_TEMPLATES).format(n=i % self.users, h=f"{rng.getrandbits(40):010x}")
+            text = f"新しい記事を書きました！ <{url}|{url}> ぜひ読んでください"
+            ts = f"{base_ts + i * 3600:.6f}"
+            messages.append({
+                "type": "message",
+                "user": user_id,
+                "text": text,
+                "ts": ts,
+                "client_msg_id": f"{rng.getrandbits(64):016x}",
+                "team": "TBENCH",
+                "blocks": [{
+                    "type": "rich_text",
+                    "block_id": f"b{i}",
+                    "elements": [{"type": "rich_text_section", "elements": [
+                        {"type": "text", "text": "新しい記事を書きました！ "},
+                        {"type": "link", "url": url, "text": url},
+                        {"type": "text", "text": " ぜひ読んでください"},
+                    ]}],
+                }],
+                "attachments": [{
+                    "from_url": url,
+                    "title": f"Benchmark article {i}",
+                    "text": "記事のプレビュー " * 20,
+                    "service_name": url.split("/")[2],
+                    "image_url": f"https://example.com/og/{i}.png",
+                }],
+                "reactions": [{"name": "tada", "users": [f"UBENCH{j:04d}" for j in range(3)], "count": 3}],
+            })
+        # Slackは新しい順に返す
+        return list(reversed(messages))
+
+    def slack_users(self) -> List[Dict[str, Any]]:
+        return [{
+            "id": f"UBENCH{i:04d}",
+            "team_id": "TBENCH",
+            "name": f"bench.user{i}",
+            "real_name": f"Bench User {i}",
+            "tz": "Asia/Tokyo",
+            "profile": {
+                "display_name": f"bench{i}",
+                "email": f"bench{i}@example.com",
+                "image_72": f"https://example.com/avatar/{i}.png",
+                "status_text": "",
+            },
+            "is_bot": False,
+        } for i in range(self.users)]
+
+    # ---- Firecrawl ----------------------------------------------------------
+    def scraped_page(self, url: str) -> Dict[str, Any]:
+        rng = self._rng(url)
+        title = f"{rng.choice(_AWS_SERVICES)} を使った構成を試してみた"
+        chrome = "\n".join([
+            "[ホーム](https://example.com/) | [トレンド](https://example.com/trend) | [ログイン](https://example.com/login)",
+            "![logo](https://example.com/logo.png)",
+            "",
+        ])
+        paragraphs = []
+        target = self.page_kb * 1024
+        size = 0
+        n = 0
+        while size < target:
+            service = rng.choice(_AWS_SERVICES)
+            para = (
+                f"## セクション{n}\n\n{service} の設定手順を説明します。"
+                f"本番環境では可用性とコストのバランスを考慮して構成を選びます。 " * 4
+            )
+            paragraphs.append(para)
+            size += len(para.encode("utf-8"))
+            n += 1
+        footer = "\n".join([
+            "",
+            "## 関連記事",
+            "- [おすすめ記事1](https://example.com/a1)",
+            "- [おすすめ記事2](https://example.com/a2)",
+            "© 2025 Example Inc. | [利用規約](https://example.com/terms) | [プライバシー](https://example.com/privacy)",
+        ])
+        return {
+            "markdown": f"{chrome}# {title}\n\n" + "\n\n".join(paragraphs) + footer,
+            "metadata": {
+                "title": title,
+                "sourceURL": url,
+                "publishedTime": "2025-09-16T09:00:00+09:00",
+                "statusCode": 200,
+            },
+        }
+
+
+async def _latency(dataset: FakeDataset) -> None:
+    if dataset.tool_latency_ms > 0:
+        await asyncio.sleep(dataset.tool_latency_ms / 1000.0)
+
+
+# ==== サーバー定義 ==============================================================
+def build_gateway_server(dataset: FakeDataset, **settings: Any) -> FastMCP:
+    """AgentCore Gateway (Slack) のスタンドイン。"""
+    server = FastMCP("fake-gateway", **settings)
+
+    @server.tool(name="slack___conversationsHistory")
+    async def conversations_history(
+        channel: str,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        oldest: Optional[str] = None,
+        latest: Optional[str] = None,
+    ) -> str:
+        await _latency(dataset)
+        messages = dataset.slack_messages()
+        if oldest:
+            messages = [m for m in messages if float(m["ts"]) > float(oldest)]
+        if latest:
+            messages = [m for m in messages if float(m["ts"]) < float(latest)]
+        offset = int(cursor) if cursor else 0
+        page = messages[offset:offset + limit]
+        next_offset = offset + limit
+        has_more = next_offset < len(messages)
+        return json.dumps({
+            "ok": True,
+            "channel": channel,
+            "messages": page,
+            "has_more": has_more,
+            "response_metadata": {"next_cursor": str(next_offset) if has_more else ""},
+        }, ensure_ascii=False)
+
+    @server.tool(name="slack___usersList")
+    async def users_list(limit: int = 200, cursor: Optional[str] = None) -> str:
+        await _latency(dataset)
+        return json.dumps({"ok": True, "members": dataset.slack_users(),
+                           "response_metadata": {"next_cursor": ""}}, ensure_ascii=False)
+
+    @server.tool(name="slack___conversationsList")
+    async def conversations_list(limit: int = 200, cursor: Optional[str] = None) -> str:
+        await _latency(dataset)
+        channels = [{"id": dataset.channel, "name": "output-bench", "is_member": True}]
+        return json.dumps({"ok": True, "channels": channels,
+                           "response_metadata": {"next_cursor": ""}}, ensure_ascii=False)
+
+    return server
+
+
+def build_firecrawl_server(dataset: FakeDataset, **settings: Any) -> FastMCP:
+    """Firecrawl MCP のスタンドイン。"""
+    server = FastMCP("fake-firecrawl", **settings)
+
+    @server.tool(name="firecrawl_scrape")
+    async def firecrawl_scrape(url: str, formats: Optional[List[str]] = None,
+                               onlyMainContent: bool = False) -> str:
+        await _latency(dataset)
+        return json.dumps(dataset.scraped_page(url), ensure_ascii=False)
+
+    @server.tool(name="firecrawl_search")
+    async def firecrawl_search(query: str, limit: int = 5) -> str:
+        await _latency(dataset)
+        return json.dumps({"data": []})
+
+    return server
+
+
+def build_dsql_server(dataset: FakeDataset) -> FastMCP:
+    """awslabs.aurora-dsql-mcp-server のスタンドイン（書き込みは捨てる）。"""
+    server = FastMCP("fake-aurora-dsql")
+
+    @server.tool(name="readonly_query")
+    async def readonly_query(sql: str) -> str:
+        await _latency(dataset)
+        return "[]"
+
+    @server.tool(name="transact")
+    async def transact(sql_list: List[str]) -> str:
+        await _latency(dataset)
+        return "[]"
+
+    @server.tool(name="get_schema")
+    async def get_schema(table_name: str) -> str:
+        await _latency(dataset)
+        return "[]"
+
+    return server
+
+
+# ==== HTTP サーバーのスレッド起動 =================================================
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class _UvicornThread(threading.Thread):
+    def __init__(self, app: Any, port: int):
+        super().__init__(daemon=True)
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+
+    def run(self) -> None:
+        self.server.run()
+
+    def wait_started(self, timeout: float = 10.0) -> None:
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"スタンドインサーバーが起動しませんでした: port={self.port}")
+            time.sleep(0.02)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.join(timeout=5)
+
+
+class FakeServers:
+    """Gateway と Firecrawl のスタンドインを同一プロセスのスレッドで起動する。
+
+    with FakeServers(dataset) as servers:
+        servers.gateway_url / servers.firecrawl_base_url
+    """
+
+    def __init__(self, dataset: FakeDataset):
+        self.dataset = dataset
+        self._threads: List[_UvicornThread] = []
+        self.gateway_url = ""
+        self.firecrawl_base_url = ""
+
+    def __enter__(self) -> "FakeServers":
+        gateway_port = _free_port()
+        gateway = build_gateway_server(self.dataset, streamable_http_path="/mcp")
+        self._start(gateway.streamable_http_app(), gateway_port)
+        self.gateway_url = f"http://127.0.0.1:{gateway_port}/mcp"
+
+        firecrawl_port = _free_port()
+        firecrawl = build_firecrawl_server(
+            self.dataset,
+            sse_path=f"/{FAKE_API_KEY}/v2/sse",
+            message_path=f"/{FAKE_API_KEY}/v2/messages/",
+        )
+        self._start(firecrawl.sse_app(), firecrawl_port)
+        self.firecrawl_base_url = f"http://127.0.0.1:{firecrawl_port}"
+        return self
+
+    def _start(self, app: Any, port: int) -> None:
+        thread = _UvicornThread(app, port)
+        thread.start()
+        thread.wait_started()
+        self._threads.append(thread)
+
+    def __exit__(self, *exc: Any) -> None:
+        for thread in self._threads:
+            thread.stop()
+        self._threads.clear()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ベンチマーク用スタンドインMCPサーバー")
+    parser.add_argument("server", choices=["dsql"], help="stdioで起動するサーバー")
+    parser.add_argument("--latency-ms", type=float, default=FakeDataset.tool_latency_ms)
+    args = parser.parse_args()
+
+    dataset = FakeDataset(tool_latency_ms=args.latency_ms)
+    build_dsql_server(dataset).run(transport="stdio")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+ローカル検証用の Slack Events 送信スクリプト。
+
+FakeDataset と同じ形の message イベントを現在時刻の ts で作り、Slack と同じ署名を付けて
+run_event_ingest.py の /slack/events に送る。Slack の再送（X-Slack-Retry-Num）や
+不正な署名も再現できる。
+
+    python -m benchmarks.fake_slack_events --url http://localhost:3000/slack/events \\
+        --channel C0123ABCD --count 20 --interval-ms 200 --retry-every 5
+
+署名には SLACK_SIGNING_SECRET（--secret で上書き可）を使う。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from agents.pipeline.slack_events import signature_for
+from benchmarks.fake_mcp_servers import FakeDataset
+
+
+def message_events(channel: str, count: int, users: int = 10, seed: int = 42) -> List[Dict[str, Any]]:
+    """FakeDataset のメッセージを event_callback に包む（ts は送信時に付け直す）。"""
+    dataset = FakeDataset(channel=channel, messages=count, users=users, seed=seed)
+    return [{
+        "type": "event_callback",
+        "team_id": "TBENCH",
+        "api_app_id": "ABENCH",
+        "event_id": f"Ev{uuid.uuid4().hex[:10].upper()}",
+        "event_time": int(time.time()),
+        "event": {**message, "channel": channel, "channel_type": "channel"},
+    } for message in reversed(dataset.slack_messages())]
+
+
+async def send(client: httpx.AsyncClient, url: str, secret: str, payload: Dict[str, Any],
+               retry_num: Optional[int] = None) -> int:
+    body = json.dumps(payload, ensure_ascii=False).encode()
+    timestamp = str(int(time.time()))
+    headers = {
+        "Content-Type": "application/json",
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": signature_for(secret, timestamp, body),
+    }
+    if retry_num is not None:
+        headers["X-Slack-Retry-Num"] = str(retry_num)
+        headers["X-Slack-Retry-Reason"] = "http_timeout"
+    response = await client.post(url, content=body, headers=headers)
+    return response.status_code
+
+
+async def run(args: argparse.Namespace) -> None:
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        status = await send(client, args.url, args.secret, {"type": "url_verification", "challenge": "bench"})
+        print(f"url_verification: {status}")
+        if args.bad_signature:
+            status = await send(client, args.url, args.secret + "x", {"type": "event_callback", "event": {}})
+            print(f"不正な署名: {status}")
+
+        statuses: Dict[int, int] = {}
+        started = time.perf_counter()
+        for i, payload in enumerate(message_events(args.channel, args.count, seed=args.seed)):
+            payload["event"]["ts"] = f"{time.time():.6f}"
+            status = await send(client, args.url, args.secret, payload)
+            statuses[status] = statuses.get(status, 0) + 1
+            if args.retry_every and (i + 1) % args.retry_every == 0:
+                # Slack の再送と同じく、同じイベントをもう一度送る
+                await send(client, args.url, args.secret, payload, retry_num=1)
+            if args.interval_ms:
+                await asyncio.sleep(args.interval_ms / 1000)
+        elapsed = time.perf_counter() - started
+        print(f"{args.count} 件を {elapsed:.1f}s で送信: {statuses}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="署名付きの Slack message イベントを送信する")
+    parser.add_argument("--url", default="http://localhost:3000/slack/events")
+    parser.add_argument("--channel", default="CBENCH0001")
+    parser.add_argument("--count", type=int, default=20, help="送信するメッセージ数")
+    parser.add_argument("--interval-ms", type=float, default=200.0, help="送信間隔")
+    parser.add_argument("--retry-every", type=int, default=0, help="N 件ごとに同じイベントを再送する（0で再送なし）")
+    parser.add_argument("--bad-signature", action="store_true", help="不正な署名のリクエストも1件送る")
+    parser.add_argument("--secret", default=os.environ.get("SLACK_SIGNING_SECRET", ""))
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    asyncio.run(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
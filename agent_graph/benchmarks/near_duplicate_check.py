@@ -0,0 +1,123 @@
+"""
+近似重複の検出（agents/pipeline/near_duplicate.py）の確認。
+
+合成した技術記事を、数%の語句の書き換え・サイトごとの前置き/後書き・URLの違いを加えて
+「別サイトへの転載」にし、索引が元記事を見つけるか、無関係な記事（同じ語彙の別記事）を
+誤って近似重複としないかを調べる。ハミング距離の分布と検出率を表示し、
+転載の検出率が --min-recall を下回るか、誤検出があれば終了コード 1 を返す。
+
+実行例（agent_graph ディレクトリで）:
+    python -m benchmarks.near_duplicate_check --articles 50 --edit-ratio 0.02
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+from agents.pipeline.near_duplicate import NearDuplicateIndex
+
+# 記事ごとに選ぶ技術用語と、どの記事にも現れる言い回し（無関係な記事同士にも共通の shingle ができる）
+TERMS = [
+    "Lambda", "DynamoDB", "S3", "CloudFormation", "CDK", "Bedrock", "ECS", "Fargate", "API Gateway",
+    "Step Functions", "EventBridge", "Aurora", "IAM", "VPC", "CloudWatch", "SQS", "SNS", "Kinesis",
+]
+ENDINGS = ["することができます。", "を確認しました。", "について説明します。", "になりました。", "が必要です。"]
+# 本文の語（かな・漢字の組み合わせの合成語）
+_CHARS = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわん" \
+         "設定構成検証実装運用監視処理接続認証権限料金制限環境開発本番移行変更追加削除更新確認"
+
+
+def vocabulary(rng: random.Random, size: int = 3000) -> List[str]:
+    return ["".join(rng.choice(_CHARS) for _ in range(rng.randint(2, 4))) for _ in range(size)]
+
+
+def article(rng: random.Random, words: List[str], sentences: int) -> List[str]:
+    """技術用語・合成語・共通の言い回しで、語の並びが記事ごとに異なる本文を作る。"""
+    terms = rng.sample(TERMS, 4)
+    return [
+        rng.choice(terms) + "".join(rng.choice(words) for _ in range(rng.randint(6, 12))) + rng.choice(ENDINGS)
+        for _ in range(sentences)
+    ]
+
+
+SITES = [
+    ("Qiita", "この記事は Qiita Advent Calendar の記事です。", "https://qiita.com/{user}/items/{id}"),
+    ("Zenn", "こんにちは、{user} です。", "https://zenn.dev/{user}/articles/{id}"),
+    ("Blog", "個人ブログからの転載です。", "https://{user}.hatenablog.com/entry/{id}"),
+]
+
+
+def cross_post(rng: random.Random, words: List[str], body: List[str], edit_ratio: float,
+               user: str, item: str) -> str:
+    """body を別サイト向けに直した転載（本文の文字の約 edit_ratio を語の書き換えで変え、前後の定型文とURLを変える）。"""
+    text = "\n".join(body)
+    edits = max(1, round(len(text) * edit_ratio / 3))
+    edited = list(body)
+    for _ in range(edits):
+        i = rng.randrange(len(edited))
+        word = rng.choice(words)
+        at = rng.randrange(len(edited[i]))
+        edited[i] = edited[i][:at] + word + edited[i][at + len(word):]
+    name, header, url = rng.choice(SITES)
+    footer = f"{name} で公開した記事のリンク: {url.format(user=user, id=item)}"
+    return "\n".join([f"# {name}", header.format(user=user), *edited, footer])
+
+
+def run(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = NearDuplicateIndex(path=str(Path(tmp) / "near_duplicate.idx"), max_distance=args.max_distance)
+        words = vocabulary(rng)
+        originals = [article(rng, words, args.sentences) for _ in range(args.articles)]
+        for n, body in enumerate(originals):
+            fingerprint = index.fingerprint("\n".join(body))
+            index.add(fingerprint, f"{n:064x}")
+
+        distances: List[int] = []
+        detected = 0
+        for n, body in enumerate(originals):
+            fingerprint = index.fingerprint(cross_post(rng, words, body, args.edit_ratio, f"user{n}", f"{n:020x}"))
+            distances.append(min((fingerprint ^ fp).bit_count() for fp in index._fingerprints))
+            found = index.find(fingerprint)
+            detected += found is not None and found[0] == f"{n:064x}"
+
+        false_positives = 0
+        unrelated: List[int] = []
+        for _ in range(args.articles):
+            fingerprint = index.fingerprint("\n".join(article(rng, words, args.sentences)))
+            unrelated.append(min((fingerprint ^ fp).bit_count() for fp in index._fingerprints))
+            false_positives += index.find(fingerprint) is not None
+
+    recall = detected / args.articles
+    print("=" * 60)
+    print(f"articles={args.articles} sentences={args.sentences} edit_ratio={args.edit_ratio} "
+          f"max_distance={index.max_distance}")
+    print(f"cross-post distance: min={min(distances)} median={statistics.median(distances)} max={max(distances)}")
+    print(f"unrelated distance:  min={min(unrelated)} median={statistics.median(unrelated)} max={max(unrelated)}")
+    print(f"detected: {detected}/{args.articles} (recall={recall:.2f}) | false positives: {false_positives}")
+    print("=" * 60)
+    return 0 if recall >= args.min_recall and not false_positives else 1
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="近似重複の検出の確認")
+    parser.add_argument("--articles", type=int, default=50, help="元記事の数")
+    parser.add_argument("--sentences", type=int, default=40, help="1記事の文の数")
+    parser.add_argument("--edit-ratio", type=float, default=0.02, help="転載で書き換える本文の文字の割合")
+    parser.add_argument("--max-distance", type=int, help="NEAR_DUP_MAX_DISTANCE の代わりに使う距離")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="転載の検出率の下限")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    sys.exit(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
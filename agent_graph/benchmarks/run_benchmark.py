@@ -0,0 +1,289 @@
+"""
+invoke_agent_graph のエンドツーエンドベンチマーク。
+
+Slack(Gateway) / Firecrawl / Aurora DSQL をスタンドインMCPサーバーに、Bedrock をスタブモデルに
+置き換えて、指定した並列度・リクエスト数でエントリーポイントを駆動し、
+レイテンシのパーセンタイル・スループット・メモリ使用量を報告する。
+
+実行例（agent_graph ディレクトリで）:
+    python -m benchmarks.run_benchmark --requests 20 --concurrency 4 --messages 50 \\
+        --model-latency-ms 300 --tool-latency-ms 30 --output bench.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+from unittest import mock
+
+from benchmarks.fake_mcp_servers import FAKE_ACCESS_TOKEN, FAKE_API_KEY, FakeDataset, FakeServers
+from benchmarks.stub_model import StubModel
+
+AGENT_GRAPH_DIR = Path(__file__).resolve().parent.parent
+
+# スタブモデルに差し替える Agent の参照元モジュール
+AGENT_MODULES = [
+    "shiori_agent_graph",
+    "agents.slack_agent_factory",
+    "agents.web_agent_factory",
+    "agents.pipeline.analyzer",
+]
+
+
+@dataclass
+class RequestSample:
+    index: int
+    latency_ms: float
+    status: str
+    total_tokens: int = 0
+    error: Optional[str] = None
+    rss_peak_growth_mb: Optional[float] = None  # レスポンスの metadata.memory（同時リクエストの分を含む）
+    request_class: str = "interactive"
+
+
+@dataclass
+class BenchmarkReport:
+    requests: int
+    concurrency: int
+    wall_time_s: float
+    throughput_rps: float
+    latency_ms: Dict[str, float]
+    latency_ms_by_class: Dict[str, Dict[str, float]]
+    statuses: Dict[str, int]
+    total_tokens: int
+    max_rss_mb: float
+    max_request_rss_growth_mb: Optional[float]
+    tracemalloc_peak_mb: Optional[float]
+    config: Dict[str, Any] = field(default_factory=dict)
+    samples: List[RequestSample] = field(default_factory=list)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def _max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS は bytes
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def _prepare_environment(servers: FakeServers, dataset: FakeDataset) -> None:
+    """shiori_agent_graph の import 前に必要な環境変数を設定する。"""
+    os.environ["LANGFUSE_ENABLED"] = "false"
+    os.environ["GATEWAY_URL"] = servers.gateway_url
+    os.environ["FIRECRAWL_MCP_BASE_URL"] = servers.firecrawl_base_url
+    os.environ["SLACK_CHANNEL"] = dataset.channel
+    os.environ.setdefault("PROVIDER_NAME", "bench-provider")
+    os.environ.setdefault("COGNITO_SCOPE", "bench/scope")
+    os.environ.setdefault("AURORA_DSQL_CLUSTER_ENDPOINT", "bench.dsql.local")
+    os.environ.setdefault("AURORA_DSQL_DATABASE_USER", "bench")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    # スタンドインサーバーに上流のレート制限はないので、明示しない限り待たせない
+    os.environ.setdefault("RATE_LIMIT", "false")
+
+
+def _configure_cassette(args: argparse.Namespace) -> None:
+    """録音済みカセットの再生（スタンドインの代わりに実トラフィックを使う）。"""
+    if not args.replay_cassette:
+        return
+    os.environ["MCP_CASSETTE_MODE"] = "replay"
+    os.environ["MCP_CASSETTE_NAME"] = args.replay_cassette
+    os.environ["MCP_CASSETTE_TIME_SCALE"] = str(args.time_scale)
+
+
+@contextlib.contextmanager
+def local_stand_ins(model: StubModel, dataset: FakeDataset) -> Iterator[None]:
+    """認証・DSQLサーバー起動・モデルをスタンドインに差し替える。"""
+    from mcp import StdioServerParameters
+    from strands import Agent
+
+    from agents.config.gateway_identity_config import GatewayIdentityConfig
+    from agents.config.local_mcp_config import LocalMCPConfig
+    from agents.config.remote_mcp_config import RemoteMCPConfig
+
+    async def _access_token(self) -> str:
+        return FAKE_ACCESS_TOKEN
+
+    async def _api_key(self, needs_key: bool) -> Optional[str]:
+        return FAKE_API_KEY if needs_key else None
+
+    def _dsql_server(self) -> StdioServerParameters:
+        return StdioServerParameters(
+            command=sys.executable,
+            args=["-m", "benchmarks.fake_mcp_servers", "dsql", "--latency-ms", str(dataset.tool_latency_ms)],
+            cwd=str(AGENT_GRAPH_DIR),
+        )
+
+    def _stub_agent(*args: Any, **kwargs: Any) -> Agent:
+        kwargs["model"] = model
+        kwargs.setdefault("callback_handler", None)
+        return Agent(*args, **kwargs)
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(mock.patch.object(GatewayIdentityConfig, "get_access_token", _access_token))
+        stack.enter_context(mock.patch.object(RemoteMCPConfig, "_get_api_key", _api_key))
+        stack.enter_context(mock.patch.object(LocalMCPConfig, "_server_parameters", _dsql_server))
+        for module in AGENT_MODULES:
+            stack.enter_context(mock.patch(f"{module}.Agent", _stub_agent))
+        yield
+
+
+async def _drive(entrypoint: Any, args: argparse.Namespace) -> List[RequestSample]:
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    # batch_every 件ごとに1件を batch クラスで送る（受付制御の優先度の確認用）
+    def _class_of(index: int) -> str:
+        return "batch" if args.batch_every and index % args.batch_every == 0 else "interactive"
+
+    async def _one(index: int) -> RequestSample:
+        request_class = _class_of(index)
+        async with semaphore:
+            payload = {"prompt": args.prompt, "sessionId": f"bench-{index:05d}", "priority": request_class}
+            started = time.perf_counter()
+            last: Any = None
+            async for chunk in entrypoint(payload):
+                last = chunk
+            latency_ms = (time.perf_counter() - started) * 1000
+
+        if isinstance(last, str):
+            try:
+                data = json.loads(last)
+                memory = data.get("metadata", {}).get("memory", {})
+                return RequestSample(index, latency_ms, data.get("status", "unknown"), data.get("total_tokens", 0),
+                                     rss_peak_growth_mb=memory.get("peak_growth_mb"), request_class=request_class)
+            except json.JSONDecodeError:
+                return RequestSample(index, latency_ms, "unparsable", request_class=request_class)
+        error = last.get("error") if isinstance(last, dict) else None
+        status = last.get("status", "error") if isinstance(last, dict) else "error"
+        return RequestSample(index, latency_ms, status, error=str(error), request_class=request_class)
+
+    return await asyncio.gather(*[_one(i) for i in range(args.requests)])
+
+
+def run(args: argparse.Namespace) -> BenchmarkReport:
+    dataset = FakeDataset(
+        messages=args.messages,
+        users=args.users,
+        page_kb=args.page_kb,
+        tool_latency_ms=args.tool_latency_ms,
+    )
+    model = StubModel(latency_ms=args.model_latency_ms, jitter_ms=args.model_jitter_ms, seed=0)
+
+    with FakeServers(dataset) as servers:
+        _prepare_environment(servers, dataset)
+        _configure_cassette(args)
+        import shiori_agent_graph
+
+        with local_stand_ins(model, dataset):
+            if args.tracemalloc:
+                tracemalloc.start()
+            started = time.perf_counter()
+            samples = asyncio.run(_drive(shiori_agent_graph.invoke_agent_graph, args))
+            wall = time.perf_counter() - started
+            peak = None
+            if args.tracemalloc:
+                peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+                tracemalloc.stop()
+
+    latencies = [s.latency_ms for s in samples]
+    by_class: Dict[str, List[float]] = {}
+    for sample in samples:
+        by_class.setdefault(sample.request_class, []).append(sample.latency_ms)
+    rss_growths = [s.rss_peak_growth_mb for s in samples if s.rss_peak_growth_mb is not None]
+    statuses: Dict[str, int] = {}
+    for sample in samples:
+        statuses[sample.status] = statuses.get(sample.status, 0) + 1
+
+    return BenchmarkReport(
+        requests=len(samples),
+        concurrency=args.concurrency,
+        wall_time_s=round(wall, 3),
+        throughput_rps=round(len(samples) / wall, 3) if wall else 0.0,
+        latency_ms={
+            "p50": round(_percentile(latencies, 50), 1),
+            "p90": round(_percentile(latencies, 90), 1),
+            "p95": round(_percentile(latencies, 95), 1),
+            "p99": round(_percentile(latencies, 99), 1),
+            "mean": round(statistics.fmean(latencies), 1) if latencies else 0.0,
+            "max": round(max(latencies), 1) if latencies else 0.0,
+        },
+        latency_ms_by_class={
+            cls: {"count": len(values), "p50": round(_percentile(values, 50), 1), "p95": round(_percentile(values, 95), 1)}
+            for cls, values in by_class.items()
+        },
+        statuses=statuses,
+        total_tokens=sum(s.total_tokens for s in samples),
+        max_rss_mb=round(_max_rss_mb(), 1),
+        max_request_rss_growth_mb=max(rss_growths) if rss_growths else None,
+        tracemalloc_peak_mb=round(peak, 1) if peak is not None else None,
+        config={k: v for k, v in vars(args).items() if k != "output"},
+        samples=samples,
+    )
+
+
+def _print_report(report: BenchmarkReport) -> None:
+    print("=" * 60)
+    print(f"requests={report.requests} concurrency={report.concurrency} wall={report.wall_time_s}s")
+    print(f"throughput: {report.throughput_rps} req/s")
+    print("latency(ms): " + " ".join(f"{k}={v}" for k, v in report.latency_ms.items()))
+    if len(report.latency_ms_by_class) > 1:
+        for cls, values in report.latency_ms_by_class.items():
+            print(f"  {cls}: " + " ".join(f"{k}={v}" for k, v in values.items()))
+    print(f"statuses: {report.statuses}")
+    print(f"total_tokens: {report.total_tokens}")
+    print(f"max_rss: {report.max_rss_mb} MB" + (
+        f" | request_rss_growth(max): {report.max_request_rss_growth_mb} MB"
+        if report.max_request_rss_growth_mb is not None else ""
+    ) + (
+        f" | tracemalloc_peak: {report.tracemalloc_peak_mb} MB" if report.tracemalloc_peak_mb is not None else ""
+    ))
+    print("=" * 60)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Shiori Agent Graph ローカルベンチマーク")
+    parser.add_argument("--requests", type=int, default=10, help="総リクエスト数")
+    parser.add_argument("--concurrency", type=int, default=2, help="同時実行数")
+    parser.add_argument("--messages", type=int, default=50, help="チャンネル内のメッセージ数")
+    parser.add_argument("--users", type=int, default=10, help="Slackユーザー数")
+    parser.add_argument("--page-kb", type=int, default=24, help="スクレイプ結果1ページのサイズ(KB)")
+    parser.add_argument("--model-latency-ms", type=float, default=300.0, help="モデル1ターンのレイテンシ")
+    parser.add_argument("--model-jitter-ms", type=float, default=50.0, help="モデルレイテンシの揺らぎ")
+    parser.add_argument("--tool-latency-ms", type=float, default=30.0, help="MCPツール1呼び出しのレイテンシ")
+    parser.add_argument("--prompt", default="Slackチャンネルから最新のアウトプットを収集して保存してください")
+    parser.add_argument("--replay-cassette", help="MCP_CASSETTE_DIR 配下のカセット名を再生する")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="カセット再生時の待ち時間の倍率（0で待ちなし）")
+    parser.add_argument("--batch-every", type=int, default=0,
+                        help="N 件ごとに1件を priority=batch で送る（0で全件 interactive）")
+    parser.add_argument("--tracemalloc", action="store_true", help="tracemallocでPythonヒープのピークを計測")
+    parser.add_argument("--output", help="結果をJSONで書き出すパス")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    report = run(args)
+    _print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(asdict(report), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
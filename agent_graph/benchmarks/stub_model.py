@@ -0,0 +1,265 @@
+"""
+ベンチマーク用のスタブモデルプロバイダー（Bedrockの代替）。
+
+Strands の Model インターフェースを実装し、設定可能なレイテンシで
+SlackAgent / FirecrawlAgent の典型的なツール呼び出し手順を再現する。
+
+- SlackAgent:     conversationsHistory → usersList → JSONL出力
+- FirecrawlAgent: URLごとに firecrawl_scrape → transact → 結果サマリー
+- 構造化出力:      invoke_async(structured_output_model=...) のツール（StructuredOutputTool）を
+                   入力スキーマから組み立てた既定値で呼ぶ（活動分析）
+- その他:          固定テキスト
+structured_output はモデルのフィールド型から既定値を組み立てて返す。
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncGenerator, AsyncIterable, Dict, List, Literal, Optional, Type, TypeVar, Union, get_args, get_origin
+
+from pydantic import BaseModel
+from strands.models.model import Model
+
+T = TypeVar("T", bound=BaseModel)
+
+_URL_PATTERN = re.compile(r"https?://[^\s<>|\"'\\]+")
+_CHANNEL_PATTERN = re.compile(r'channel="([A-Z0-9]+)"')
+_JST = timezone(timedelta(hours=9))
+# strands の StructuredOutputTool が説明文の先頭に付ける文言
+_STRUCTURED_OUTPUT_TOOL_PREFIX = "IMPORTANT: This StructuredOutputTool"
+
+
+def _estimate_tokens(value: Any) -> int:
+    """おおよそのトークン数（4文字≒1トークン）。"""
+    return max(1, len(json.dumps(value, ensure_ascii=False)) // 4)
+
+
+def _tool_uses(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        block["toolUse"]
+        for message in messages if message.get("role") == "assistant"
+        for block in message.get("content", []) if "toolUse" in block
+    ]
+
+
+def _tool_result_texts(messages: List[Dict[str, Any]]) -> Dict[str, str]:
+    """toolUseId → toolResult のテキスト。"""
+    results: Dict[str, str] = {}
+    for message in messages:
+        for block in message.get("content", []):
+            result = block.get("toolResult") if isinstance(block, dict) else None
+            if result:
+                results[result.get("toolUseId", "")] = "".join(
+                    c.get("text", "") for c in result.get("content", []) if isinstance(c, dict)
+                )
+    return results
+
+
+def _first_user_text(messages: List[Dict[str, Any]]) -> str:
+    for message in messages:
+        if message.get("role") == "user":
+            return "".join(b.get("text", "") for b in message.get("content", []) if isinstance(b, dict))
+    return ""
+
+
+def _default_for(annotation: Any) -> Any:
+    """pydanticフィールドの型から妥当な既定値を作る。"""
+    origin = get_origin(annotation)
+    if origin is Literal:
+        return get_args(annotation)[0]
+    if origin is Union:
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        return _default_for(args[0]) if args else None
+    if origin in (list, List):
+        return []
+    if origin in (dict, Dict):
+        return {}
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return _fake_instance(annotation)
+    if annotation is int:
+        return 0
+    if annotation is float:
+        return 0.9
+    if annotation is bool:
+        return False
+    return "stub"
+
+
+def _default_for_schema(schema: Dict[str, Any], defs: Dict[str, Any]) -> Any:
+    """JSON スキーマ（構造化出力ツールの入力スキーマ）から妥当な既定値を作る。"""
+    if "$ref" in schema:
+        return _default_for_schema(defs.get(schema["$ref"].split("/")[-1], {}), defs)
+    if "enum" in schema:
+        return schema["enum"][0]
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"]
+            return _default_for_schema(options[0], defs) if options else None
+    kind = schema.get("type")
+    if kind == "object":
+        properties = schema.get("properties", {})
+        return {name: _default_for_schema(properties[name], defs) for name in schema.get("required", [])}
+    if kind == "array":
+        return []
+    if kind == "integer":
+        return 0
+    if kind == "number":
+        return min(0.9, schema.get("maximum", 0.9))
+    if kind == "boolean":
+        return False
+    return "stub"
+
+
+def _structured_output_tool(tool_specs: List[Dict[str, Any]], tool_choice: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """構造化出力のツール（強制されていればそのツール）の仕様を返す。"""
+    forced = (tool_choice or {}).get("tool", {}).get("name")
+    for spec in tool_specs:
+        if spec["name"] == forced or spec.get("description", "").startswith(_STRUCTURED_OUTPUT_TOOL_PREFIX):
+            return spec
+    return None
+
+
+def _fake_instance(output_model: Type[T]) -> T:
+    values = {}
+    for name, field in output_model.model_fields.items():
+        if not field.is_required():
+            continue
+        values[name] = _default_for(field.annotation)
+    return output_model.model_validate(values)
+
+
+class StubModel(Model):
+    """レイテンシ設定可能なスタブモデル。
+
+    Args:
+        latency_ms: 1ターンあたりの固定レイテンシ
+        jitter_ms: レイテンシに加える一様乱数の幅
+        ms_per_output_token: 出力トークンあたりの追加レイテンシ
+    """
+
+    def __init__(self, latency_ms: float = 500.0, jitter_ms: float = 100.0,
+                 ms_per_output_token: float = 0.0, seed: Optional[int] = None, **config: Any):
+        self.config: Dict[str, Any] = {
+            "model_id": "stub",
+            "latency_ms": latency_ms,
+            "jitter_ms": jitter_ms,
+            "ms_per_output_token": ms_per_output_token,
+            **config,
+        }
+        self._rng = random.Random(seed)
+
+    def update_config(self, **model_config: Any) -> None:
+        self.config.update(model_config)
+
+    def get_config(self) -> Dict[str, Any]:
+        return self.config
+
+    async def _sleep(self, output_tokens: int) -> float:
+        latency = self.config["latency_ms"] + self._rng.uniform(0, self.config["jitter_ms"])
+        latency += output_tokens * self.config["ms_per_output_token"]
+        await asyncio.sleep(latency / 1000.0)
+        return latency
+
+    # ---- 次のアクションの決定 -------------------------------------------------
+    def _next_action(self, messages: List[Dict[str, Any]], tool_names: List[str],
+                     system_prompt: str) -> Dict[str, Any]:
+        uses = _tool_uses(messages)
+        called = [u["name"] for u in uses]
+
+        if "slack___conversationsHistory" in tool_names:
+            match = _CHANNEL_PATTERN.search(system_prompt or "")
+            channel = match.group(1) if match else "CBENCH0001"
+            if "slack___conversationsHistory" not in called:
+                return {"tool": "slack___conversationsHistory", "input": {"channel": channel, "limit": 100}}
+            if "slack___usersList" in tool_names and "slack___usersList" not in called:
+                return {"tool": "slack___usersList", "input": {}}
+            return {"text": self._slack_jsonl(messages, uses, channel)}
+
+        if "firecrawl_scrape" in tool_names:
+            urls = list(dict.fromkeys(_URL_PATTERN.findall(_first_user_text(messages))))
+            steps: List[Dict[str, Any]] = []
+            for url in urls:
+                steps.append({"tool": "firecrawl_scrape", "input": {"url": url, "formats": ["markdown"]}})
+                if "transact" in tool_names:
+                    sql = f"INSERT INTO output_history.activities (url) VALUES ('{url}')"
+                    steps.append({"tool": "transact", "input": {"sql_list": [sql]}})
+            if len(uses) < len(steps):
+                return steps[len(uses)]
+            return {"text": json.dumps({"processed_urls": len(urls)}, ensure_ascii=False)}
+
+        return {"text": "ok"}
+
+    def _slack_jsonl(self, messages: List[Dict[str, Any]], uses: List[Dict[str, Any]], channel: str) -> str:
+        results = _tool_result_texts(messages)
+        history_id = next(u["toolUseId"] for u in uses if u["name"] == "slack___conversationsHistory")
+        try:
+            history = json.loads(results.get(history_id, "{}"))
+        except json.JSONDecodeError:
+            history = {}
+        lines = []
+        for message in history.get("messages", []):
+            for url in dict.fromkeys(_URL_PATTERN.findall(message.get("text", ""))):
+                upload = datetime.fromtimestamp(float(message.get("ts", 0)), _JST).strftime("%Y%m%d")
+                lines.append(json.dumps({
+                    "slack_user_id": message.get("user"),
+                    "slack_user_name": None,
+                    "slack_user_email": None,
+                    "url": url,
+                    "slack_upload_time": upload,
+                    "slack_channel": channel,
+                    "slack_message_id": message.get("ts"),
+                }, ensure_ascii=False))
+        return "\n".join(lines)
+
+    # ---- Model インターフェース -----------------------------------------------
+    async def stream(
+        self,
+        messages: List[Dict[str, Any]],
+        tool_specs: Optional[List[Dict[str, Any]]] = None,
+        system_prompt: Optional[str] = None,
+        **kwargs: Any,
+    ) -> AsyncIterable[Dict[str, Any]]:
+        tool_names = [spec["name"] for spec in tool_specs or []]
+        structured = _structured_output_tool(tool_specs or [], kwargs.get("tool_choice"))
+        if structured is not None:
+            schema = structured["inputSchema"]["json"]
+            action = {"tool": structured["name"], "input": _default_for_schema(schema, schema.get("$defs", {}))}
+        else:
+            action = self._next_action(messages, tool_names, system_prompt or "")
+
+        input_tokens = _estimate_tokens(messages) + _estimate_tokens(system_prompt or "") + _estimate_tokens(tool_specs or [])
+        output_tokens = _estimate_tokens(action)
+        latency = await self._sleep(output_tokens)
+
+        yield {"messageStart": {"role": "assistant"}}
+        if "tool" in action:
+            tool_use_id = f"tooluse_{uuid.uuid4().hex[:16]}"
+            yield {"contentBlockStart": {"start": {"toolUse": {"name": action["tool"], "toolUseId": tool_use_id}}}}
+            yield {"contentBlockDelta": {"delta": {"toolUse": {"input": json.dumps(action["input"], ensure_ascii=False)}}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "tool_use"}}
+        else:
+            yield {"contentBlockStart": {"start": {}}}
+            yield {"contentBlockDelta": {"delta": {"text": action["text"]}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+        yield {"metadata": {
+            "usage": {"inputTokens": input_tokens, "outputTokens": output_tokens,
+                      "totalTokens": input_tokens + output_tokens},
+            "metrics": {"latencyMs": int(latency)},
+        }}
+
+    async def structured_output(
+        self,
+        output_model: Type[T],
+        prompt: List[Dict[str, Any]],
+        system_prompt: Optional[str] = None,
+        **kwargs: Any,
+    ) -> AsyncGenerator[Dict[str, Union[T, Any]], None]:
+        instance = _fake_instance(output_model)
+        await self._sleep(_estimate_tokens(instance.model_dump()))
+        yield {"output": instance}
@@ -0,0 +1,126 @@
+"""
+定期収集（daily_collection）のヘッドレス実行。
+
+Streamlit やチャットのプロンプトを使わずに、指定期間の Slack 投稿を収集・分析・保存する。
+EventBridge Scheduler / cron / ECS タスク等から呼び出す想定。
+
+    python run_collection.py                         # 直近24時間、SLACK_CHANNELS（または SLACK_CHANNEL）
+    python run_collection.py --since 2025-10-01 --until 2025-10-02 --channels C0123ABCD
+    python run_collection.py --since 7d --json
+    python run_collection.py --queue --workers 8       # 作業キュー経由でワーカー8台で分析・保存
+
+終了コード:
+    0: すべて保存できた
+    1: 実行自体が失敗した（認証・MCP接続・全チャンネル失敗など）
+    3: 一部のチャンネルまたはURLの処理に失敗した（processing_history は success）
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import re
+import sys
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from agents.config.slack_channels import configured_channel_specs, resolve_channels
+from agents.pipeline.daily_collection import CollectionSummary, DailyCollection, RunRecorder
+from agents.pipeline.persistence import ActivityStore
+from agents.pipeline.pipeline_factory import build_activity_pipeline
+from agents.pipeline.slack_history import JST, SlackHistoryReader, to_slack_ts
+from agents.pipeline.work_queue import WorkQueue, work_queue_enabled
+from agents.runtime.mcp_sessions import create_mcp_clients
+from agents.runtime.phase_timer import PhaseTimer
+
+logger = logging.getLogger("run_collection")
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_PARTIAL = 3
+
+_RELATIVE = re.compile(r"^(\d+)([hd])$")
+
+
+def parse_time(value: Optional[str], now: float) -> Optional[str]:
+    """"24h" / "7d"（現在からの相対）、YYYY-MM-DD（JST）、ISO8601（タイムゾーン省略時はJST）、Slack の ts を ts に変換する。"""
+    if not value:
+        return None
+    match = _RELATIVE.match(value)
+    if match:
+        amount, unit = int(match.group(1)), match.group(2)
+        return f"{now - amount * (3600 if unit == 'h' else 86400):.6f}"
+    if "T" in value:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=JST)
+        return f"{parsed.timestamp():.6f}"
+    return to_slack_ts(value)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="daily_collection をヘッドレスで実行する")
+    parser.add_argument("--since", default="24h", help='開始（"24h" / "7d" / YYYY-MM-DD / ISO8601 / ts、既定 24h）')
+    parser.add_argument("--until", default=None, help="終了（省略時は現在）")
+    parser.add_argument("--channels", default=None, help="カンマ区切りのチャンネルIDまたはパターン（既定 SLACK_CHANNELS）")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで標準出力に書く")
+    parser.add_argument("--queue", action="store_true", default=None,
+                        help="作業キュー経由で処理する（既定 WORK_QUEUE）")
+    parser.add_argument("--workers", type=int, default=None, help="キューのワーカー数（既定 WORK_QUEUE_WORKERS）")
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> CollectionSummary:
+    now = time.time()
+    since, until = parse_time(args.since, now), parse_time(args.until, now)
+    specs = [s.strip() for s in args.channels.split(",")] if args.channels else configured_channel_specs()
+
+    queue = WorkQueue() if (args.queue or work_queue_enabled()) else None
+
+    clients = await create_mcp_clients()
+    try:
+        with clients.sessions():
+            channels = await resolve_channels(clients.gateway, specs)
+            collection = DailyCollection(
+                reader=SlackHistoryReader(clients.gateway),
+                pipeline=build_activity_pipeline(clients.firecrawl, clients.dsql),
+                recorder=RunRecorder(ActivityStore(clients.dsql)),
+                queue=queue,
+                workers=args.workers,
+            )
+            return await collection.run(channels, since, until)
+    finally:
+        if queue:
+            queue.close()
+
+
+def exit_code_for(summary: CollectionSummary) -> int:
+    if summary.status != "success":
+        return EXIT_FAILED
+    return EXIT_PARTIAL if summary.partial else EXIT_OK
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(format="%(levelname)s | %(name)s | %(message)s", level=logging.INFO)
+    args = parse_args(argv)
+    timer = PhaseTimer()
+    try:
+        with timer.activated():
+            summary = asyncio.run(run(args))
+    except Exception as e:
+        logger.error(f"❌ 定期収集に失敗: {e}")
+        if args.json:
+            print(json.dumps({"status": "failed", "error": str(e), "timings": timer.to_dict()}, ensure_ascii=False))
+        return EXIT_FAILED
+
+    exit_code = exit_code_for(summary)
+    logger.info(f"⏱️ フェーズ別レイテンシ: {timer.summary()}")
+    if args.json:
+        print(json.dumps({**summary.to_dict(), "timings": timer.to_dict(), "exit_code": exit_code}, ensure_ascii=False))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Slack Events API の受信サーバー（イベント駆動の取り込み）。
+
+Slack アプリの Event Subscriptions の Request URL に http(s)://<host>/slack/events を設定し、
+message.channels を購読する。受け取った投稿は作業キューに積まれ、同じプロセスのワーカープールが
+スクレイプ・分析・保存する。起動時と一定間隔で、イベントを取りこぼした区間だけ履歴を読み直す。
+
+    python run_event_ingest.py --port 3000
+    python -m benchmarks.fake_slack_events --url http://localhost:3000/slack/events --channel C0123ABCD
+
+エンドポイント:
+    POST /slack/events  Slack からのイベント（url_verification にも応答する）
+    GET  /ping          死活確認
+    GET  /stats         取り込み・キューの件数
+
+設定は slack_events.py / work_queue.py の環境変数と SLACK_CHANNELS（または SLACK_CHANNEL）を参照する。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sys
+from typing import AsyncIterator, List, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from agents.config.slack_channels import configured_channel_specs, resolve_channels
+from agents.pipeline.persistence import ActivityStore
+from agents.pipeline.pipeline_factory import build_activity_pipeline
+from agents.pipeline.slack_events import GapReconciler, SlackEventIngestor, verify_signature
+from agents.pipeline.slack_history import SlackHistoryReader
+from agents.pipeline.watermarks import WatermarkStore
+from agents.pipeline.work_queue import WorkerPool, WorkQueue
+from agents.runtime.mcp_sessions import create_mcp_clients
+
+logger = logging.getLogger("run_event_ingest")
+
+
+def build_app(signing_secret: str, channel_specs: List[str], workers: Optional[int] = None) -> Starlette:
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        clients = await create_mcp_clients()
+        with clients.sessions():
+            channels = await resolve_channels(clients.gateway, channel_specs)
+            reader = SlackHistoryReader(clients.gateway)
+            await reader.load_users()
+            queue = WorkQueue()
+            pool = WorkerPool(queue, build_activity_pipeline(clients.firecrawl, clients.dsql), workers=workers)
+            reconciler = GapReconciler(reader, queue, WatermarkStore(ActivityStore(clients.dsql)), channels)
+            app.state.ingestor = SlackEventIngestor(reader, queue, channels)
+            app.state.queue, app.state.pool, app.state.reconciler = queue, pool, reconciler
+
+            stop = asyncio.Event()
+            tasks = [asyncio.ensure_future(pool.run(stop)), asyncio.ensure_future(reconciler.run(stop))]
+            logger.info(f"📡 Slack イベントの受信を開始: {channels}")
+            try:
+                yield
+            finally:
+                app.state.ingestor.flush()
+                stop.set()
+                # 処理中の項目はリースが切れたあと次の起動で取り出される
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                queue.close()
+
+    async def slack_events(request: Request) -> Response:
+        body = await request.body()
+        if not verify_signature(signing_secret, request.headers.get("x-slack-request-timestamp"), body,
+                                request.headers.get("x-slack-signature")):
+            return JSONResponse({"error": "invalid signature"}, status_code=401)
+        try:
+            payload = json.loads(body)
+        except json.JSONDecodeError:
+            return JSONResponse({"error": "invalid payload"}, status_code=400)
+        if payload.get("type") == "url_verification":
+            return JSONResponse({"challenge": payload.get("challenge")})
+        # Slack は3秒以内の応答を求めるので、処理はキューに任せてすぐに返す
+        request.app.state.ingestor.accept(payload)
+        return Response(status_code=200)
+
+    async def ping(request: Request) -> Response:
+        return JSONResponse({"status": "ok"})
+
+    async def stats(request: Request) -> Response:
+        state = request.app.state
+        return JSONResponse({
+            "ingest": state.ingestor.stats.to_dict(),
+            "queue": state.queue.stats(),
+            "processed": state.pool.processed,
+            "outcomes": state.pool.status_counts,
+            "dead_lettered": state.pool.dead_lettered,
+            "recovered_from_history": state.reconciler.recovered,
+        })
+
+    return Starlette(
+        routes=[
+            Route("/slack/events", slack_events, methods=["POST"]),
+            Route("/ping", ping, methods=["GET"]),
+            Route("/stats", stats, methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Slack Events API の受信サーバーを起動する")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--channels", default=None, help="カンマ区切りのチャンネルIDまたはパターン（既定 SLACK_CHANNELS）")
+    parser.add_argument("--workers", type=int, default=None, help="キューのワーカー数（既定 WORK_QUEUE_WORKERS）")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(format="%(levelname)s | %(name)s | %(message)s", level=logging.INFO)
+    args = parse_args(argv)
+    signing_secret = os.environ.get("SLACK_SIGNING_SECRET")
+    if not signing_secret:
+        logger.error("❌ SLACK_SIGNING_SECRET が設定されていません")
+        return 1
+    specs = [s.strip() for s in args.channels.split(",")] if args.channels else configured_channel_specs()
+    uvicorn.run(build_app(signing_secret, specs, workers=args.workers), host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,11 +9,14 @@ Jr.Champions活動記録システム - Agent Graph実装 v2
 4. データ格納ツール - Aurora DSQLへの保存
 5. 通知送信ツール - SNS経由での通知
 """
+import contextlib
 import logging, os
 import json
+import time
 import boto3
 import base64
-from typing import Any, Dict, List
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional
 from strands import Agent
 from strands.multiagent import GraphBuilder
 from bedrock_agentcore.runtime import BedrockAgentCoreApp
@@ -22,11 +25,30 @@ from boto3.session import Session
 
 
 # ツールのインポート
-from agents.config.gateway_identity_config import GatewayIdentityConfig, parse_prompt_from_payload, always_false_condition, extract_message_content, detect_mcp_usage
-from agents.config.remote_mcp_config import RemoteMCPConfig
-from agents.config.local_mcp_config import LocalMCPConfig
+from agents.config.gateway_identity_config import GatewayIdentityConfig, parse_prompt_from_payload, always_false_condition
+from agents.config.slack_channels import configured_channel_specs, is_multi_channel, resolve_channels
+from agents.middleware.rate_limit import rate_limit_report
+from agents.pipeline.multi_channel_collector import HistoryCoverageTap, MultiChannelCollector
+from agents.pipeline.watermarks import WatermarkStore
 from agents.slack_agent_factory import SlackAgentFactory
 from agents.web_agent_factory import FirecrawlAgentFactory
+from agents.runtime.admission import AdmissionRejectedError, AdmissionTicket, admission_controller, request_class
+from agents.runtime.budget import RunBudget, budget_scope, current_budget, with_budget
+from agents.runtime.deadline import Deadline, current_deadline, deadline_scope, with_deadline
+from agents.runtime.mcp_sessions import create_mcp_clients
+from agents.runtime.memory_usage import RssWatermark
+from agents.runtime.profiling import GraphLoopProfilingHook, current_profiler, profiling_scope
+from agents.runtime.phase_timer import PhaseTimer
+from agents.runtime.response_assembly import NodeResultAssembler
+from agents.middleware.compaction import collect_compaction_stats
+from agents.middleware.resilience import CircuitOpenError, MCPTimeoutError, MCPUnavailableError, collect_resilience_stats
+from agents.pipeline.activity_pipeline_node import ActivityPipelineNode
+from agents.pipeline.backfill import CheckpointStore, SlackHistoryBackfill
+from agents.pipeline.scrape_prefetch import PrefetchedScrapeMiddleware, ScrapePrefetcher, SlackUrlTap
+from agents.pipeline.slack_history import SlackHistoryReader
+from agents.pipeline.model_router import ModelRouter
+from agents.pipeline.persistence import ActivityStore
+from agents.pipeline.pipeline_factory import build_activity_pipeline, get_analysis_cache, get_near_duplicate_index
 from langfuse import get_client
 
 # ロガー設定
@@ -41,50 +63,172 @@ _boto_session = Session()
 region = _boto_session.region_name
 
 # ========== Langfuse setup ==========
-langfuse_public_key_public_id = os.environ["LANGFUSE_PUBLIC_KEY_SECRET_ID"]
-langfuse_public_key_secret_id = os.environ["LANGFUSE_SECRET_KEY_SECRET_ID"]
-
-# Secrets ManagerからLangfuseのキーを取得
-# 期待するデータ格納形式:
-# - SecretId: "langfuse-public-key" → JSON形式 {"api_key_value":"実際のキー値"}
-# - SecretId: "langfuse-secret-key" → JSON形式 {"api_key_value":"実際のキー値"}
-secrets_manager = boto3.client("secretsmanager", region_name="us-east-1")
-
-# Langfuse Public Keyを取得（JSON形式 {"api_key_value":"実際のキー値"} から取得）
-public_secret = secrets_manager.get_secret_value(SecretId=langfuse_public_key_public_id)
-public_data = json.loads(public_secret["SecretString"])
-os.environ["LANGFUSE_PUBLIC_KEY"] = public_data["api_key_value"]
-print(f"Langfuse パブリックキーを取得: {public_data['api_key_value'][:4]}...{public_data['api_key_value'][-4:]}:")
-
-# Langfuse Secret Keyを取得（JSON形式 {"api_key_value":"実際のキー値"} から取得）
-secret_key_secret = secrets_manager.get_secret_value(SecretId=langfuse_public_key_secret_id)
-secret_data = json.loads(secret_key_secret["SecretString"])
-os.environ["LANGFUSE_SECRET_KEY"] = secret_data["api_key_value"]
-print(f"Langfuse シークレットキーを取得: {secret_data['api_key_value'][:4]}...{secret_data['api_key_value'][-4:]}:")
-
-LANGFUSE_AUTH = base64.b64encode(
-    f"{os.environ['LANGFUSE_PUBLIC_KEY']}:{os.environ['LANGFUSE_SECRET_KEY']}".encode()
-).decode()
-
-os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = (
-    os.environ.get("LANGFUSE_HOST", "https://us.cloud.langfuse.com") + "/api/public/otel"
-)
+# ベンチマーク等のオフライン実行では LANGFUSE_ENABLED=false で Secrets Manager への接続を省略する
+LANGFUSE_ENABLED = os.environ.get("LANGFUSE_ENABLED", "true").lower() != "false"
+langfuse = None
+
+if LANGFUSE_ENABLED:
+    langfuse_public_key_public_id = os.environ["LANGFUSE_PUBLIC_KEY_SECRET_ID"]
+    langfuse_public_key_secret_id = os.environ["LANGFUSE_SECRET_KEY_SECRET_ID"]
+
+    # Secrets ManagerからLangfuseのキーを取得
+    # 期待するデータ格納形式:
+    # - SecretId: "langfuse-public-key" → JSON形式 {"api_key_value":"実際のキー値"}
+    # - SecretId: "langfuse-secret-key" → JSON形式 {"api_key_value":"実際のキー値"}
+    secrets_manager = boto3.client("secretsmanager", region_name="us-east-1")
+
+    # Langfuse Public Keyを取得（JSON形式 {"api_key_value":"実際のキー値"} から取得）
+    public_secret = secrets_manager.get_secret_value(SecretId=langfuse_public_key_public_id)
+    public_data = json.loads(public_secret["SecretString"])
+    os.environ["LANGFUSE_PUBLIC_KEY"] = public_data["api_key_value"]
+    print(f"Langfuse パブリックキーを取得: {public_data['api_key_value'][:4]}...{public_data['api_key_value'][-4:]}:")
+
+    # Langfuse Secret Keyを取得（JSON形式 {"api_key_value":"実際のキー値"} から取得）
+    secret_key_secret = secrets_manager.get_secret_value(SecretId=langfuse_public_key_secret_id)
+    secret_data = json.loads(secret_key_secret["SecretString"])
+    os.environ["LANGFUSE_SECRET_KEY"] = secret_data["api_key_value"]
+    print(f"Langfuse シークレットキーを取得: {secret_data['api_key_value'][:4]}...{secret_data['api_key_value'][-4:]}:")
+
+    LANGFUSE_AUTH = base64.b64encode(
+        f"{os.environ['LANGFUSE_PUBLIC_KEY']}:{os.environ['LANGFUSE_SECRET_KEY']}".encode()
+    ).decode()
 
-os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = f"Authorization=Basic {LANGFUSE_AUTH}"
+    os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = (
+        os.environ.get("LANGFUSE_HOST", "https://us.cloud.langfuse.com") + "/api/public/otel"
+    )
 
-# os.environ["LANGFUSE_DEBUG"] = "True"
+    os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = f"Authorization=Basic {LANGFUSE_AUTH}"
 
-os.environ["OTEL_TRACES_EXPORTER"] = "otlp"
+    # os.environ["LANGFUSE_DEBUG"] = "True"
 
-os.environ["OTEL_EXPORTER_OTLP_PROTOCOL"] = "http/protobuf"
+    os.environ["OTEL_TRACES_EXPORTER"] = "otlp"
 
-strands_telemetry = StrandsTelemetry().setup_otlp_exporter()
-langfuse = get_client()
+    os.environ["OTEL_EXPORTER_OTLP_PROTOCOL"] = "http/protobuf"
+
+    strands_telemetry = StrandsTelemetry().setup_otlp_exporter()
+    langfuse = get_client()
 # ========== Langfuse setup ==========
 
 # AgentCoreアプリケーションを初期化
 app = BedrockAgentCoreApp()
 
+# 各ノードが利用するMCPエンドポイント（ツール呼び出し計測の振り分け用）
+NODE_MCP_ENDPOINTS = {
+    "slack_agent": {"gateway"},
+    "firecrawl_agent": {"firecrawl", "dsql"},
+    "activity_pipeline": {"firecrawl", "dsql"},
+}
+
+# 活動分析ステージの実行方式
+# - agent: FirecrawlAgent がツールループでスクレイプ・分析・保存を行う（従来）
+# - pipeline: コードでスクレイプ・保存し、分析のみ ModelRouter で選んだモデルに任せる
+ANALYSIS_MODE = os.environ.get("ANALYSIS_MODE", "agent").lower()
+
+
+def _payload_option(payload: Dict[str, Any], key: str, default: Any = None) -> Any:
+    """ペイロード直下、または入れ子の input から任意項目を取り出す。"""
+    if key in payload:
+        return payload[key]
+    input_data = payload.get("input")
+    if isinstance(input_data, dict) and key in input_data:
+        return input_data[key]
+    return default
+
+
+def _flag_enabled(payload: Dict[str, Any], key: str, env_name: str) -> bool:
+    """ペイロードのフラグ、なければ環境変数でオプション機能の有効/無効を判定する。"""
+    value = _payload_option(payload, key)
+    if value is not None:
+        return bool(value)
+    return os.environ.get(env_name, "false").lower() == "true"
+
+
+def _with_run_limits(agent: Agent, source: str) -> Agent:
+    """エージェントのツールループを締め切りと実行の予算で止められるようにする。"""
+    return with_budget(with_deadline(agent), source)
+
+
+SLACK_AGENT_MODEL_ID = os.environ.get("SLACK_AGENT_MODEL_ID", "us.anthropic.claude-sonnet-4-5-20250929-v1:0")
+
+async def _build_multi_channel_collector(gateway_mcp, dsql_mcp, channel_specs: List[str]) -> MultiChannelCollector:
+    """複数チャンネル収集ノードを作る（チャンネル解決・ウォーターマーク）。
+
+    Slack API のレートはプロセス共通のバケットで制限される（agents/middleware/rate_limit.py）。
+    ウォーターマークは後段が終わってから collector.commit_watermarks() で進める。
+    """
+    channels = await resolve_channels(gateway_mcp, channel_specs)
+
+    # ツール列挙は1回だけ行い、チャンネルごとのエージェントで共有する
+    tools = GatewayIdentityConfig().get_full_tools_list(gateway_mcp)
+
+    def build_agent(channel: str, oldest: Optional[str]) -> Agent:
+        return _with_run_limits(SlackAgentFactory(model_id=SLACK_AGENT_MODEL_ID, slack_channel=channel, oldest=oldest).build(
+            gateway_mcp, tools=tools
+        ), "slack_agent")
+
+    watermarks, coverage = None, None
+    if os.environ.get("SLACK_WATERMARKS", "true").lower() != "false":
+        watermarks = WatermarkStore(ActivityStore(dsql_mcp))
+        # oldest 以降の履歴を最後のページまで読んだチャンネルだけウォーターマークを進める
+        coverage = HistoryCoverageTap()
+        gateway_mcp.add_middleware(coverage, outermost=True)
+    return MultiChannelCollector(build_agent, channels, watermarks=watermarks, coverage=coverage)
+
+
+async def _commit_watermarks(collector: MultiChannelCollector, status: str, pipeline_report,
+                             pipeline_node: Optional[ActivityPipelineNode]) -> None:
+    """後段の結果に応じてチャンネルのウォーターマークを進める。
+
+    pipeline モードでは後回しにした項目（台帳がなければ失敗した項目も）より前のメッセージまで進める。
+    台帳があれば失敗した項目は台帳から再試行されるため、ウォーターマークを止めない。
+    agent モードでは保存できた項目を区別できないため、グラフが最後まで完了した場合だけ進める。
+    """
+    if pipeline_node is None:
+        error = None if status == "completed" else f"分析ノードが完了していません（{status}）"
+        await collector.commit_watermarks(error=error)
+        return
+    if pipeline_report is None:
+        await collector.commit_watermarks(error="分析ノードが完了していません")
+        return
+    blocking = {"deferred"} if pipeline_node.pipeline.ledger is not None else {"deferred", "failed"}
+    await collector.commit_watermarks(
+        unfinished_urls={item.url for item in pipeline_report.items if item.status in blocking}
+    )
+
+
+def _unavailable_message(error: MCPUnavailableError) -> str:
+    """MCPエンドポイント障害の種類に応じたエラーメッセージを返す。"""
+    if isinstance(error, CircuitOpenError):
+        return f"MCPエンドポイント {error.endpoint} は障害のため一時停止中です（約{error.retry_after:.0f}秒後に再試行できます）: {error}"
+    if isinstance(error, MCPTimeoutError):
+        return f"MCPエンドポイント {error.endpoint} の応答がタイムアウトしました: {error}"
+    return f"MCP接続エラー: {error}. MCPクライアントのセッションが切れている可能性があります。"
+
+
+async def _run_backfill(payload: Dict[str, Any], gateway_mcp, sse_mcp, dsql_mcp) -> Dict[str, Any]:
+    """チャンネル履歴のバックフィルを実行する（チャンネルは1つずつ処理してメモリを抑える）。"""
+    channel = _payload_option(payload, "channel")
+    channels = [channel] if channel else await resolve_channels(gateway_mcp, configured_channel_specs())
+    router = ModelRouter()
+    page_size = os.environ.get("BACKFILL_PAGE_SIZE")
+    backfill = SlackHistoryBackfill(
+        SlackHistoryReader(gateway_mcp, page_size=int(page_size) if page_size else None),
+        build_activity_pipeline(sse_mcp, dsql_mcp, router),
+        CheckpointStore(ActivityStore(dsql_mcp)),
+        max_pages=_payload_option(payload, "max_pages"),
+    )
+    reports = []
+    for target in channels:
+        report = await backfill.run(target, restart=bool(_payload_option(payload, "restart", False)))
+        reports.append(report.to_dict())
+    return {
+        "status": "completed" if all(r["done"] for r in reports) else "partial",
+        "mode": "backfill",
+        "channels": reports,
+        "metadata": {"session_id": payload.get("sessionId", "unknown"), "routing": router.report()},
+    }
+
+
 @app.entrypoint
 async def invoke_agent_graph(payload: Dict[str, Any]):
     """Agent Graphのメインエントリーポイント
@@ -92,13 +236,69 @@ async def invoke_agent_graph(payload: Dict[str, Any]):
     Args:
         payload: AgentCore Runtimeから渡されるペイロード
                 - prompt: ユーザーからの入力メッセージ
+                - include_timings: (任意) フェーズ別レイテンシを metadata.timings に含める
+                - mode: (任意) "backfill" でチャンネル履歴のバックフィルを実行（prompt 不要）
+                  channel / max_pages / restart で対象・1回のページ数・最初からのやり直しを指定
+                - deadline_ms: (任意) クライアントが待つ締め切り（UNIXエポックのミリ秒）。
+                  timeout_seconds で相対指定も可。省略時は REQUEST_DEADLINE_SECONDS
+                - profile: (任意) CPU・イベントループ遅延・メモリを計測し、セッションIDの名前で成果物を書き出す
+                - budget_tokens / budget_usd: (任意) この実行のトークン・推定コスト（USD）の上限。
+                  省略時は RUN_TOKEN_BUDGET / RUN_COST_BUDGET_USD。使い切ったら新しい作業を始めず partial を返す
+                - stream_nodes: (任意) 各ノードの出力を終わった順に {"type": "node_result"} として先に流す
+                - priority: (任意) "interactive" / "batch"。同時実行枠は interactive を優先して割り当てる
+                  （省略時は mode=backfill なら batch、それ以外は interactive）
     
     Yields:
         AgentCore Runtime形式のストリーミングレスポンス
     """
+    # フェーズ別レイテンシの計測（OTelスパンは常に出力し、レスポンスへの添付はフラグで制御）
+    timer = PhaseTimer()
+    # 締め切りは各ノード・MCPツール呼び出しから current_deadline() で参照される
+    deadline = Deadline.start(
+        deadline_ms=_payload_option(payload, "deadline_ms"),
+        timeout_seconds=_payload_option(payload, "timeout_seconds"),
+    )
+    # 同時実行枠が空くまで待つ（対話リクエスト優先。待ち時間も締め切りに含まれる）
+    controller = admission_controller()
+    admission = contextlib.nullcontext() if controller is None else controller.admit(
+        request_class(payload), timeout=deadline.remaining() if deadline is not None else None
+    )
+    try:
+        async with admission as ticket:
+            if ticket is not None:
+                timer.record("admission_wait", ticket.queued_at, request_class=ticket.request_class)
+            # 実行の予算（トークン・推定コスト）は各エージェント・分析から current_budget() で参照される
+            budget = RunBudget.start(
+                max_tokens=_payload_option(payload, "budget_tokens"),
+                max_cost_usd=_payload_option(payload, "budget_usd"),
+            )
+            profile_session = None
+            if _flag_enabled(payload, "profile", "REQUEST_PROFILING"):
+                profile_session = payload.get("sessionId") or _payload_option(payload, "session_id", "unknown")
+            with timer.activated(), deadline_scope(deadline), budget_scope(budget), \
+                    profiling_scope(profile_session), RssWatermark() as rss:
+                async for chunk in _run_agent_graph(payload, timer, rss, ticket):
+                    yield chunk
+    except AdmissionRejectedError as e:
+        # 待ち行列が一杯・締め切りまでに枠が空かない場合は待たせずに断る
+        yield {"error": str(e), "status": "rejected", "retry_after_seconds": e.retry_after}
+
+
+def _admission_report(ticket: Optional[AdmissionTicket]) -> Optional[Dict[str, Any]]:
+    """このリクエストの待ち時間と、クラスごとの受付状況（コンテナ起動からの累計）。"""
+    controller = admission_controller()
+    if ticket is None or controller is None:
+        return None
+    return {**ticket.to_dict(), **controller.report()}
+
+
+async def _run_agent_graph(payload: Dict[str, Any], timer: PhaseTimer, rss: RssWatermark,
+                           ticket: Optional[AdmissionTicket] = None):
+    """invoke_agent_graph の本体（PhaseTimer が有効なコンテキストで実行される）。"""
     # プロンプトの検証とペイロード構造の処理
     user_message = parse_prompt_from_payload(payload)
-    if not user_message:
+    backfill_mode = _payload_option(payload, "mode") == "backfill"
+    if not user_message and not backfill_mode:
         logger.error(f"無効なペイロード構造: {payload}")
         yield {"error": "無効なペイロード: 'prompt'フィールドが必要です"}
         return
@@ -107,37 +307,58 @@ async def invoke_agent_graph(payload: Dict[str, Any]):
         # MCPクライアントとツールを作成
         logger.info("🚀 MCPクライアント作成を開始...")
 
-        # AgentCore Gatewayを用いたMCPのセッションを開く
-        gateway_config = GatewayIdentityConfig()
-        gateway_mcp = await gateway_config.create_mcp_client_and_tools()
-
-        # Firecrawl MCPのセッション(SSE)を開く
-        sse_config = RemoteMCPConfig(
-            provider_name="firecrawl_api_key",
-            base_url="https://mcp.firecrawl.dev",
-            http_path_template=None,
-            sse_path_template="/{API_KEY}/v2/sse"
-        )
-        sse_mcp = await sse_config.build_client()
-
-        # Aurora DSQLのセッションを開く
-        dsql_config = LocalMCPConfig()
-        dsql_mcp = await dsql_config.build_client()
+        # Gateway / Firecrawl / Aurora DSQL のMCPクライアントを作成
+        clients = await create_mcp_clients()
+        gateway_mcp, sse_mcp, dsql_mcp = clients.gateway, clients.firecrawl, clients.dsql
 
         # MCPのwithコンテキスト内でGraph全体を実行
         logger.info("📦 MCPコンテキストを開始（セッション維持）...")
         # AWS Knowledge MCPを用いる場合は、withにstreamable_http_mcpを追加する
+        session_started = time.perf_counter()
         with gateway_mcp, sse_mcp, dsql_mcp:
-            logger.info("✅ MCPコンテキストに入りました - セッションアクティブ")
-
-            slack_agent = SlackAgentFactory(
-                model_id=os.environ.get("SLACK_AGENT_MODEL_ID", "us.anthropic.claude-sonnet-4-5-20250929-v1:0"),
-                slack_channel=os.environ.get("SLACK_CHANNEL", "")
-            ).build(gateway_mcp)
+            timer.record("mcp_session_start", session_started)
+            logger.info("✅ MCPコンテキストに入りました（遅延接続時、セッションは各ノードの最初のツール利用時に開きます）")
+
+            if backfill_mode:
+                with timer.phase("backfill"):
+                    result = await _run_backfill(payload, gateway_mcp, sse_mcp, dsql_mcp)
+                admission_report = _admission_report(ticket)
+                if admission_report:
+                    result["metadata"]["admission"] = admission_report
+                yield json.dumps(result, ensure_ascii=False)
+                return
 
-            firecrawl_agent = FirecrawlAgentFactory(
-                model_id=os.environ.get("FIRECRAWL_AGENT_MODEL_ID", "us.anthropic.claude-sonnet-4-5-20250929-v1:0"),
-            ).build(sse_mcp, dsql_mcp)
+            # Slack 収集中に見つかったURLのスクレイプを先読みする
+            prefetcher = None
+            if _flag_enabled(payload, "prefetch", "SCRAPE_PREFETCH"):
+                prefetcher = ScrapePrefetcher(sse_mcp)
+                gateway_mcp.add_middleware(SlackUrlTap(prefetcher), outermost=True)
+                sse_mcp.add_middleware(PrefetchedScrapeMiddleware(prefetcher), outermost=True)
+
+            collector = None
+            channel_specs = configured_channel_specs()
+            with timer.phase("build_agent.slack"):
+                if is_multi_channel(channel_specs):
+                    collector = await _build_multi_channel_collector(gateway_mcp, dsql_mcp, channel_specs)
+                    slack_agent = collector
+                else:
+                    slack_agent = _with_run_limits(SlackAgentFactory(
+                        model_id=SLACK_AGENT_MODEL_ID,
+                        slack_channel=os.environ.get("SLACK_CHANNEL", "")
+                    ).build(gateway_mcp), "slack_agent")
+
+            router = None
+            if ANALYSIS_MODE == "pipeline":
+                with timer.phase("build_agent.pipeline"):
+                    router = ModelRouter()
+                    analysis_node_name = "activity_pipeline"
+                    analysis_node = ActivityPipelineNode(build_activity_pipeline(sse_mcp, dsql_mcp, router))
+            else:
+                with timer.phase("build_agent.firecrawl"):
+                    analysis_node_name = "firecrawl_agent"
+                    analysis_node = _with_run_limits(FirecrawlAgentFactory(
+                        model_id=os.environ.get("FIRECRAWL_AGENT_MODEL_ID", "us.anthropic.claude-sonnet-4-5-20250929-v1:0"),
+                    ).build(sse_mcp, dsql_mcp), "firecrawl_agent")
 
             block_agent = Agent()
 
@@ -146,19 +367,24 @@ async def invoke_agent_graph(payload: Dict[str, Any]):
 
             # ノードを追加
             builder.add_node(slack_agent, "slack_agent")
-            builder.add_node(firecrawl_agent, "firecrawl_agent")
+            builder.add_node(analysis_node, analysis_node_name)
             builder.add_node(block_agent, "block_agent")
 
             # エッジを追加
-            builder.add_edge("slack_agent", "firecrawl_agent")
+            builder.add_edge("slack_agent", analysis_node_name)
 
-            # firecrawl_agentの後に条件付きエッジを追加（常にFalseで終了）
-            # これによりfirecrawl_agentの後でグラフが確実に終了する
-            builder.add_edge("firecrawl_agent", "block_agent", condition=always_false_condition)
+            # 分析ノードの後に条件付きエッジを追加（常にFalseで終了）
+            # これにより分析ノードの後でグラフが確実に終了する
+            builder.add_edge(analysis_node_name, "block_agent", condition=always_false_condition)
 
             # エントリーポイントの設定
             builder.set_entry_point("slack_agent")
 
+            # プロファイリング時は Graph を実行するループの遅延も測る
+            profiler = current_profiler()
+            if profiler is not None:
+                builder.set_hook_providers([GraphLoopProfilingHook(profiler)])
+
             # Graphをビルドする
             graph = builder.build()
 
@@ -168,11 +394,24 @@ async def invoke_agent_graph(payload: Dict[str, Any]):
             # MCPコンテキスト内で処理を実行
             logger.info("🎯 MCPコンテキスト内でエージェント処理を開始...")
 
-            # Graph.invoke_async()を使用して非同期実行
+            # Graph.stream_async()を使用して非同期実行
             try:
-                # 非同期実行でGraphを実行
-                logger.info("🚀 Graph.invoke_async()を開始...")
-                graph_result = graph(user_message)
+                # ノードが終わるたびに出力を取り出し、エージェントの会話履歴を解放する
+                logger.info("🚀 Graph.stream_async()を開始...")
+                assembler = NodeResultAssembler(
+                    stream_nodes=_flag_enabled(payload, "stream_nodes", "RESPONSE_STREAM_NODES")
+                )
+                graph_result = None
+                with timer.phase("graph_run"):
+                    async for event in graph.stream_async(user_message):
+                        if event.get("type") == "multiagent_node_stop":
+                            node_id = event["node_id"]
+                            node_data = assembler.add(node_id, event["node_result"], graph.nodes[node_id].executor)
+                            if assembler.stream_nodes:
+                                yield json.dumps({"type": "node_result", "agent": node_data}, ensure_ascii=False)
+                        elif event.get("type") == "multiagent_result":
+                            graph_result = event["result"]
+                assemble_started = time.perf_counter()
 
                 # 結果の処理（graph_with_tool_response_format.mdに基づく改善版）
                 logger.info("🔍 Graph実行結果を処理中...")
@@ -181,11 +420,10 @@ async def invoke_agent_graph(payload: Dict[str, Any]):
                 # 構造化されたレスポンスを作成
                 structured_response = {
                     "status": "completed" if graph_result.status == Status.COMPLETED else "failed",
-                    "agents": [],
+                    "agents": assembler.agents,
                     "total_execution_time_ms": getattr(graph_result, "execution_time", 0),
                     "total_tokens": graph_result.accumulated_usage.get("totalTokens", 0) if hasattr(graph_result, "accumulated_usage") else 0,
-                    "mcp_tools_used": False,
-                    "full_text": "",  # フロントエンド表示用の統合テキスト
+                    "mcp_tools_used": assembler.mcp_tools_used,
                     "metadata": {
                         "session_id": payload.get("sessionId", "unknown"),
                         "total_nodes": getattr(graph_result, "total_nodes", 0),
@@ -194,59 +432,115 @@ async def invoke_agent_graph(payload: Dict[str, Any]):
                     }
                 }
 
-                all_texts = []
                 logger.info(f"📊 Graph全体ステータス: {structured_response['status']}")
 
-                # 各ノードの結果を処理
-                for node_name, node_result in graph_result.results.items():
-                    node_data = {
-                        "name": node_name,
-                        "messages": [],
-                        "execution_time_ms": getattr(node_result, "execution_time", 0),
-                        "status": str(getattr(node_result, "status", "unknown")),
-                        "tokens_used": node_result.accumulated_usage.get("totalTokens", 0) if hasattr(node_result, "accumulated_usage") else 0
-                    }
-
-                    # NodeResult.get_agent_results() で入れ子もフラットに
-                    for agent_result in node_result.get_agent_results():
-                        text, jsons = extract_message_content(agent_result)
-
-                        if text:
-                            node_data["messages"].append({
-                                "type": "text",
-                                "content": text
-                            })
-                            all_texts.append(f"[{node_name}] {text}")
-
-                            # MCPツール使用を検出
-                            if detect_mcp_usage(text):
-                                structured_response["mcp_tools_used"] = True
-
-                        if jsons:
-                            node_data["messages"].append({
-                                "type": "json",
-                                "content": jsons
-                            })
-
-                        # ログ出力
-                        logger.info(
-                            f"📦 Node: {node_name} | status={node_data['status']} | "
-                            f"stop_reason={getattr(agent_result,'stop_reason',None)}"
-                        )
-
-                    structured_response["agents"].append(node_data)
-
-                # 全体の統合テキストを作成
-                structured_response["full_text"] = "\n\n".join(all_texts) if all_texts else "レスポンスが空でした"
+                # フロントエンド表示用の統合テキスト（agents のメッセージと重複するため上限まで）
+                full_text = assembler.full_text
+                if full_text is not None:
+                    structured_response["full_text"] = full_text
+                structured_response["metadata"]["response_assembly"] = assembler.report()
+
+                # 保存できた活動と後回しにした項目（pipeline モード）。締め切り・予算切れで打ち切った場合は partial
+                deadline = current_deadline()
+                budget = current_budget()
+                pipeline_report = analysis_node.last_report if router is not None else None
+                if pipeline_report is not None:
+                    structured_response["activities"] = [
+                        asdict(item) for item in pipeline_report.items if item.status == "stored"
+                    ]
+                    structured_response["deferred_items"] = [
+                        asdict(item) for item in pipeline_report.items if item.status == "deferred"
+                    ]
+                if structured_response["status"] == "completed" and (
+                    (deadline is not None and deadline.hit) or (budget is not None and budget.hit)
+                    or structured_response.get("deferred_items")
+                ):
+                    structured_response["status"] = "partial"
+                if collector is not None:
+                    await _commit_watermarks(collector, structured_response["status"], pipeline_report,
+                                             analysis_node if router is not None else None)
+                if deadline is not None:
+                    structured_response["metadata"]["deadline"] = deadline.to_dict()
+                if budget is not None:
+                    structured_response["metadata"]["budget"] = budget.to_dict()
+                    logger.info(
+                        f"💰 予算: {budget.total_tokens:,} トークン / 推定 ${budget.cost_usd:.4f}"
+                        + ("（上限に到達）" if budget.hit else "")
+                    )
+
+                # ツール結果コンパクションによる削減量
+                compaction = collect_compaction_stats(gateway_mcp, sse_mcp, dsql_mcp)
+                if compaction:
+                    structured_response["metadata"]["compaction"] = compaction
+                    saved = sum(s["bytes_saved"] for s in compaction.values())
+                    logger.info(f"🗜️ ツール結果コンパクション: {saved:,} bytes 削減")
+
+                # MCP呼び出しのリトライ・タイムアウトとサーキットブレーカーの状態
+                resilience = collect_resilience_stats(gateway_mcp, sse_mcp, dsql_mcp)
+                if resilience:
+                    structured_response["metadata"]["mcp_resilience"] = resilience
+
+                # スクレイプ先読みの利用状況
+                if prefetcher is not None:
+                    structured_response["metadata"]["prefetch"] = prefetcher.report()
+                    logger.info(f"🔮 スクレイプ先読み: {structured_response['metadata']['prefetch']}")
+
+                # 上流ごとのレート制限の待ち時間（コンテナ起動からの累計）
+                rate_limits = rate_limit_report()
+                if rate_limits:
+                    structured_response["metadata"]["rate_limits"] = rate_limits
+
+                # チャンネルごとの収集結果（複数チャンネル時）
+                if collector is not None and collector.last_report is not None:
+                    structured_response["metadata"]["channels"] = collector.last_report.to_dict()
+
+                # 分析ステージのモデルルーティング判断（pipeline モード時）
+                if router is not None:
+                    structured_response["metadata"]["routing"] = router.report()
+                    cache = get_analysis_cache()
+                    if cache is not None and analysis_node.last_report is not None:
+                        structured_response["metadata"]["analysis_cache"] = {
+                            **cache.stats(), "run_hits": analysis_node.last_report.cache_hits,
+                            "run_reused_stored": analysis_node.last_report.reused_stored,
+                            "run_near_duplicates": analysis_node.last_report.near_duplicates,
+                        }
+                        near_duplicates = get_near_duplicate_index()
+                        if near_duplicates is not None:
+                            structured_response["metadata"]["analysis_cache"]["near_duplicate_index"] = near_duplicates.stats()
+
+                # フェーズ別レイテンシ（フラグ指定時のみレスポンスに含める）
+                timer.record("assemble_response", assemble_started)
+                logger.info(f"⏱️ フェーズ別レイテンシ: {timer.summary()}")
+                if _flag_enabled(payload, "include_timings", "RESPONSE_INCLUDE_TIMINGS"):
+                    timings = timer.to_dict()
+                    structured_response["metadata"]["timings"] = timings
+                    for node_data in structured_response["agents"]:
+                        endpoints = NODE_MCP_ENDPOINTS.get(node_data["name"], set())
+                        node_data["tool_calls"] = [
+                            c for c in timings["tool_calls"] if c["attributes"].get("endpoint") in endpoints
+                        ]
+
+                # プロファイリングの成果物（計測の要約は成果物の .summary.json に書き出される）
+                if profiler is not None:
+                    structured_response["metadata"]["profile"] = profiler.brief()
+
+                # 同時実行枠の待ち時間とクラスごとの待ち・処理時間の分位点
+                admission_report = _admission_report(ticket)
+                if admission_report:
+                    structured_response["metadata"]["admission"] = admission_report
+
+                # リクエスト中の RSS（プロセス全体の値。同時リクエストの分も含む）
+                structured_response["metadata"]["memory"] = rss.to_dict()
 
                 # 結果をログ出力
-                logger.info(f"✅ 最終レスポンス準備完了: {len(structured_response['full_text'])} 文字")
+                logger.info(f"✅ 最終レスポンス準備完了: {len(structured_response['agents'])} ノード")
                 logger.info(f"📊 MCPツール使用: {structured_response['mcp_tools_used']}")
                 logger.info(f"⏱️ 総実行時間: {structured_response['total_execution_time_ms']}ms")
                 logger.info(f"🎯 トークン使用量: {structured_response['total_tokens']}")
 
                 # Langfuse SDK でテレメトリー送信
-                langfuse.flush()
+                if langfuse is not None:
+                    langfuse.flush()
 
                 # 構造化されたレスポンスをJSON形式で返す
                 yield json.dumps(structured_response, ensure_ascii=False)
@@ -260,12 +554,21 @@ async def invoke_agent_graph(payload: Dict[str, Any]):
                 # エラーレスポンスを返す
                 yield {
                     "type": "error",
-                    "error": f"Graph実行エラー: {str(graph_error)}"
+                    "error": _unavailable_message(graph_error) if isinstance(graph_error, MCPUnavailableError)
+                    else f"Graph実行エラー: {str(graph_error)}"
                 }
                 return
+            finally:
+                # 残った先読みは Firecrawl のセッションを閉じる前に取り消す
+                if prefetcher is not None:
+                    await prefetcher.close()
 
             logger.info("🎉 Graph処理完了 - MCPセッションを正常にクローズします")
 
+    except MCPUnavailableError as e:
+        # タイムアウト・サーキットオープン等で MCP エンドポイントが使えない
+        logger.error(f"❌ MCPエンドポイントが利用できません: {e}")
+        yield {"error": _unavailable_message(e)}
     except RuntimeError as e:
         # create_agentからのエラー
         logger.error(f"❌ エージェント作成エラー: {e}")
@@ -276,14 +579,7 @@ async def invoke_agent_graph(payload: Dict[str, Any]):
         logger.error(f"❌ 処理中にエラーが発生: {e}")
         logger.error(f"📊 詳細なスタックトレース:\n{error_trace}")
 
-        # エラーメッセージ
-        error_msg = str(e)
-        if "connection" in error_msg.lower() or "mcp" in error_msg.lower():
-            yield {"error": f"MCP接続エラー: {error_msg}. MCPクライアントのセッションが切れている可能性があります。"}
-        elif "tool" in error_msg.lower():
-            yield {"error": f"ツール実行エラー: {error_msg}. ツールの利用権限またはパラメータを確認してください。"}
-        else:
-            yield {"error": f"リクエストの処理中にエラーが発生しました: {error_msg}"}
+        yield {"error": f"リクエストの処理中にエラーが発生しました: {e}"}
 
 if __name__ == "__main__":
     # Slackツール連携エージェントサーバーを起動
@@ -0,0 +1,10 @@
+"""
+agent_graph のテスト共通設定（agents パッケージを agent_graph ディレクトリから import する）。
+
+実行例（agent_graph ディレクトリで）:
+    python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
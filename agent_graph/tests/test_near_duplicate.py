@@ -0,0 +1,108 @@
+"""近似重複の索引（agents/pipeline/near_duplicate.py）。
+
+転載と無関係な記事は benchmarks/near_duplicate_check.py と同じ合成記事で作る。
+"""
+import random
+
+import pytest
+
+from agents.pipeline.near_duplicate import _MAGIC, _RECORD, NearDuplicateIndex
+from benchmarks.near_duplicate_check import article, cross_post, vocabulary
+
+ARTICLES = 20
+SENTENCES = 40
+EDIT_RATIO = 0.02
+
+
+def content_key(n: int) -> str:
+    return f"{n:064x}"
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return tmp_path / "near_duplicate.idx"
+
+
+@pytest.fixture
+def corpus(index_path):
+    """元記事を登録した索引と、同じ語彙の乱数・記事。"""
+    rng = random.Random(0)
+    index = NearDuplicateIndex(path=str(index_path), max_distance=12, min_chars=400)
+    words = vocabulary(rng)
+    originals = [article(rng, words, SENTENCES) for _ in range(ARTICLES)]
+    for n, body in enumerate(originals):
+        index.add(index.fingerprint("\n".join(body)), content_key(n))
+    return index, rng, words, originals
+
+
+def test_cross_post_is_found_as_its_original(corpus):
+    index, rng, words, originals = corpus
+    detected = 0
+    for n, body in enumerate(originals):
+        text = cross_post(rng, words, body, EDIT_RATIO, f"user{n}", f"{n:020x}")
+        found = index.find(index.fingerprint(text))
+        if found is not None:
+            # 見つかるなら元記事で、距離は max_distance 以内
+            assert found[0] == content_key(n)
+            assert found[1] <= index.max_distance
+            detected += 1
+    assert detected >= ARTICLES * 0.9
+
+
+def test_unrelated_article_is_not_a_near_duplicate(corpus):
+    index, rng, words, _ = corpus
+    for _ in range(ARTICLES):
+        assert index.find(index.fingerprint("\n".join(article(rng, words, SENTENCES)))) is None
+
+
+def test_identical_text_is_found_at_distance_zero(corpus):
+    index, _, _, originals = corpus
+    assert index.find(index.fingerprint("\n".join(originals[3]))) == (content_key(3), 0)
+
+
+def test_short_text_has_no_fingerprint(index_path):
+    index = NearDuplicateIndex(path=str(index_path), min_chars=400)
+    assert index.fingerprint("短い本文 https://example.com/") is None
+
+
+def test_index_is_reloaded_from_file(corpus, index_path):
+    index, _, _, originals = corpus
+    reloaded = NearDuplicateIndex(path=str(index_path), max_distance=12)
+    assert reloaded._fingerprints == index._fingerprints
+    assert reloaded.find(index.fingerprint("\n".join(originals[0]))) == (content_key(0), 0)
+
+
+def test_compact_keeps_newest_half_and_survives_reload(index_path):
+    rng = random.Random(1)
+    index = NearDuplicateIndex(path=str(index_path), max_distance=12, max_entries=4)
+    words = vocabulary(rng)
+    fingerprints = [index.fingerprint("\n".join(article(rng, words, SENTENCES))) for _ in range(6)]
+    for n, fingerprint in enumerate(fingerprints[:5]):
+        index.add(fingerprint, content_key(n))
+
+    # 5件目で上限を超え、新しい2件だけで書き直す
+    assert index._fingerprints == fingerprints[3:5]
+    assert index.path.stat().st_size == len(_MAGIC) + 2 * _RECORD.size
+    assert index.find(fingerprints[0]) is None
+    assert index.find(fingerprints[4]) == (content_key(4), 0)
+    assert not index.path.with_suffix(index.path.suffix + ".tmp").exists()
+
+    # 書き直したファイルにも追記でき、読み込み直しても同じ内容になる
+    index.add(fingerprints[5], content_key(5))
+    reloaded = NearDuplicateIndex(path=str(index_path), max_distance=12, max_entries=4)
+    assert reloaded._fingerprints == fingerprints[3:6]
+    assert reloaded.find(fingerprints[3]) == (content_key(3), 0)
+    assert reloaded.find(fingerprints[0]) is None
+
+
+def test_truncated_last_record_is_dropped_on_reload(corpus, index_path):
+    index, _, _, _ = corpus
+    with open(index_path, "ab") as f:
+        f.write(b"\x00" * (_RECORD.size // 2))
+    reloaded = NearDuplicateIndex(path=str(index_path))
+    assert reloaded._fingerprints == index._fingerprints
+
+
+def test_index_with_unknown_header_starts_empty(index_path):
+    index_path.write_bytes(b"NOTANIDX" + b"\x00" * _RECORD.size)
+    assert NearDuplicateIndex(path=str(index_path)).stats()["entries"] == 0
@@ -0,0 +1,104 @@
+"""URLの正規化（agents/pipeline/url_canonical.py）。"""
+import pytest
+
+from agents.pipeline.url_canonical import canonical_url, strip_slack_markup, url_key
+
+QIITA_ID = "0123456789abcdef0123"
+
+
+@pytest.fixture(autouse=True)
+def _defaults(monkeypatch):
+    monkeypatch.delenv("URL_CANONICALIZATION", raising=False)
+    monkeypatch.delenv("URL_STRIP_QUERY_DOMAINS", raising=False)
+
+
+@pytest.mark.parametrize("url, expected", [
+    # YouTube: 短縮リンク・埋め込み・モバイル用ホストは watch?v=<id> にする
+    ("https://youtu.be/dQw4w9WgXcQ", "https://youtube.com/watch?v=dQw4w9WgXcQ"),
+    ("https://youtu.be/dQw4w9WgXcQ?si=abc&t=42", "https://youtube.com/watch?v=dQw4w9WgXcQ"),
+    ("https://www.youtube.com/embed/dQw4w9WgXcQ", "https://youtube.com/watch?v=dQw4w9WgXcQ"),
+    ("https://m.youtube.com/watch?v=dQw4w9WgXcQ&feature=share", "https://youtube.com/watch?v=dQw4w9WgXcQ"),
+    ("https://www.youtube.com/embed/?list=PL123", "https://youtube.com/embed?list=PL123"),
+    # Zenn: 付属パスとクエリを除く
+    ("https://zenn.dev/user/articles/my-slug/embed", "https://zenn.dev/user/articles/my-slug"),
+    ("https://zenn.dev/user/articles/my-slug?redirected=1", "https://zenn.dev/user/articles/my-slug"),
+    # SpeakerDeck: oEmbed はデッキのURLに戻す
+    ("https://speakerdeck.com/oembed.json?url=https%3A%2F%2Fspeakerdeck.com%2Fuser%2Fdeck",
+     "https://speakerdeck.com/user/deck"),
+    ("https://speakerdeck.com/user/deck/embed", "https://speakerdeck.com/user/deck"),
+    # 計測パラメータを除き、残りのクエリは並べ替える
+    ("https://example.com/post?utm_source=slack&utm_medium=x&b=2&a=1&fbclid=zzz",
+     "https://example.com/post?a=1&b=2"),
+    ("https://example.com/post?gclid=1", "https://example.com/post"),
+    # スキーム・ホスト・末尾のスラッシュ・フラグメント
+    ("http://WWW.Example.com/a//b/#section", "https://example.com/a/b"),
+    ("https://ja.m.wikipedia.org/wiki/Python", "https://ja.wikipedia.org/wiki/Python"),
+    # 既定以外のポートは残し、既定のポートは除く
+    ("https://example.com:8443/post", "https://example.com:8443/post"),
+    ("http://example.com:8080/post/", "https://example.com:8080/post"),
+    ("https://example.com:443/post", "https://example.com/post"),
+    # http(s) 以外や Slack の表記
+    ("<https://example.com/post|記事>", "https://example.com/post"),
+    ("mailto:someone@example.com", "mailto:someone@example.com"),
+])
+def test_canonical_url(url, expected):
+    assert canonical_url(url) == expected
+
+
+@pytest.mark.parametrize("variants", [
+    [
+        f"https://qiita.com/items/{QIITA_ID}",
+        f"https://qiita.com/some_user/items/{QIITA_ID}",
+        f"http://m.qiita.com/some_user/items/{QIITA_ID}/?utm_source=twitter",
+    ],
+    [
+        "https://youtu.be/dQw4w9WgXcQ",
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PL1",
+        "https://www.youtube.com/embed/dQw4w9WgXcQ",
+    ],
+    [
+        "https://zenn.dev/user/articles/my-slug",
+        "https://zenn.dev/user/articles/my-slug/embed",
+        "http://zenn.dev/user/articles/my-slug/",
+    ],
+    [
+        "https://speakerdeck.com/user/deck",
+        "https://speakerdeck.com/oembed.json?url=https://speakerdeck.com/user/deck",
+    ],
+    [
+        "https://example.com/post?b=2&a=1",
+        "http://www.example.com/post/?a=1&b=2&utm_campaign=x#top",
+    ],
+])
+def test_url_key_matches_variants_of_same_page(variants):
+    keys = {url_key(url) for url in variants}
+    assert len(keys) == 1
+
+
+def test_url_key_has_no_scheme():
+    assert url_key(f"https://qiita.com/some_user/items/{QIITA_ID}") == f"qiita.com/items/{QIITA_ID}"
+    assert url_key("https://example.com:8443/post?b=2&a=1") == "example.com:8443/post?a=1&b=2"
+
+
+@pytest.mark.parametrize("a, b", [
+    ("https://example.com:8443/post", "https://example.com/post"),
+    ("https://example.com/post?page=2", "https://example.com/post?page=3"),
+    ("https://youtu.be/aaaaaaaaaaa", "https://youtu.be/bbbbbbbbbbb"),
+    (f"https://qiita.com/items/{QIITA_ID}", "https://qiita.com/items/ffffffffffffffffffff"),
+])
+def test_url_key_keeps_different_pages_apart(a, b):
+    assert url_key(a) != url_key(b)
+
+
+def test_strip_query_domains_env(monkeypatch):
+    monkeypatch.setenv("URL_STRIP_QUERY_DOMAINS", "example.org")
+    assert canonical_url("https://blog.example.org/post?id=1") == "https://blog.example.org/post"
+
+
+def test_canonicalization_can_be_disabled(monkeypatch):
+    monkeypatch.setenv("URL_CANONICALIZATION", "false")
+    assert canonical_url("<http://www.example.com/post/?utm_source=x|記事>") == "http://www.example.com/post/?utm_source=x"
+
+
+def test_strip_slack_markup_keeps_posted_url():
+    assert strip_slack_markup(" <http://www.example.com/post/|label> ") == "http://www.example.com/post/"
@@ -0,0 +1,135 @@
+"""WorkQueue（agents/pipeline/work_queue.py）のリース・再試行・dead の扱い。"""
+import pytest
+
+from agents.pipeline import work_queue
+from agents.pipeline.records import CollectedPost
+from agents.pipeline.work_queue import WorkQueue
+
+VISIBILITY_TIMEOUT = 100.0
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 10.0
+DEFER_DELAY = 5.0
+
+
+class FakeClock:
+    """work_queue の time.time() を置き換える時計（advance で進める）。"""
+
+    def __init__(self) -> None:
+        self.now = 1_700_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(work_queue, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch, clock):
+    monkeypatch.setenv("WORK_QUEUE_VISIBILITY_TIMEOUT_SECONDS", str(VISIBILITY_TIMEOUT))
+    monkeypatch.setenv("WORK_QUEUE_MAX_ATTEMPTS", str(MAX_ATTEMPTS))
+    monkeypatch.setenv("WORK_QUEUE_RETRY_DELAY_SECONDS", str(RETRY_DELAY))
+    monkeypatch.setenv("WORK_QUEUE_DEFER_DELAY_SECONDS", str(DEFER_DELAY))
+    q = WorkQueue(path=str(tmp_path / "work_queue.sqlite3"))
+    yield q
+    q.close()
+
+
+def make_post(n: int = 1) -> CollectedPost:
+    return CollectedPost(
+        slack_user_id="U0123", url=f"https://example.com/articles/{n}",
+        slack_channel="C0123", slack_message_id=f"1700000000.00000{n}",
+    )
+
+
+def test_enqueue_ignores_items_already_queued(queue):
+    assert queue.enqueue([make_post(1), make_post(2)]) == 2
+    assert queue.enqueue([make_post(1)]) == 0
+    assert queue.stats() == {"queued": 2}
+
+
+def test_expired_lease_is_delivered_again(queue, clock):
+    queue.enqueue([make_post()])
+    [first] = queue.lease(10)
+    assert first.attempts == 1
+    assert queue.lease(10) == []
+
+    clock.advance(VISIBILITY_TIMEOUT - 1)
+    assert queue.lease(10) == []
+
+    clock.advance(2)
+    [again] = queue.lease(10)
+    assert again.key == first.key
+    assert again.attempts == 2
+    assert again.lease_token != first.lease_token
+
+
+def test_failed_item_is_retried_with_backoff_then_dead(queue, clock):
+    queue.enqueue([make_post()])
+    for attempt in range(1, MAX_ATTEMPTS):
+        [item] = queue.lease(10)
+        assert item.attempts == attempt
+        assert queue.fail(item, "scrape failed") is False
+        delay = RETRY_DELAY * 2 ** (attempt - 1)
+        clock.advance(delay - 1)
+        assert queue.lease(10) == []
+        clock.advance(1)
+
+    [last] = queue.lease(10)
+    assert last.attempts == MAX_ATTEMPTS
+    assert queue.fail(last, "scrape failed") is True
+    clock.advance(VISIBILITY_TIMEOUT * 10)
+    assert queue.lease(10) == []
+    assert queue.stats() == {"dead": 1}
+
+
+def test_item_whose_lease_keeps_expiring_becomes_dead(queue, clock):
+    queue.enqueue([make_post()])
+    for _ in range(MAX_ATTEMPTS):
+        assert len(queue.lease(10)) == 1
+        clock.advance(VISIBILITY_TIMEOUT + 1)
+    assert queue.lease(10) == []
+    assert queue.stats() == {"dead": 1}
+
+
+def test_release_does_not_count_an_attempt(queue, clock):
+    queue.enqueue([make_post()])
+    [item] = queue.lease(10)
+    queue.release(item, "endpoint unavailable")
+    assert queue.stats() == {"queued": 1}
+
+    clock.advance(DEFER_DELAY - 1)
+    assert queue.lease(10) == []
+    clock.advance(1)
+    [again] = queue.lease(10)
+    assert again.attempts == 1
+
+    # 後回しを何度繰り返しても dead にはならない
+    for _ in range(MAX_ATTEMPTS * 2):
+        queue.release(again)
+        clock.advance(DEFER_DELAY)
+        [again] = queue.lease(10)
+    assert again.attempts == 1
+
+
+def test_ack_with_stale_lease_token_is_ignored(queue, clock):
+    queue.enqueue([make_post()])
+    [stale] = queue.lease(10)
+    clock.advance(VISIBILITY_TIMEOUT + 1)
+    [current] = queue.lease(10)
+
+    # リースが切れたあとに前のワーカーが ack しても、今のリースは残る
+    queue.ack([stale])
+    assert queue.stats() == {"leased": 1}
+    assert queue.fail(stale, "late failure") is False
+    assert queue.stats() == {"leased": 1}
+
+    queue.ack([current])
+    assert queue.stats() == {"done": 1}
@@ -11,6 +11,7 @@ import os
 from datetime import datetime
 from typing import Dict, Any, Optional
 import logging
+import time
 from dotenv import load_dotenv
 
 # 環境変数をロード（オプション：AGENT_RUNTIME_ARNなど）
@@ -33,10 +34,16 @@ if "messages" not in st.session_state:
 if "session_id" not in st.session_state:
     import uuid
     st.session_state.session_id = str(uuid.uuid4())
+if "include_timings" not in st.session_state:
+    st.session_state.include_timings = False
+
+# 読み取りタイムアウト（秒）。Runtime にはこれより少し前を締め切りとして渡す
+READ_TIMEOUT_SECONDS = 600
+DEADLINE_MARGIN_SECONDS = 20
 
 # タイムアウト設定を含むboto3設定
 boto_config = Config(
-    read_timeout=600,  # 読み取りタイムアウトを10分に設定
+    read_timeout=READ_TIMEOUT_SECONDS,  # 読み取りタイムアウトを10分に設定
     connect_timeout=120,  # 接続タイムアウトを2分に設定
     retries={
         'max_attempts': 3,
@@ -111,6 +118,8 @@ def process_agent_response(agent_response):
             logger.debug("直接JSONパースに失敗、ストリーミング形式を試行")
         
         # 戦略2: 改行区切りのストリーミングレスポンスを処理
+        # stream_nodes 指定時は各ノードの出力（node_result）が先に届くので、最終レスポンスの agents に戻す
+        streamed_agents = {}
         try:
             for line in response_str.split("\n"):
                 line = line.strip()
@@ -124,6 +133,18 @@ def process_agent_response(agent_response):
                 # JSONとしてパース
                 try:
                     data = json.loads(line)
+
+                    # エントリーポイントが yield した JSON 文字列は二重にエンコードされている
+                    if isinstance(data, str) and data.startswith("{"):
+                        try:
+                            data = json.loads(data)
+                        except json.JSONDecodeError:
+                            pass
+
+                    if isinstance(data, dict) and data.get("type") == "node_result":
+                        agent = data.get("agent") or {}
+                        streamed_agents[agent.get("name")] = agent
+                        continue
                     
                     # エラーレスポンスの処理
                     if isinstance(data, dict) and "error" in data:
@@ -135,6 +156,9 @@ def process_agent_response(agent_response):
                     # 構造化レスポンスの処理
                     if isinstance(data, dict) and "agents" in data:
                         logger.info("ストリーミング形式から構造化レスポンスを検出")
+                        for agent in data["agents"]:
+                            if agent.get("streamed"):
+                                agent["messages"] = streamed_agents.get(agent.get("name"), {}).get("messages", [])
                         return {
                             "type": "structured",
                             "data": data
@@ -171,8 +195,10 @@ def format_structured_response(data: Dict[str, Any]) -> str:
     lines = []
     
     # ステータス情報をコンパクトに表示
-    status_icon = "✅" if data.get("status") == "completed" else "❌"
-    status_text = "処理完了" if data.get("status") == "completed" else "処理失敗"
+    status_icon, status_text = {
+        "completed": ("✅", "処理完了"),
+        "partial": ("⚠️", "一部完了（締め切り・予算の上限までに終わらなかった項目は後回しにしました）"),
+    }.get(data.get("status"), ("❌", "処理失敗"))
     lines.append(f"### {status_icon} {status_text}")
     
     # 実行統計をインラインで表示
@@ -257,6 +283,12 @@ def format_structured_response(data: Dict[str, Any]) -> str:
             if line.strip():
                 lines.append(line)
     
+    # 後回しにした項目（次回の実行で処理される）
+    if data.get("deferred_items"):
+        lines.append(f"\n##### ⏭️ 後回しにした項目（{len(data['deferred_items'])}件）")
+        for item in data["deferred_items"]:
+            lines.append(f"- {item.get('url')}（{item.get('error') or '未処理'}）")
+
     # メタデータがある場合は最後に追加
     if data.get("metadata"):
         metadata = data["metadata"]
@@ -271,6 +303,18 @@ def format_structured_response(data: Dict[str, Any]) -> str:
             if metadata.get("failed_nodes", 0) > 0:
                 details.append(f"失敗: {metadata['failed_nodes']}")
             lines.append(f"*{' | '.join(details)}*")
+
+        # フェーズ別レイテンシ（include_timings 指定時のみ含まれる）
+        timings = metadata.get("timings")
+        if timings and timings.get("phases"):
+            lines.append("\n##### ⏱️ フェーズ別レイテンシ")
+            lines.append("| フェーズ | 開始(ms) | 所要(ms) |")
+            lines.append("|---|---:|---:|")
+            for span in timings["phases"]:
+                lines.append(f"| {span['name']} | {span['start_ms']} | {span['duration_ms']} |")
+            if timings.get("tool_calls"):
+                tool_total = sum(c["duration_ms"] for c in timings["tool_calls"])
+                lines.append(f"*MCPツール呼び出し: {len(timings['tool_calls'])}回 / 合計 {tool_total:.0f}ms*")
     
     return "\n".join(lines)
 
@@ -339,6 +383,15 @@ def render_sidebar():
             st.error("❌ AWS接続: 失敗")
             st.info("AWS認証情報を確認してください")
         
+        # 計測オプション
+        st.divider()
+        st.subheader("⏱️ 計測")
+        st.session_state.include_timings = st.checkbox(
+            "フェーズ別レイテンシを表示",
+            value=st.session_state.include_timings,
+            help="トークン取得・MCP接続・Graph実行などの所要時間をレスポンスに含めます"
+        )
+
         # セッション情報
         st.divider()
         st.subheader("📝 セッション情報")
@@ -404,7 +457,14 @@ def render_chat_interface():
                 payload = json.dumps({
                     "input": {
                         "prompt": prompt,
-                        "session_id": st.session_state.session_id
+                        "session_id": st.session_state.session_id,
+                        "include_timings": st.session_state.include_timings,
+                        # ノードの出力を終わった順に受け取る（サーバー側で結果を抱え込まない）
+                        "stream_nodes": True,
+                        # チャットの質問はバックフィル等の batch より先に同時実行枠を割り当ててもらう
+                        "priority": "interactive",
+                        # 読み取りタイムアウトより前に、終わった分だけでも返してもらう
+                        "deadline_ms": int((time.time() + READ_TIMEOUT_SECONDS - DEADLINE_MARGIN_SECONDS) * 1000),
                     }
                 }).encode()
                 
@@ -68,7 +68,9 @@ CREATE TABLE output_history.activities (
     event_name VARCHAR(255),
     participant_count INTEGER,
     like_count INTEGER,
-    url TEXT NOT NULL,  -- slack_agent_factory.pyの"url"フィールドに対応
+    url TEXT NOT NULL,  -- slack_agent_factory.pyの"url"フィールドに対応（投稿されたままのURL。Slack のマークアップのみ除去）
+    url_key TEXT,  -- 重複判定用の正規化キー（agents/pipeline/url_canonical.py の url_key。照合はこちらで行う）
+    duplicate_of TEXT,  -- 本文がほぼ同じ元ページのURL（近似重複として分析結果を再利用した場合）
     aws_services TEXT,  -- JSONとしてAWSサービスリストを格納
     aws_level VARCHAR(10) CHECK (aws_level IN ('100', '200', '300', '400')),
     tags TEXT,  -- JSONとして技術タグを格納
@@ -123,6 +125,7 @@ CREATE TABLE output_history.processing_history (
     process_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,  -- dsql_client.pyの定義に対応
     last_processed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     last_slack_timestamp TIMESTAMP WITH TIME ZONE,
+    slack_channel VARCHAR(50),  -- slack_fetch のチャンネル（チャンネルごとのウォーターマーク）
     status VARCHAR(20) NOT NULL CHECK (status IN ('success', 'failed', 'in_progress')),
     details TEXT DEFAULT '{}',  -- JSONとして処理詳細を格納
     error_message TEXT,
@@ -132,6 +135,32 @@ CREATE TABLE output_history.processing_history (
 -- agent_graphロールへの権限付与（SELECT, INSERT, UPDATE のみ）
 GRANT SELECT, INSERT, UPDATE ON output_history.processing_history TO agent_graph;
 
+-- --------------------------------------------------------------------------------
+-- 2.5 processing_items (URL単位の処理台帳) テーブル
+-- --------------------------------------------------------------------------------
+-- パイプライン（agents/pipeline/ledger.py）が1件（チャンネル・メッセージ・URL）ごとに
+-- 到達したステージと成果物を記録し、再実行時は未完了の項目だけを処理する
+CREATE TABLE output_history.processing_items (
+    item_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    slack_channel VARCHAR(50) NOT NULL DEFAULT '',
+    slack_message_id VARCHAR(100) NOT NULL DEFAULT '',
+    url TEXT NOT NULL,
+    stage VARCHAR(20) NOT NULL CHECK (stage IN ('collected', 'scraped', 'analyzed', 'stored')),
+    status VARCHAR(20) NOT NULL CHECK (status IN ('in_progress', 'success', 'failed', 'deferred')),
+    post TEXT NOT NULL,  -- JSONとして収集レコード（CollectedPost）を格納（再開用）
+    content_key VARCHAR(64),  -- スクレイプ本文のハッシュ（分析キャッシュのキー）
+    analysis TEXT,  -- JSONとして分析結果を格納（再開時は分析を省略）
+    attempts INTEGER DEFAULT 0,  -- 失敗した回数
+    error_message TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT unique_processing_item UNIQUE (slack_channel, slack_message_id, url)
+);
+
+-- agent_graphロールへの権限付与（SELECT, INSERT, UPDATE のみ）
+GRANT SELECT, INSERT, UPDATE ON output_history.processing_items TO agent_graph;
+
 -- ================================================================================
 -- 3. インデックス作成（非同期）
 -- ================================================================================
@@ -142,6 +171,7 @@ CREATE INDEX ASYNC idx_activities_activity_date ON output_history.activities(act
 CREATE INDEX ASYNC idx_activities_activity_type ON output_history.activities(activity_type);
 CREATE INDEX ASYNC idx_activities_date_type ON output_history.activities(activity_date, activity_type);
 CREATE INDEX ASYNC idx_activities_aws_level ON output_history.activities(aws_level);
+CREATE INDEX ASYNC idx_activities_url_key ON output_history.activities(url_key);
 
 -- monthly_reports テーブルのインデックス
 CREATE INDEX ASYNC idx_monthly_reports_slack_user_id ON output_history.monthly_reports(slack_user_id);
@@ -151,6 +181,11 @@ CREATE INDEX ASYNC idx_monthly_reports_year_month ON output_history.monthly_repo
 CREATE INDEX ASYNC idx_processing_history_process_type ON output_history.processing_history(process_type);
 CREATE INDEX ASYNC idx_processing_history_status ON output_history.processing_history(status);
 CREATE INDEX ASYNC idx_processing_history_process_date ON output_history.processing_history(process_date);  -- DESCを削除
+CREATE INDEX ASYNC idx_processing_history_channel ON output_history.processing_history(process_type, slack_channel);
+
+-- processing_items テーブルのインデックス
+CREATE INDEX ASYNC idx_processing_items_message ON output_history.processing_items(slack_message_id);
+CREATE INDEX ASYNC idx_processing_items_status ON output_history.processing_items(status, updated_at);
 
 -- ================================================================================
 -- 4. 権限の最終確認
@@ -168,7 +203,7 @@ CREATE INDEX ASYNC idx_processing_history_process_date ON output_history.process
 -- このSQLスクリプトにより、以下が作成されます：
 -- 1. output_historyスキーマ
 -- 2. agent_graphロール（SELECT, INSERT, UPDATE権限のみ）
--- 3. 4つのテーブル（members, activities, monthly_reports, processing_history）
+-- 3. 5つのテーブル（members, activities, monthly_reports, processing_history, processing_items）
 -- 4. パフォーマンス最適化のための非同期インデックス
 --
 -- 注意事項:
@@ -16,8 +16,12 @@ DROP INDEX IF EXISTS output_history.idx_monthly_reports_year_month;
 DROP INDEX IF EXISTS output_history.idx_processing_history_process_type;
 DROP INDEX IF EXISTS output_history.idx_processing_history_status;
 DROP INDEX IF EXISTS output_history.idx_processing_history_process_date;
+DROP INDEX IF EXISTS output_history.idx_processing_history_channel;
+DROP INDEX IF EXISTS output_history.idx_processing_items_message;
+DROP INDEX IF EXISTS output_history.idx_processing_items_status;
 
 -- テーブルの削除（外部キー制約の依存関係順）
+DROP TABLE IF EXISTS output_history.processing_items CASCADE;
 DROP TABLE IF EXISTS output_history.processing_history CASCADE;
 DROP TABLE IF EXISTS output_history.monthly_reports CASCADE;
 DROP TABLE IF EXISTS output_history.activities CASCADE;
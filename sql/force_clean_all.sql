@@ -4,6 +4,7 @@
 -- =================================================
 
 -- 1. output_historyスキーマのすべてのテーブルを削除（存在する場合）
+DROP TABLE IF EXISTS output_history.processing_items CASCADE;
 DROP TABLE IF EXISTS output_history.processing_history CASCADE;
 DROP TABLE IF EXISTS output_history.monthly_reports CASCADE;
 DROP TABLE IF EXISTS output_history.activities CASCADE;